@@ -0,0 +1,251 @@
+import os
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.test import Client, RequestFactory
+from django.utils import timezone
+
+from wagtail.images.models import Image
+from wagtail.models import Site
+from wagtailmedia.models import Media
+
+from tests.models import BlogPage, StoryPage
+from tests.utils import get_test_image_buffer, get_test_image_file
+from wagtail_webstories.markup import expand_entities
+from wagtail_webstories.models import ExternalStory
+
+BENCHMARKS = []
+
+
+def register(benchmark_class):
+    BENCHMARKS.append(benchmark_class)
+    return benchmark_class
+
+
+class Benchmark:
+    """
+    A single benchmark. setup and teardown are called once; before_each is called before each
+    (timed) call to run.
+    """
+    name = None
+    params = {}
+
+    def setup(self):
+        pass
+
+    def before_each(self):
+        pass
+
+    def run(self):
+        raise NotImplementedError
+
+    def teardown(self):
+        pass
+
+
+def create_images(count, prefix):
+    # use a distinct colour for each image so that their file hashes differ
+    return [
+        Image.objects.create(
+            title="%s %d" % (prefix, i),
+            file=get_test_image_file(
+                filename='%s-%d.png' % (prefix, i), colour=(i % 256, i // 256, 128), size=(64, 64)
+            ),
+        )
+        for i in range(count)
+    ]
+
+
+def create_story_page(slug, pages_html, image):
+    story_page = StoryPage(
+        title="Benchmark story %s" % slug,
+        slug=slug,
+        publisher="Torchbox",
+        publisher_logo=image,
+        poster_image=image,
+    )
+    story_page.pages = [
+        ('page', {'id': 'page-%d' % i, 'html': html})
+        for i, html in enumerate(pages_html)
+    ]
+    Site.objects.get().root_page.add_child(instance=story_page)
+    return story_page
+
+
+def story_page_html(index, image_ids):
+    return '<amp-story-page id="page-%d"><amp-story-grid-layer template="vertical">%s</amp-story-grid-layer></amp-story-page>' % (
+        index,
+        ''.join(
+            '<amp-img data-wagtail-image-id="%d" width="640" height="480" alt="Image %d"></amp-img>' % (image_id, image_id)
+            for image_id in image_ids
+        ),
+    )
+
+
+@register
+class ServeStoryPage(Benchmark):
+    name = 'serve_story_page'
+    params = {'pages': 20, 'images_per_page': 5}
+
+    def setup(self):
+        images = create_images(self.params['pages'] * self.params['images_per_page'], 'serve')
+        per_page = self.params['images_per_page']
+        self.story_page = create_story_page('serve-benchmark', [
+            story_page_html(i, [image.id for image in images[i * per_page:(i + 1) * per_page]])
+            for i in range(self.params['pages'])
+        ], images[0])
+        self.client = Client()
+        # generate renditions up front
+        self.run()
+
+    def run(self):
+        response = self.client.get(self.story_page.url)
+        assert response.status_code == 200
+
+
+@register
+class ExpandEntities(Benchmark):
+    name = 'expand_entities'
+    params = {'images': 50, 'media': 10, 'iterations': 20}
+
+    def setup(self):
+        image_ids = [image.id for image in create_images(self.params['images'], 'expand')]
+        media_ids = [
+            Media.objects.create(
+                title="Video %d" % i, file=get_test_image_file(filename='video-%d.mp4' % i), duration=0
+            ).id
+            for i in range(self.params['media'])
+        ]
+        self.html = story_page_html(0, image_ids) + ''.join(
+            '<amp-video><source data-wagtail-media-id="%d" type="video/mp4"></amp-video>' % media_id
+            for media_id in media_ids
+        )
+        # generate renditions up front
+        expand_entities(self.html)
+
+    def run(self):
+        for i in range(self.params['iterations']):
+            expand_entities(self.html)
+
+
+class StoryPageMetadataBenchmark(Benchmark):
+    params = {'pages': 20}
+
+    def setup(self):
+        image, = create_images(1, self.name)
+        story_page = create_story_page(
+            self.name.replace('_', '-'),
+            [story_page_html(i, []) for i in range(self.params['pages'])],
+            image,
+        )
+        self.story_page_id = story_page.id
+        self.request = RequestFactory().get('/')
+
+    def get_story_page(self):
+        # fetch a fresh instance each time, so that we don't benefit from cached renditions
+        return StoryPage.objects.get(id=self.story_page_id)
+
+
+@register
+class LinkedData(StoryPageMetadataBenchmark):
+    name = 'linked_data'
+
+    def run(self):
+        self.get_story_page().linked_data
+
+
+@register
+class GetContext(StoryPageMetadataBenchmark):
+    name = 'get_context'
+
+    def run(self):
+        self.get_story_page().get_context(self.request)
+
+
+@register
+class ExternalStoryStreamField(Benchmark):
+    name = 'external_story_streamfield'
+    params = {'blocks': 50}
+
+    def setup(self):
+        urls = ['https://example.com/stories/%d.html' % i for i in range(self.params['blocks'])]
+        for url in urls:
+            ExternalStory.objects.create(
+                url=url,
+                url_hash=ExternalStory.get_url_hash(url),
+                title="Story %s" % url,
+                publisher="Torchbox",
+                last_fetched_at=timezone.now() + timedelta(days=365),
+            )
+
+        blog_page = BlogPage(title="External story benchmark", slug='external-story-benchmark')
+        blog_page.body = [('external_story_link', url) for url in urls]
+        Site.objects.get().root_page.add_child(instance=blog_page)
+        self.blog_page_id = blog_page.id
+
+    def run(self):
+        blog_page = BlogPage.objects.get(id=self.blog_page_id)
+        for block in blog_page.body:
+            block.value.title
+
+
+class StubAssetHandler(BaseHTTPRequestHandler):
+    assets = {}
+
+    def do_GET(self):
+        body = self.assets.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/png')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@register
+class ImportImages(Benchmark):
+    name = 'import_images'
+    params = {'pages': 10, 'images_per_page': 4}
+
+    def setup(self):
+        image_count = self.params['pages'] * self.params['images_per_page']
+        StubAssetHandler.assets = {
+            '/image-%d.png' % i: get_test_image_buffer(colour=(i, 64, 192), size=(320, 240)).getvalue()
+            for i in range(image_count)
+        }
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubAssetHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        # don't send requests to the stub server through any configured proxy
+        os.environ['NO_PROXY'] = '127.0.0.1'
+
+    def before_each(self):
+        # delete the images from the previous run, so that each run imports them afresh
+        for image in Image.objects.filter(title__startswith="Imported image "):
+            image.delete()
+
+        per_page = self.params['images_per_page']
+        self.story_page = StoryPage(title="Import benchmark", publisher="Torchbox", original_url=self.base_url + '/')
+        self.story_page.pages = [
+            ('page', {
+                'id': 'page-%d' % i,
+                'html': '<amp-story-page id="page-%d">%s</amp-story-page>' % (i, ''.join(
+                    '<amp-img src="/image-%d.png" width="320" height="240" alt="Imported image %d"></amp-img>' % (j, j)
+                    for j in range(i * per_page, (i + 1) * per_page)
+                )),
+            })
+            for i in range(self.params['pages'])
+        ]
+
+    def run(self):
+        assert self.story_page.import_images()
+
+    def teardown(self):
+        self.server.shutdown()
+        self.server.server_close()
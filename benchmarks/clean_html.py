@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Compare serial and parallel HTML cleaning of imported stories over a range of story sizes, to find
+the point where parallel cleaning with WAGTAIL_WEBSTORIES_CLEAN_WORKERS starts to pay off.
+
+Run from the repository root:
+
+    python benchmarks/clean_html.py --workers 4
+
+The crossover depends on the number of CPU cores and the size of each page, so run this on
+hardware representative of your servers, and set WAGTAIL_WEBSTORIES_PARALLEL_CLEAN_MIN_PAGES
+(the page count below which the serial path is always used) accordingly.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.test import override_settings  # noqa: E402
+
+from webstories import Story  # noqa: E402
+
+from wagtail_webstories import importing  # noqa: E402
+
+PAGE_HTML = """
+    <amp-story-page id="page-%(index)d">
+        <amp-story-grid-layer template="fill">
+            <amp-img src="https://example.com/images/%(index)d.jpg" width="720" height="1280" layout="responsive" alt="Page %(index)d"></amp-img>
+        </amp-story-grid-layer>
+        <amp-story-grid-layer template="vertical">
+            %(paragraphs)s
+            <script>alert("not allowed")</script>
+            <div onclick="alert('not allowed either')" class="caption">Caption for page %(index)d</div>
+        </amp-story-grid-layer>
+    </amp-story-page>
+"""
+
+
+def make_story(page_count, paragraphs_per_page):
+    paragraphs = '\n'.join(
+        '<p class="text" style="color: red">Paragraph %d with <b>bold</b> and <a href="#">a link</a></p>' % i
+        for i in range(paragraphs_per_page)
+    )
+    pages = ''.join(
+        PAGE_HTML % {'index': index, 'paragraphs': paragraphs}
+        for index in range(page_count)
+    )
+    return Story(
+        '<!DOCTYPE html><html amp><head><title>Benchmark</title></head><body>'
+        '<amp-story standalone title="Benchmark" publisher="Benchmark">%s</amp-story>'
+        '</body></html>' % pages
+    )
+
+
+def time_cleaning(story, workers, repeat):
+    # bypass the page count threshold, so that we measure the parallel path for all sizes
+    with override_settings(
+        WAGTAIL_WEBSTORIES_CLEAN_WORKERS=workers, WAGTAIL_WEBSTORIES_PARALLEL_CLEAN_MIN_PAGES=0
+    ):
+        timings = []
+        for i in range(repeat):
+            start_time = time.perf_counter()
+            importing.clean_story_pages(story)
+            timings.append(time.perf_counter() - start_time)
+        return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--paragraphs', type=int, default=20, help="Paragraphs per story page")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    options = parser.parse_args()
+
+    # start the pool up front, so that process start-up is not counted against the first run
+    time_cleaning(make_story(options.workers, 1), options.workers, 1)
+
+    print("%6s %12s %12s %8s" % ("pages", "serial (s)", "parallel (s)", "speedup"))
+    crossover = None
+    for page_count in options.pages:
+        story = make_story(page_count, options.paragraphs)
+        serial_time = time_cleaning(story, 1, options.repeat)
+        parallel_time = time_cleaning(story, options.workers, options.repeat)
+        speedup = serial_time / parallel_time
+        if crossover is None and speedup > 1:
+            crossover = page_count
+        print("%6d %12.4f %12.4f %7.2fx" % (page_count, serial_time, parallel_time, speedup))
+
+    if crossover is None:
+        print("Parallel cleaning with %d workers was not faster at any size tested" % options.workers)
+    else:
+        print("Parallel cleaning with %d workers is faster from %d pages" % (options.workers, crossover))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Run the wagtail-webstories benchmark suite against a fresh test database, using the settings and
+models from the `tests` app.
+
+Run from the repository root:
+
+    python benchmarks/run.py                          # run all benchmarks
+    python benchmarks/run.py serve_story expand       # run benchmarks whose names contain these strings
+    python benchmarks/run.py --output results.json    # save results for later comparison
+    python benchmarks/run.py --compare results.json   # compare against previously saved results
+
+For each benchmark, this reports the best and median wall time over the repeated runs, along with
+the number of database queries and the peak Python memory allocation (measured with tracemalloc)
+from an additional run.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+
+from benchmarks.cases import BENCHMARKS  # noqa: E402
+from tests.utils import TEST_MEDIA_DIR  # noqa: E402
+
+
+def measure(benchmark, repeat):
+    benchmark.setup()
+    try:
+        timings = []
+        for i in range(repeat):
+            benchmark.before_each()
+            start_time = time.perf_counter()
+            benchmark.run()
+            timings.append(time.perf_counter() - start_time)
+
+        # count queries and memory on a separate run, so that the overhead of tracing them
+        # does not affect the timings
+        benchmark.before_each()
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as queries:
+            benchmark.run()
+        current_memory, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        benchmark.teardown()
+
+    return {
+        'params': benchmark.params,
+        'wall_time': {
+            'min': min(timings),
+            'median': statistics.median(timings),
+            'repeat': repeat,
+        },
+        'queries': len(queries),
+        'peak_memory_bytes': peak_memory,
+    }
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT_DIR, stderr=subprocess.DEVNULL
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_change(new, old):
+    if not old:
+        return ''
+    return '%+.0f%%' % ((new - old) / old * 100)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('names', nargs='*', help="Only run benchmarks whose names contain one of these strings")
+    parser.add_argument('--repeat', type=int, default=5, help="Number of timed runs of each benchmark (default: 5)")
+    parser.add_argument('--output', help="Path to write the results to, as JSON")
+    parser.add_argument('--compare', help="Path of a JSON results file to compare against")
+    options = parser.parse_args()
+
+    benchmarks = [
+        benchmark_class() for benchmark_class in BENCHMARKS
+        if not options.names or any(name in benchmark_class.name for name in options.names)
+    ]
+    baseline = {}
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)['results']
+
+    setup_test_environment()
+    old_database_name = connection.creation.create_test_db(verbosity=0)
+    results = {}
+    try:
+        print("%-40s %10s %10s %8s %12s %8s" % ("benchmark", "min (ms)", "median", "queries", "peak mem (KB)", "change"))
+        for benchmark in benchmarks:
+            result = results[benchmark.name] = measure(benchmark, options.repeat)
+            old_result = baseline.get(benchmark.name)
+            print("%-40s %10.2f %10.2f %8d %12d %8s" % (
+                benchmark.name,
+                result['wall_time']['min'] * 1000,
+                result['wall_time']['median'] * 1000,
+                result['queries'],
+                result['peak_memory_bytes'] / 1024,
+                format_change(result['wall_time']['min'], old_result['wall_time']['min']) if old_result else '',
+            ))
+    finally:
+        connection.creation.destroy_test_db(old_database_name, verbosity=0)
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump({
+                'meta': {
+                    'git_commit': get_git_commit(),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'database': connection.vendor,
+                    'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                },
+                'results': results,
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
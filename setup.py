@@ -42,7 +42,10 @@ setup(
         "wagtail>=5.2",
         "webstories>=0.0.1,<1",
         "requests>=2.24.0,<3",
+        # Retry(allowed_methods=...) requires urllib3 1.26
+        "urllib3>=1.26,<3",
         "beautifulsoup4>=4.6,<5",
+        "defusedxml>=0.7,<1",
     ],
     extras_require={
         "testing": [
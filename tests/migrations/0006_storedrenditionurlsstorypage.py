@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:57
+
+import django.db.models.deletion
+import wagtail.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0005_external_story_blocks'),
+        ('wagtailcore', '0094_alter_page_locale'),
+        ('wagtailimages', '0027_image_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredRenditionURLsStoryPage',
+            fields=[
+                ('page_ptr', models.OneToOneField(auto_created=True, on_delete=django.db.models.deletion.CASCADE, parent_link=True, primary_key=True, serialize=False, to='wagtailcore.page')),
+                ('publisher', models.CharField(max_length=2047)),
+                ('publisher_logo_src_original', models.URLField(blank=True, editable=False, max_length=2047, verbose_name='Publisher logo URL')),
+                ('poster_portrait_src_original', models.URLField(blank=True, editable=False, max_length=2047, verbose_name='Poster portrait image URL')),
+                ('poster_square_src_original', models.URLField(blank=True, editable=False, max_length=2047, verbose_name='Poster square image URL')),
+                ('poster_landscape_src_original', models.URLField(blank=True, editable=False, max_length=2047, verbose_name='Poster landscape image URL')),
+                ('original_url', models.URLField(blank=True, max_length=2047, verbose_name='Original URL')),
+                ('custom_css', models.TextField(blank=True)),
+                ('pages', wagtail.fields.StreamField([('page', 2)], block_lookup={0: ('wagtail.blocks.CharBlock', (), {}), 1: ('wagtail_webstories.blocks.AMPCleanHTMLBlock', (), {}), 2: ('wagtail.blocks.StructBlock', [[('id', 0), ('html', 1)]], {})})),
+                ('rendition_urls', models.JSONField(blank=True, default=dict, editable=False)),
+                ('poster_image', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='wagtailimages.image')),
+                ('publisher_logo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='wagtailimages.image')),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=('wagtailcore.page', models.Model),
+        ),
+    ]
@@ -9,13 +9,17 @@ from wagtail_webstories.blocks import (
     StoryChooserBlock,
     StoryEmbedBlock,
 )
-from wagtail_webstories.models import BaseWebStoryPage
+from wagtail_webstories.models import BaseWebStoryPage, StoredRenditionURLsMixin
 
 
 class StoryPage(BaseWebStoryPage):
     pass
 
 
+class StoredRenditionURLsStoryPage(StoredRenditionURLsMixin, BaseWebStoryPage):
+    pass
+
+
 class BlogPage(Page):
     body = StreamField([
         ('heading', blocks.CharBlock()),
@@ -138,3 +138,6 @@ WAGTAIL_SITE_NAME = "wagtail-transfer"
 WAGTAILADMIN_BASE_URL = 'http://example.com'
 
 WAGTAIL_WEBSTORIES_IMPORT_MODEL = 'tests.StoryPage'
+
+# Fetch external stories within the test thread rather than on a background thread
+WAGTAIL_WEBSTORIES_EXTERNAL_STORY_FETCHER = 'wagtail_webstories.tasks.fetch_immediately'
@@ -0,0 +1,231 @@
+import asyncio
+import shutil
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from requests.exceptions import HTTPError, RequestException
+from requests.structures import CaseInsensitiveDict
+
+from wagtail.images.models import Image
+from wagtail.models import Site
+
+from tests.models import StoryPage
+from tests.tests.test_instrumentation import recorded_metrics
+from tests.utils import get_test_image_buffer, get_test_image_file, StubServer, TEST_MEDIA_DIR
+from wagtail_webstories.asyncfetch import AsyncFetcher, RequestsTransport, aget_for_url, fetch_many
+from wagtail_webstories.downloads import AssetTooLarge
+from wagtail_webstories.models import ExternalStory, ExternalStoryFetchFailure, FetchFailedRecently
+
+STORY = """<!doctype html>
+<html ⚡>
+    <body>
+        <amp-story standalone title="%s" publisher="Torchbox" publisher-logo-src="/torchbox.png">
+            <amp-story-page id="cover"></amp-story-page>
+        </amp-story>
+    </body>
+</html>"""
+
+
+class StubTransportResponse:
+    def __init__(self, url, status_code, headers, body):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.encoding = 'utf-8'
+        self.body = body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError("%d error for %s" % (self.status_code, self.url), response=self)
+
+    async def _iter_chunks(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+    def iter_content(self, chunk_size):
+        return self._iter_chunks(chunk_size)
+
+    async def close(self):
+        pass
+
+
+class StubTransport:
+    """
+    In-process transport serving canned responses, which records the requests made and the largest
+    number of requests in flight at once
+    """
+    def __init__(self, responses, delay=0.01):
+        self.responses = responses
+        self.delay = delay
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def get(self, url, headers=None, timeout=None):
+        self.requests.append((url, headers or {}))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        status_code, headers, body = self.responses.get(url, (404, {}, b''))
+        return StubTransportResponse(url, status_code, headers, body)
+
+    async def aclose(self):
+        pass
+
+
+def story_response(title, **headers):
+    return (200, {'Content-Type': 'text/html', **headers}, (STORY % title).encode('utf-8'))
+
+
+class TestAsyncFetcher(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_aget_for_url(self):
+        transport = StubTransport({'https://example.com/story.html': story_response("Wagtail spotting")})
+        story = async_to_sync(aget_for_url)('https://example.com/story.html', transport=transport)
+        self.assertEqual(story.title, "Wagtail spotting")
+        self.assertEqual(story.publisher_logo_src, 'https://example.com/torchbox.png')
+
+        # a second lookup is served from the database
+        self.assertEqual(
+            async_to_sync(aget_for_url)('https://example.com/story.html', transport=transport), story
+        )
+        self.assertEqual(len(transport.requests), 1)
+
+    def test_fetch_many_bounded_concurrency(self):
+        urls = ['https://example-%d.com/story.html' % i for i in range(10)]
+        transport = StubTransport({url: story_response("Story %d" % i) for i, url in enumerate(urls)})
+
+        results = fetch_many(urls, transport=transport, concurrency=3)
+        self.assertEqual([results[url].title for url in urls], ["Story %d" % i for i in range(10)])
+        self.assertEqual(ExternalStory.objects.count(), 10)
+        self.assertEqual(transport.max_in_flight, 3)
+
+    def test_fetch_many_per_host_limit(self):
+        urls = ['https://example.com/story-%d.html' % i for i in range(6)]
+        transport = StubTransport({url: story_response("Story %d" % i) for i, url in enumerate(urls)})
+
+        fetch_many(urls, transport=transport, concurrency=10, per_host=2)
+        self.assertEqual(transport.max_in_flight, 2)
+
+    def test_fetch_many_refreshes_and_records_failures(self):
+        transport = StubTransport({
+            'https://example.com/story.html': story_response("Wagtail spotting", ETag='"v1"'),
+        })
+        fetch_many(['https://example.com/story.html'], transport=transport)
+        ExternalStory.objects.update(last_fetched_at=timezone.now() - timedelta(days=1))
+
+        # existing stories are refreshed with a conditional request
+        transport.responses['https://example.com/story.html'] = (304, {}, b'')
+        with self.assertLogs('wagtail_webstories.tasks', level='WARNING'):
+            results = fetch_many(
+                ['https://example.com/story.html', 'https://example.com/missing.html'], transport=transport
+            )
+        self.assertEqual(transport.requests[1], ('https://example.com/story.html', {'If-None-Match': '"v1"'}))
+        self.assertEqual(results['https://example.com/story.html'].title, "Wagtail spotting")
+        self.assertGreater(
+            ExternalStory.objects.get().last_fetched_at, timezone.now() - timedelta(minutes=1)
+        )
+
+        self.assertIsInstance(results['https://example.com/missing.html'], Exception)
+        failure = ExternalStoryFetchFailure.objects.get()
+        self.assertEqual(failure.url, 'https://example.com/missing.html')
+        self.assertEqual(failure.status_code, 404)
+
+        # failing stories are not requested again until their retry time
+        results = fetch_many(['https://example.com/missing.html'], transport=transport)
+        self.assertIsInstance(results['https://example.com/missing.html'], FetchFailedRecently)
+        self.assertEqual(len(transport.requests), 3)
+
+    @override_settings(WAGTAIL_WEBSTORIES_INSTRUMENTATION={
+        'HANDLERS': ['tests.tests.test_instrumentation.record_metrics'],
+    })
+    def test_instrumentation(self):
+        recorded_metrics.clear()
+        transport = StubTransport({'https://example.com/story.html': story_response("Wagtail spotting")})
+        fetch_many(['https://example.com/story.html'], transport=transport)
+
+        fetch_metrics, = [metrics for operation, metrics in recorded_metrics if operation == 'external_story_fetch']
+        self.assertEqual(fetch_metrics['url'], 'https://example.com/story.html')
+        self.assertEqual(fetch_metrics['status'], 200)
+        self.assertEqual(fetch_metrics['bytes'], len(story_response("Wagtail spotting")[2]))
+
+    def test_download_many(self):
+        transport = StubTransport({
+            'https://example.com/image.jpg': (200, {'Content-Type': 'image/jpeg'}, b'image data'),
+        })
+        with AsyncFetcher(transport=transport) as fetcher:
+            results = fetcher.download_many(['https://example.com/image.jpg', 'https://example.com/broken.jpg'])
+
+        self.assertEqual(results['https://example.com/image.jpg'].file.read(), b'image data')
+        self.assertEqual(results['https://example.com/image.jpg'].size, 10)
+        self.assertIsInstance(results['https://example.com/broken.jpg'], RequestException)
+
+    @override_settings(WAGTAIL_WEBSTORIES_ASSET_DOWNLOADS={'MAX_SIZE': 5})
+    def test_download_max_size(self):
+        transport = StubTransport({'https://example.com/image.jpg': (200, {}, b'image data')})
+        with AsyncFetcher(transport=transport) as fetcher:
+            with self.assertRaises(AssetTooLarge):
+                fetcher.download('https://example.com/image.jpg')
+
+
+class TestAsyncFetcherWithRequestsTransport(TestCase):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def test_get_for_url(self):
+        with StubServer({'/story.html': story_response("Wagtail spotting")}) as server:
+            with AsyncFetcher(transport=RequestsTransport()) as fetcher:
+                story = fetcher.get_for_url(server.url('/story.html'))
+
+        self.assertEqual(story.title, "Wagtail spotting")
+        self.assertEqual(story.publisher_logo_src, server.url('/torchbox.png'))
+
+    def test_import_images(self):
+        logo = Image.objects.create(title="Torchbox", file=get_test_image_file(filename='torchbox.png'))
+        with StubServer({
+            '/wagtail-%d.png' % i: (
+                200, {'Content-Type': 'image/png'}, get_test_image_buffer(colour=(i * 100, 0, 0), size=(32, 32)).getvalue()
+            )
+            for i in range(3)
+        }) as server:
+            story_page = StoryPage(
+                title="Wagtail spotting",
+                slug="wagtail-spotting",
+                publisher="Torchbox",
+                publisher_logo=logo,
+                poster_image=logo,
+                original_url=server.url('/stories/wagtail-spotting.html'),
+            )
+            story_page.pages = [
+                ('page', {
+                    'id': 'page-%d' % i,
+                    'html': '<amp-story-page id="page-%d"><amp-img src="%s" alt="Wagtail %d"></amp-img></amp-story-page>' % (
+                        i, server.url('/wagtail-%d.png' % i), i
+                    ),
+                })
+                for i in range(3)
+            ]
+            Site.objects.get().root_page.add_child(instance=story_page)
+
+            # an AsyncFetcher can stand in for the default AssetDownloader
+            with AsyncFetcher(transport=RequestsTransport()) as fetcher:
+                story_page.asset_downloader = fetcher
+                self.assertTrue(story_page.import_images())
+
+        self.assertEqual(
+            sorted(Image.objects.exclude(id=logo.id).values_list('title', flat=True)),
+            ["Wagtail 0", "Wagtail 1", "Wagtail 2"]
+        )
+        self.assertEqual(sorted(server.requested_paths), ['/wagtail-0.png', '/wagtail-1.png', '/wagtail-2.png'])
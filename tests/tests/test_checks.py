@@ -0,0 +1,18 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from wagtail.images.models import Image
+
+from wagtail_webstories.checks import image_file_hash_index_check
+
+
+class TestImageFileHashIndexCheck(SimpleTestCase):
+    def test_indexed(self):
+        self.assertEqual(image_file_hash_index_check(None), [])
+
+    def test_not_indexed(self):
+        with mock.patch.object(Image._meta.get_field('file_hash'), 'db_index', False):
+            errors = image_file_hash_index_check(None)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0].id, 'wagtail_webstories.W001')
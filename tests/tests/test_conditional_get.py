@@ -0,0 +1,150 @@
+import shutil
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils.http import http_date
+
+from wagtail.images.models import Image
+from wagtail.models import Site
+
+from tests.models import StoryPage
+from tests.utils import get_test_image_file, TEST_MEDIA_DIR
+from wagtail_webstories.blocks import AMPCleanHTMLBlock
+
+
+@override_settings(WAGTAIL_WEBSTORIES_CONDITIONAL_GET={})
+class TestConditionalGet(TestCase):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        cache.clear()
+
+        self.image = Image.objects.create(
+            title="Mountain wagtail",
+            file=get_test_image_file(filename='mountain-wagtail.png', colour='grey'),
+        )
+        self.story_page = StoryPage(
+            title="Wagtail spotting",
+            slug="wagtail-spotting",
+            publisher="Torchbox",
+            publisher_logo_src_original="https://example.com/torchbox.png",
+            poster_portrait_src_original="https://example.com/wagtails.jpg",
+        )
+        self.story_page.pages = [
+            ('page', {
+                'id': 'cover',
+                'html': """
+                    <amp-story-page id="cover">
+                        <amp-img data-wagtail-image-id="%d" alt="A mountain wagtail"></amp-img>
+                    </amp-story-page>
+                """ % self.image.id
+            }),
+        ]
+        Site.objects.get().root_page.add_child(instance=self.story_page)
+        self.story_page.save_revision().publish()
+        self.story_page.refresh_from_db()
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def test_headers(self):
+        response = self.client.get('/wagtail-spotting/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['ETag'], r'^"[0-9a-f]{40}"$')
+        # the story references an image, so changes to it would not be reflected in Last-Modified
+        self.assertNotIn('Last-Modified', response)
+
+        # the ETag is stable across requests
+        self.assertEqual(self.client.get('/wagtail-spotting/')['ETag'], response['ETag'])
+
+    def test_if_none_match(self):
+        etag = self.client.get('/wagtail-spotting/')['ETag']
+
+        with mock.patch.object(AMPCleanHTMLBlock, 'to_python') as to_python, \
+                mock.patch.object(StoryPage, 'get_context') as get_context:
+            response = self.client.get('/wagtail-spotting/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        # the story was neither deserialized nor rendered
+        to_python.assert_not_called()
+        get_context.assert_not_called()
+
+        response = self.client.get('/wagtail-spotting/', HTTP_IF_NONE_MATCH='"something-else"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since(self):
+        # If-Modified-Since is only honoured for stories that reference no images or media
+        response = self.client.get(
+            '/wagtail-spotting/', HTTP_IF_MODIFIED_SINCE=http_date(self.story_page.last_published_at.timestamp())
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.story_page.pages = [
+            ('page', {'id': 'cover', 'html': '<amp-story-page id="cover"><p>No images here</p></amp-story-page>'}),
+        ]
+        self.story_page.save_revision().publish()
+        self.story_page.refresh_from_db()
+
+        last_modified = self.client.get('/wagtail-spotting/')['Last-Modified']
+        self.assertEqual(last_modified, http_date(self.story_page.last_published_at.timestamp()))
+        response = self.client.get('/wagtail-spotting/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/wagtail-spotting/', HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2001 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_changes_on_publish(self):
+        etag = self.client.get('/wagtail-spotting/')['ETag']
+        self.story_page.title = "Advanced wagtail spotting"
+        self.story_page.save_revision().publish()
+
+        response = self.client.get('/wagtail-spotting/', HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, "Advanced wagtail spotting")
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_changes_on_save_without_publishing(self):
+        etag = self.client.get('/wagtail-spotting/')['ETag']
+        # importers and import_assets() update the live page with a plain save()
+        self.story_page.custom_css = "#cover {background-color: #eee;}"
+        self.story_page.save()
+
+        response = self.client.get('/wagtail-spotting/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "#cover {background-color: #eee;}")
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_changes_on_url_change(self):
+        etag = self.client.get('/wagtail-spotting/')['ETag']
+        # the page URL is rendered in the canonical link, and changes without a publish on a move
+        # or a plain save
+        self.story_page.slug = 'advanced-wagtail-spotting'
+        self.story_page.save()
+
+        response = self.client.get('/advanced-wagtail-spotting/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_changes_on_image_change(self):
+        etag = self.client.get('/wagtail-spotting/')['ETag']
+        self.image.file = get_test_image_file(filename='pied-wagtail.png', colour='white')
+        self.image.save()
+        self.image.renditions.all().delete()
+
+        response = self.client.get('/wagtail-spotting/', HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'pied-wagtail')
+
+    def test_preview_is_not_conditional(self):
+        request = self.client.get('/wagtail-spotting/').wsgi_request
+        request.is_preview = True
+        response = self.story_page.serve(request)
+        self.assertNotIn('ETag', response)
+
+    def test_disabled_by_default(self):
+        with self.settings():
+            del settings.WAGTAIL_WEBSTORIES_CONDITIONAL_GET
+            response = self.client.get('/wagtail-spotting/')
+            self.assertNotIn('ETag', response)
+            response = self.client.get('/wagtail-spotting/', HTTP_IF_NONE_MATCH='*')
+            self.assertEqual(response.status_code, 200)
@@ -0,0 +1,70 @@
+import hashlib
+
+import responses
+
+from django.test import SimpleTestCase, override_settings
+from requests.exceptions import HTTPError, RequestException
+
+from wagtail_webstories.downloads import AssetDownloader, AssetTooLarge
+
+
+class TestAssetDownloader(SimpleTestCase):
+    @responses.activate
+    def test_download_many(self):
+        for i in range(5):
+            responses.add(responses.GET, 'https://example.com/image-%d.jpg' % i, body=b'image %d' % i)
+        responses.add(responses.GET, 'https://example.com/broken.jpg', body=HTTPError('not found'))
+
+        urls = ['https://example.com/image-%d.jpg' % i for i in range(5)] + ['https://example.com/broken.jpg']
+        results = AssetDownloader(workers=3).download_many(urls + urls)
+
+        self.assertEqual(list(results.keys()), urls)
+        self.assertEqual(results['https://example.com/image-3.jpg'].file.read(), b'image 3')
+        self.assertIsInstance(results['https://example.com/broken.jpg'], RequestException)
+        # duplicate URLs are only fetched once
+        self.assertEqual(len(responses.calls), 6)
+
+    @override_settings(WAGTAIL_WEBSTORIES_ASSET_DOWNLOADS={'RETRIES': 2, 'BACKOFF_FACTOR': 0})
+    @responses.activate
+    def test_retry(self):
+        responses.add(responses.GET, 'https://example.com/image.jpg', status=503)
+        responses.add(responses.GET, 'https://example.com/image.jpg', body=b'image')
+
+        self.assertEqual(AssetDownloader().download('https://example.com/image.jpg').file.read(), b'image')
+        self.assertEqual(len(responses.calls), 2)
+
+    @responses.activate
+    def test_download_to_file(self):
+        content = b'0123456789' * 20000
+        responses.add(responses.GET, 'https://example.com/video.mp4', body=content)
+
+        asset = AssetDownloader().download('https://example.com/video.mp4')
+        self.assertEqual(asset.size, len(content))
+        self.assertEqual(asset.sha1, hashlib.sha1(content).hexdigest())
+        self.assertEqual(asset.file.read(), content)
+
+    @responses.activate
+    def test_max_size(self):
+        responses.add(
+            responses.GET, 'https://example.com/video.mp4',
+            body=b'0123456789' * 20000, auto_calculate_content_length=True
+        )
+
+        with self.assertRaises(AssetTooLarge):
+            AssetDownloader(max_size=100000).download('https://example.com/video.mp4')
+
+    @responses.activate
+    def test_max_size_without_content_length(self):
+        responses.add(responses.GET, 'https://example.com/video.mp4', body=b'0123456789' * 20000)
+
+        with self.assertRaises(AssetTooLarge):
+            AssetDownloader(max_size=100000).download('https://example.com/video.mp4')
+
+    @override_settings(WAGTAIL_WEBSTORIES_ASSET_DOWNLOADS={'RETRIES': 1, 'BACKOFF_FACTOR': 0})
+    @responses.activate
+    def test_retries_exhausted(self):
+        responses.add(responses.GET, 'https://example.com/image.jpg', status=503)
+
+        with self.assertRaises(RequestException):
+            AssetDownloader().download('https://example.com/image.jpg')
+        self.assertEqual(len(responses.calls), 2)
@@ -1,11 +1,23 @@
 import json
 import responses
+import shutil
 
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
+from wagtail.images.models import Image
 from wagtail.models import Site
 
 from tests.models import BlogPage, StoryPage
+from tests.utils import get_test_image_file, TEST_MEDIA_DIR
+from wagtail_webstories.models import ExternalStory, prefetch_story_posters
+
+queued_fetches = []
+
+
+def record_fetches(urls):
+    queued_fetches.append(list(urls))
 
 
 class TestEmbedding(TestCase):
@@ -107,6 +119,65 @@ class TestEmbedding(TestCase):
         self.assertContains(response, '"background-image: url(https://example.com/wagtails.jpg);"')
         self.assertContains(response, '<div class="title">Wagtail spotting</div>')
 
+    def test_query_count_does_not_grow_with_stories(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, TEST_MEDIA_DIR, ignore_errors=True)
+
+        stories = []
+        for i in range(5):
+            story = StoryPage(
+                title="Wagtail spotting %d" % i,
+                slug="wagtail-spotting-%d" % i,
+                publisher="Torchbox",
+                publisher_logo=Image.objects.create(
+                    title="logo %d" % i, file=get_test_image_file(colour='white'),
+                ),
+                poster_image=Image.objects.create(
+                    title="poster %d" % i, file=get_test_image_file(colour='white'),
+                ),
+                pages=self.story_page.pages,
+            )
+            self.home.add_child(instance=story)
+            stories.append(story)
+
+        one_story_page = BlogPage(title="One story", slug="one-story")
+        one_story_page.body = [('story_link', stories[0]), ('story_embed', stories[0])]
+        self.home.add_child(instance=one_story_page)
+
+        many_stories_page = BlogPage(title="Many stories", slug="many-stories")
+        many_stories_page.body = (
+            [('story_link', story) for story in stories] + [('story_embed', story) for story in stories]
+        )
+        self.home.add_child(instance=many_stories_page)
+
+        # generate renditions up front, so that we are only counting lookups
+        self.client.get('/many-stories/')
+
+        with CaptureQueriesContext(connection) as one_story:
+            self.client.get('/one-story/')
+
+        with CaptureQueriesContext(connection) as many_stories:
+            response = self.client.get('/many-stories/')
+
+        self.assertEqual(len(many_stories), len(one_story))
+        self.assertContains(response, '<div class="title">Wagtail spotting 4</div>')
+
+    def test_prefetch_story_posters(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, TEST_MEDIA_DIR, ignore_errors=True)
+
+        self.story_page.poster_image = Image.objects.create(
+            title="poster", file=get_test_image_file(colour='white'),
+        )
+        self.story_page.save()
+        # generate renditions up front
+        self.story_page.get_poster_renditions()
+
+        pages = prefetch_story_posters(StoryPage.objects.all())
+        with self.assertNumQueries(0):
+            self.assertTrue(pages[0].poster_portrait_src.startswith('http://media.example.com/media/images/'))
+            self.assertTrue(pages[0].poster_landscape_src.startswith('http://media.example.com/media/images/'))
+
     @responses.activate
     def test_render_with_external_embed(self):
         responses.add(
@@ -124,13 +195,79 @@ class TestEmbedding(TestCase):
         ])
         self.home.add_child(instance=blog_page)
 
+        # The story has not been fetched yet, so a placeholder is output and a fetch is queued
         response = self.client.get('/november-nature-notes/')
         self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'class="webstory-placeholder"')
+        self.assertEqual(len(responses.calls), 1)
+
+        response = self.client.get('/november-nature-notes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(responses.calls), 1)
         self.assertContains(response, '<amp-story-player>')
         self.assertContains(response, '<a href="https://example.com/good-story.html">')
         self.assertContains(response, '<img src="https://example.com/wagtails.jpg" loading="lazy" width="100%" height="100%" amp-story-player-poster-img>')
         self.assertContains(response, 'Wagtail spotting')
 
+    @override_settings(WAGTAIL_WEBSTORIES_EXTERNAL_STORY_FETCHER='tests.tests.test_embedding.record_fetches')
+    @responses.activate
+    def test_load_external_story_without_fetching(self):
+        self.addCleanup(queued_fetches.clear)
+        blog_page = BlogPage(
+            title="November nature notes",
+            slug="november-nature-notes",
+        )
+        blog_page.body = json.dumps([
+            {'type': 'external_story_link', 'value': "https://example.com/good-story.html"},
+        ])
+        self.home.add_child(instance=blog_page)
+
+        blog_page = BlogPage.objects.get(id=blog_page.id)
+        story = blog_page.body[0].value
+        self.assertEqual(story.url, "https://example.com/good-story.html")
+        self.assertEqual(len(responses.calls), 0)
+
+        # the story has not been fetched, so remains unavailable until the queued fetch completes
+        self.assertFalse(story.is_ready)
+        self.assertEqual(story.title, '')
+        self.assertEqual(blog_page.body.get_prep_value()[0]['value'], "https://example.com/good-story.html")
+        self.assertEqual(queued_fetches, [["https://example.com/good-story.html"]])
+        self.assertEqual(len(responses.calls), 0)
+
+    @override_settings(WAGTAIL_WEBSTORIES_EXTERNAL_STORY_FETCHER='tests.tests.test_embedding.record_fetches')
+    @responses.activate
+    def test_bulk_load_external_stories(self):
+        self.addCleanup(queued_fetches.clear)
+        urls = ["https://example.com/story-%d.html" % i for i in range(5)]
+        for url in urls:
+            responses.add(
+                responses.GET, url, content_type='text/html', body=self.external_story_body
+            )
+        ExternalStory.get_for_url(urls[0])
+        ExternalStory.get_for_url(urls[1])
+
+        blog_page = BlogPage(
+            title="November nature notes",
+            slug="november-nature-notes",
+        )
+        blog_page.body = json.dumps(
+            [{'type': 'external_story_link', 'value': url} for url in urls]
+            + [{'type': 'external_story_link', 'value': urls[0]}]
+        )
+        self.home.add_child(instance=blog_page)
+        blog_page = BlogPage.objects.get(id=blog_page.id)
+
+        with self.assertNumQueries(1):
+            stories = [child.value for child in blog_page.body]
+            self.assertEqual([story.url for story in stories], urls + [urls[0]])
+            self.assertEqual(
+                [story.is_ready for story in stories], [True, True, False, False, False, True]
+            )
+        self.assertEqual(stories[0].title, "Wagtail spotting")
+
+        # the missing stories are queued for fetching together
+        self.assertEqual(queued_fetches, [urls[2:]])
+
     @responses.activate
     def test_render_with_external_story_link(self):
         responses.add(
@@ -148,7 +285,14 @@ class TestEmbedding(TestCase):
         ])
         self.home.add_child(instance=blog_page)
 
+        # The story has not been fetched yet, so a placeholder is output and a fetch is queued
+        response = self.client.get('/november-nature-notes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'class="webstory-placeholder"')
+        self.assertEqual(len(responses.calls), 1)
+
         response = self.client.get('/november-nature-notes/')
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(responses.calls), 1)
         self.assertContains(response, '<a href="https://example.com/good-story.html" target="_blank" class="webstory-poster" style="background-image: url(https://example.com/wagtails.jpg);">')
         self.assertContains(response, '<div class="title">Wagtail spotting</div>')
@@ -1,11 +1,28 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
 import responses
+from defusedxml import DefusedXmlException
 from django.contrib.auth.models import Permission, User
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import TestCase, override_settings
-from requests.exceptions import HTTPError
+from django.utils import timezone
+from requests.exceptions import HTTPError, ReadTimeout
 
 from wagtail.models import Page
 
 from tests.models import StoryPage
+from tests.utils import get_test_image_buffer, StubServer, TEST_MEDIA_DIR
+from wagtail_webstories import importing
+from wagtail_webstories.importing import clean_story_pages, parse_story_urls
+from webstories import Story
+from wagtail_webstories.models import StoryImportJob
 
 WAGTAIL_SPOTTING_STORY = """<!DOCTYPE HTML>
 <html ⚡>
@@ -170,3 +187,407 @@ class TestImport(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "You do not have permission to create a page at this location")
         self.assertEqual(StoryPage.objects.count(), 0)
+
+
+@override_settings(WAGTAIL_WEBSTORIES_IMPORT_JOBS=True)
+class TestImportJobs(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='12345')
+        self.client.login(username='admin', password='12345')
+        self.home = Page.objects.filter(depth=2).first()
+
+    def enqueue(self, source_url):
+        response = self.client.post('/admin/webstories/import/', {
+            'source_url': source_url,
+            'destination': self.home.pk,
+        })
+        job = StoryImportJob.objects.get()
+        self.assertRedirects(response, '/admin/webstories/import/jobs/%d/' % job.pk)
+        return job
+
+    @responses.activate
+    def test_import(self):
+        responses.add(
+            responses.GET, 'https://example.com/good-story.html', body=WAGTAIL_SPOTTING_STORY
+        )
+        job = self.enqueue('https://example.com/good-story.html')
+
+        # nothing is fetched until the worker runs
+        self.assertEqual(len(responses.calls), 0)
+        self.assertEqual(job.status, StoryImportJob.STATUS_QUEUED)
+        self.assertEqual(job.user, self.user)
+        response = self.client.get('/admin/webstories/import/jobs/%d/' % job.pk)
+        self.assertContains(response, "Waiting for the import to start")
+
+        call_command('run_story_import_jobs', once=True, verbosity=0)
+
+        story = Page.objects.get(url_path='/home/wagtail-spotting/').specific
+        self.assertEqual(type(story), StoryPage)
+        self.assertEqual(len(story.pages), 2)
+
+        response = self.client.get('/admin/webstories/import/jobs/%d/status/' % job.pk)
+        self.assertEqual(response.json(), {
+            'id': job.pk,
+            'source_url': 'https://example.com/good-story.html',
+            'status': 'completed',
+            'progress': 100,
+            'progress_message': "Story 'Wagtail spotting' imported.",
+            'errors': [],
+            'page_id': story.pk,
+        })
+        response = self.client.get('/admin/webstories/import/jobs/%d/' % job.pk)
+        self.assertContains(response, '/admin/pages/%d/edit/' % story.pk)
+
+    @responses.activate
+    def test_import_broken_url(self):
+        responses.add(
+            responses.GET, 'https://example.com/broken-link.html',
+            body=HTTPError("Something went wrong")
+        )
+        job = self.enqueue('https://example.com/broken-link.html')
+        call_command('run_story_import_jobs', once=True, verbosity=0)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, StoryImportJob.STATUS_FAILED)
+        self.assertEqual(job.errors, ["Could not fetch URL."])
+        self.assertEqual(StoryPage.objects.count(), 0)
+        response = self.client.get('/admin/webstories/import/jobs/%d/' % job.pk)
+        self.assertContains(response, "Could not fetch URL.")
+
+    def test_claim_next(self):
+        first_job = StoryImportJob.objects.create(source_url='https://example.com/1.html', destination=self.home)
+        second_job = StoryImportJob.objects.create(source_url='https://example.com/2.html', destination=self.home)
+
+        self.assertEqual(StoryImportJob.claim_next(), first_job)
+        self.assertEqual(StoryImportJob.claim_next(), second_job)
+        self.assertIsNone(StoryImportJob.claim_next())
+
+    def test_stale_running_job_is_failed(self):
+        stale_job = StoryImportJob.objects.create(
+            source_url='https://example.com/1.html', destination=self.home, status=StoryImportJob.STATUS_RUNNING,
+            started_at=timezone.now() - timedelta(hours=2),
+        )
+        running_job = StoryImportJob.objects.create(
+            source_url='https://example.com/2.html', destination=self.home, status=StoryImportJob.STATUS_RUNNING,
+            started_at=timezone.now() - timedelta(minutes=5),
+        )
+
+        with self.assertLogs('wagtail_webstories.models', level='WARNING'):
+            self.assertIsNone(StoryImportJob.claim_next())
+        stale_job.refresh_from_db()
+        self.assertEqual(stale_job.status, StoryImportJob.STATUS_FAILED)
+        self.assertEqual(stale_job.errors, ["Import did not complete within the time limit."])
+        self.assertIsNotNone(stale_job.finished_at)
+        running_job.refresh_from_db()
+        self.assertEqual(running_job.status, StoryImportJob.STATUS_RUNNING)
+
+        with self.settings(WAGTAIL_WEBSTORIES_IMPORT_JOB_TIMEOUT=60), \
+                self.assertLogs('wagtail_webstories.models', level='WARNING'):
+            self.assertEqual(StoryImportJob.fail_stale(), 1)
+        running_job.refresh_from_db()
+        self.assertEqual(running_job.status, StoryImportJob.STATUS_FAILED)
+
+    def test_other_users_jobs_not_visible(self):
+        job = StoryImportJob.objects.create(
+            source_url='https://example.com/good-story.html', destination=self.home, user=self.user
+        )
+        user = User.objects.create_user(username='editor', email='editor@example.com', password='12345')
+        user.user_permissions.add(Permission.objects.get(codename='access_admin'))
+        self.client.login(username='editor', password='12345')
+
+        response = self.client.get('/admin/webstories/import/jobs/%d/status/' % job.pk)
+        self.assertEqual(response.status_code, 404)
+
+
+
+class TestCleanStoryPages(TestCase):
+    def get_story(self, page_count):
+        pages = ''.join(
+            '<amp-story-page id="page-%d"><p>Page %d</p><script>alert("boo!")</script></amp-story-page>' % (i, i)
+            for i in range(page_count)
+        )
+        return Story('<html><body><amp-story title="Test" publisher="Torchbox">%s</amp-story></body></html>' % pages)
+
+    @override_settings(WAGTAIL_WEBSTORIES_CLEAN_WORKERS=2)
+    def test_parallel(self):
+        story = self.get_story(importing.DEFAULT_PARALLEL_CLEAN_MIN_PAGES + 2)
+        pages_html = clean_story_pages(story)
+        self.assertEqual(pages_html, [subpage.get_clean_html() for subpage in story.pages])
+        # page order is preserved
+        for i, page_html in enumerate(pages_html):
+            self.assertIn('<p>Page %d</p>' % i, page_html)
+            self.assertNotIn('alert', page_html)
+
+        # workers are spawned rather than forked from the (possibly threaded) calling process
+        self.assertEqual(importing._get_clean_executor(2)._mp_context.get_start_method(), 'spawn')
+
+    @override_settings(WAGTAIL_WEBSTORIES_CLEAN_WORKERS=2)
+    def test_small_story_cleaned_serially(self):
+        story = self.get_story(2)
+        with mock.patch.object(importing, '_get_clean_executor') as get_clean_executor:
+            pages_html = clean_story_pages(story)
+        get_clean_executor.assert_not_called()
+        self.assertEqual(len(pages_html), 2)
+
+    @override_settings(WAGTAIL_WEBSTORIES_CLEAN_WORKERS=2, WAGTAIL_WEBSTORIES_PARALLEL_CLEAN_MIN_PAGES=20)
+    def test_min_pages_setting(self):
+        story = self.get_story(10)
+        with mock.patch.object(importing, '_get_clean_executor') as get_clean_executor:
+            clean_story_pages(story)
+        get_clean_executor.assert_not_called()
+
+    def test_no_pool_without_workers_setting(self):
+        story = self.get_story(importing.DEFAULT_PARALLEL_CLEAN_MIN_PAGES + 2)
+        with mock.patch.object(importing, '_get_clean_executor') as get_clean_executor:
+            clean_story_pages(story)
+        get_clean_executor.assert_not_called()
+
+
+SITEMAP = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+    <url><loc>https://example.com/good-story.html</loc></url>
+    <url><loc>https://example.com/another-story.html</loc></url>
+</urlset>
+"""
+
+
+class TestBulkImport(TestCase):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        self.user = User.objects.create_superuser(username='admin', email='admin@example.com', password='12345')
+        self.client.login(username='admin', password='12345')
+        self.home = Page.objects.filter(depth=2).first()
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        shutil.rmtree(self.tempdir)
+
+    def add_story_responses(self):
+        responses.add(
+            responses.GET, 'https://example.com/good-story.html', body=WAGTAIL_SPOTTING_STORY
+        )
+        responses.add(
+            responses.GET, 'https://example.com/another-story.html',
+            body=WAGTAIL_SPOTTING_STORY.replace('title="Wagtail spotting"', 'title="More wagtail spotting"')
+        )
+        responses.add(
+            responses.GET, 'https://example.com/broken-link.html', body=HTTPError("Something went wrong")
+        )
+        responses.add(
+            responses.GET, 'https://example.com/torchbox.png', content_type='image/png',
+            body=get_test_image_buffer(colour='purple', size=(64, 64)).getvalue()
+        )
+        responses.add(
+            responses.GET, 'https://example.com/wagtails.jpg', content_type='image/jpeg',
+            body=get_test_image_buffer(colour='black', format='JPEG', size=(640, 853)).getvalue()
+        )
+
+    def test_parse_story_urls(self):
+        self.assertEqual(
+            parse_story_urls("https://example.com/a.html\n\n# comment\nhttps://example.com/b.html\nhttps://example.com/a.html\n"),
+            ['https://example.com/a.html', 'https://example.com/b.html']
+        )
+        self.assertEqual(
+            parse_story_urls(SITEMAP),
+            ['https://example.com/good-story.html', 'https://example.com/another-story.html']
+        )
+
+    @responses.activate
+    def test_parse_sitemap_index(self):
+        responses.add(responses.GET, 'https://example.com/stories-sitemap.xml', body=SITEMAP)
+        self.assertEqual(
+            parse_story_urls("""<?xml version="1.0" encoding="UTF-8"?>
+                <sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+                    <sitemap><loc>https://example.com/stories-sitemap.xml</loc></sitemap>
+                </sitemapindex>
+            """),
+            ['https://example.com/good-story.html', 'https://example.com/another-story.html']
+        )
+
+    @responses.activate
+    def test_parse_self_referencing_sitemap_index(self):
+        sitemap_index = """<?xml version="1.0" encoding="UTF-8"?>
+            <sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+                <sitemap><loc>https://example.com/sitemap-index.xml</loc></sitemap>
+                <sitemap><loc>https://example.com/stories-sitemap.xml</loc></sitemap>
+            </sitemapindex>
+        """
+        responses.add(responses.GET, 'https://example.com/sitemap-index.xml', body=sitemap_index)
+        responses.add(responses.GET, 'https://example.com/stories-sitemap.xml', body=SITEMAP)
+        self.assertEqual(
+            parse_story_urls(sitemap_index, source_url='https://example.com/sitemap-index.xml'),
+            ['https://example.com/good-story.html', 'https://example.com/another-story.html']
+        )
+        self.assertEqual(len(responses.calls), 1)
+
+    @responses.activate
+    def test_parse_deeply_nested_sitemap_index(self):
+        def sitemap_index(i):
+            return """<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+                <sitemap><loc>https://example.com/sitemap-%d.xml</loc></sitemap>
+            </sitemapindex>""" % i
+
+        for i in range(10):
+            responses.add(responses.GET, 'https://example.com/sitemap-%d.xml' % i, body=sitemap_index(i + 1))
+        with self.assertRaisesRegex(ValidationError, "nested more than 3 levels"):
+            parse_story_urls(sitemap_index(0))
+        self.assertEqual(len(responses.calls), 3)
+
+    def test_parse_sitemap_with_entities(self):
+        with self.assertRaises(DefusedXmlException):
+            parse_story_urls("""<?xml version="1.0"?>
+                <!DOCTYPE urlset [<!ENTITY story "https://example.com/story.html">]>
+                <urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"><url><loc>&story;</loc></url></urlset>
+            """)
+
+    @responses.activate
+    def test_command(self):
+        self.add_story_responses()
+        sitemap_path = os.path.join(self.tempdir, 'sitemap.xml')
+        with open(sitemap_path, 'w') as f:
+            f.write(SITEMAP)
+        report_path = os.path.join(self.tempdir, 'report.json')
+
+        call_command(
+            'import_webstories', sitemap_path, destination=self.home.pk, report=report_path, verbosity=0
+        )
+
+        self.assertEqual(
+            sorted(StoryPage.objects.values_list('title', flat=True)),
+            ["More wagtail spotting", "Wagtail spotting"]
+        )
+        # the publisher logo and poster image are shared between the stories, so are only
+        # downloaded once
+        logo_requests = [call for call in responses.calls if call.request.url == 'https://example.com/torchbox.png']
+        self.assertEqual(len(logo_requests), 1)
+        story = StoryPage.objects.get(title="More wagtail spotting")
+        self.assertEqual(story.publisher_logo.title, "Torchbox logo")
+
+        with open(report_path) as f:
+            report = json.load(f)
+        self.assertEqual([result['url'] for result in report], [
+            'https://example.com/good-story.html', 'https://example.com/another-story.html'
+        ])
+        self.assertEqual(report[1]['status'], 'imported')
+        self.assertEqual(report[1]['page_id'], story.pk)
+        self.assertIn('fetch_time', report[1])
+        self.assertIn('import_time', report[1])
+
+    @responses.activate
+    def test_command_resume_from_checkpoint(self):
+        self.add_story_responses()
+        urls_path = os.path.join(self.tempdir, 'urls.txt')
+        with open(urls_path, 'w') as f:
+            f.write("https://example.com/good-story.html\nhttps://example.com/broken-link.html\n")
+        checkpoint_path = os.path.join(self.tempdir, 'checkpoint.json')
+
+        call_command(
+            'import_webstories', urls_path, destination=self.home.pk, checkpoint=checkpoint_path,
+            no_assets=True, verbosity=0
+        )
+        self.assertEqual(StoryPage.objects.count(), 1)
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        self.assertEqual(checkpoint['https://example.com/broken-link.html']['status'], 'failed')
+        self.assertEqual(checkpoint['https://example.com/broken-link.html']['error'], "Could not fetch URL.")
+
+        # on re-running, only the failed story is retried
+        with open(urls_path, 'a') as f:
+            f.write("https://example.com/another-story.html\n")
+        calls_before = len(responses.calls)
+        call_command(
+            'import_webstories', urls_path, destination=self.home.pk, checkpoint=checkpoint_path,
+            no_assets=True, verbosity=0
+        )
+        self.assertEqual(StoryPage.objects.count(), 2)
+        # stories are fetched concurrently, so may be requested in either order
+        self.assertEqual(
+            sorted(call.request.url for call in responses.calls[calls_before:]),
+            ['https://example.com/another-story.html', 'https://example.com/broken-link.html']
+        )
+
+    @responses.activate
+    def test_admin_form(self):
+        self.add_story_responses()
+        response = self.client.post('/admin/webstories/import/bulk/', {
+            'urls': "https://example.com/good-story.html\nhttps://example.com/broken-link.html",
+            'urls_file': SimpleUploadedFile('sitemap.xml', SITEMAP.encode('utf-8')),
+            'destination': self.home.pk,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Imported 2 stories (1 failed).")
+        self.assertContains(response, "Could not fetch URL.")
+        self.assertEqual(StoryPage.objects.count(), 2)
+        # assets are not downloaded within the request
+        self.assertContains(response, "left at their original URLs")
+        self.assertFalse(any(call.request.url.endswith(('.png', '.jpg')) for call in responses.calls))
+        self.assertEqual(
+            StoryPage.objects.get(title="Wagtail spotting").publisher_logo_src, 'https://example.com/torchbox.png'
+        )
+
+    @override_settings(WAGTAIL_WEBSTORIES_IMPORT_JOBS=True)
+    def test_admin_form_with_jobs(self):
+        response = self.client.post('/admin/webstories/import/bulk/', {
+            'urls': "https://example.com/good-story.html\nhttps://example.com/another-story.html",
+            'destination': self.home.pk,
+        })
+        self.assertRedirects(response, '/admin/pages/%d/' % self.home.pk)
+        self.assertEqual(
+            list(StoryImportJob.objects.values_list('source_url', flat=True)),
+            ['https://example.com/good-story.html', 'https://example.com/another-story.html']
+        )
+
+    @override_settings(WAGTAIL_WEBSTORIES_SYNCHRONOUS_BULK_IMPORT_LIMIT=1)
+    def test_admin_form_synchronous_limit(self):
+        response = self.client.post('/admin/webstories/import/bulk/', {
+            'urls': "https://example.com/good-story.html\nhttps://example.com/another-story.html",
+            'destination': self.home.pk,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Only 1 stories can be imported at once (2 given).")
+        self.assertEqual(StoryPage.objects.count(), 0)
+
+    @override_settings(WAGTAIL_WEBSTORIES_METADATA_FETCH={'READ_TIMEOUT': 0.1})
+    def test_fetch_timeout(self):
+        with StubServer({'/story.html': (200, {'Content-Type': 'text/html'}, b'...')}, delay=0.5) as server:
+            with self.assertRaises(ReadTimeout):
+                importing.fetch_story(server.url('/story.html'))
+
+    def test_fetch_error_status(self):
+        with StubServer({}) as server:
+            with self.assertRaises(HTTPError):
+                importing.fetch_story(server.url('/missing.html'))
+
+    def test_admin_form_no_urls(self):
+        response = self.client.post('/admin/webstories/import/bulk/', {
+            'urls': "",
+            'destination': self.home.pk,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Please provide at least one story URL.")
+
+    @responses.activate
+    def test_admin_form_nested_sitemap_index(self):
+        sitemap_index = """<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+            <sitemap><loc>https://example.com/sitemap-index.xml</loc></sitemap>
+        </sitemapindex>"""
+        responses.add(
+            responses.GET, 'https://example.com/sitemap-index.xml',
+            body=sitemap_index.replace('sitemap-index.xml', 'sitemap-index.xml?page=2')
+        )
+        responses.add(
+            responses.GET, 'https://example.com/sitemap-index.xml?page=2',
+            body=sitemap_index.replace('sitemap-index.xml', 'sitemap-index.xml?page=3')
+        )
+        responses.add(
+            responses.GET, 'https://example.com/sitemap-index.xml?page=3',
+            body=sitemap_index.replace('sitemap-index.xml', 'sitemap-index.xml?page=4')
+        )
+        response = self.client.post('/admin/webstories/import/bulk/', {
+            'urls_file': SimpleUploadedFile('sitemap.xml', sitemap_index.encode('utf-8')),
+            'destination': self.home.pk,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Sitemap indexes are nested more than 3 levels deep.")
+        self.assertEqual(StoryPage.objects.count(), 0)
@@ -0,0 +1,157 @@
+import shutil
+
+import responses
+
+from django.core.signals import request_finished
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from wagtail.images.models import Image
+from wagtail.models import Site
+
+from tests.models import StoryPage
+from tests.utils import get_test_image_file, TEST_MEDIA_DIR
+from wagtail_webstories.downloads import AssetDownloader
+from wagtail_webstories.instrumentation import NULL_MEASUREMENT, measure
+
+recorded_metrics = []
+
+
+def record_metrics(operation, metrics):
+    recorded_metrics.append((operation, metrics))
+
+
+def failing_handler(operation, metrics):
+    raise ValueError("metrics backend is down")
+
+
+@override_settings(WAGTAIL_WEBSTORIES_INSTRUMENTATION={
+    'HANDLERS': ['tests.tests.test_instrumentation.record_metrics'],
+})
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        recorded_metrics.clear()
+
+        self.image = Image.objects.create(
+            title="Mountain wagtail",
+            file=get_test_image_file(filename='mountain-wagtail.png', colour='grey'),
+        )
+        self.story_page = StoryPage(
+            title="Wagtail spotting",
+            slug="wagtail-spotting",
+            publisher="Torchbox",
+            publisher_logo_src_original="https://example.com/torchbox.png",
+            poster_portrait_src_original="https://example.com/wagtails.jpg",
+        )
+        self.story_page.pages = [
+            ('page', {
+                'id': 'cover',
+                'html': """
+                    <amp-story-page id="cover">
+                        <amp-img data-wagtail-image-id="%d" alt="A mountain wagtail"></amp-img>
+                    </amp-story-page>
+                """ % self.image.id
+            }),
+        ]
+        Site.objects.get().root_page.add_child(instance=self.story_page)
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def get_metrics(self, operation):
+        return [metrics for recorded_operation, metrics in recorded_metrics if recorded_operation == operation]
+
+    def test_serve(self):
+        response = self.client.get('/wagtail-spotting/')
+        self.assertContains(response, 'mountain-wagtail.original.png')
+
+        serve_metrics, = self.get_metrics('serve')
+        self.assertEqual(serve_metrics['page_id'], self.story_page.id)
+        self.assertGreater(serve_metrics['duration'], 0)
+        # the measurement covers template rendering, including the queries for the image renditions
+        self.assertGreater(serve_metrics['queries'], 0)
+        render_metrics, = self.get_metrics('render_pages')
+        self.assertLessEqual(render_metrics['queries'], serve_metrics['queries'])
+        self.assertFalse(render_metrics['cache_hit'])
+
+        self.assertEqual(len(self.get_metrics('get_context')), 1)
+        expand_metrics, = self.get_metrics('expand_entities')
+        self.assertEqual(expand_metrics['fragments'], 1)
+        self.assertEqual(expand_metrics['images'], 1)
+        self.assertEqual(expand_metrics['media'], 0)
+
+    def test_serve_without_rendering(self):
+        # the response may be replaced by middleware, or an error may occur before it is rendered
+        request = self.client.get('/wagtail-spotting/').wsgi_request
+        recorded_metrics.clear()
+        wrapper_count = len(connection.execute_wrappers)
+        response = self.story_page.serve(request)
+        self.assertFalse(response.is_rendered)
+        self.assertEqual(len(connection.execute_wrappers), wrapper_count + 1)
+
+        request_finished.send(sender=self.__class__)
+        self.assertEqual(len(connection.execute_wrappers), wrapper_count)
+        serve_metrics, = self.get_metrics('serve')
+        self.assertIs(serve_metrics['completed'], False)
+
+        # the measurement is only reported once
+        request_finished.send(sender=self.__class__)
+        self.assertEqual(len(self.get_metrics('serve')), 1)
+
+    def test_nested_query_counts(self):
+        with measure('outer') as outer:
+            Image.objects.count()
+            with measure('inner'):
+                Image.objects.count()
+
+        self.assertEqual(outer.metrics['queries'], 2)
+        self.assertEqual(self.get_metrics('inner')[0]['queries'], 1)
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            with measure('failing_operation'):
+                raise ValueError("oops")
+        self.assertEqual(self.get_metrics('failing_operation')[0]['error'], 'ValueError')
+
+    @responses.activate
+    def test_asset_download(self):
+        responses.add(responses.GET, 'https://example.com/image.jpg', body=b'0123456789')
+        AssetDownloader().download('https://example.com/image.jpg')
+
+        download_metrics, = self.get_metrics('asset_download')
+        self.assertEqual(download_metrics['url'], 'https://example.com/image.jpg')
+        self.assertEqual(download_metrics['bytes'], 10)
+
+    @override_settings(WAGTAIL_WEBSTORIES_INSTRUMENTATION={
+        'HANDLERS': ['tests.tests.test_instrumentation.record_metrics'],
+        'SAMPLE_RATE': 0,
+    })
+    def test_sample_rate(self):
+        self.assertIs(measure('serve'), NULL_MEASUREMENT)
+        self.client.get('/wagtail-spotting/')
+        self.assertEqual(recorded_metrics, [])
+
+    @override_settings(WAGTAIL_WEBSTORIES_INSTRUMENTATION=None)
+    def test_disabled(self):
+        measurement = measure('serve')
+        self.assertIs(measurement, NULL_MEASUREMENT)
+        self.assertFalse(measurement)
+        self.client.get('/wagtail-spotting/')
+        self.assertEqual(recorded_metrics, [])
+
+    @override_settings(WAGTAIL_WEBSTORIES_INSTRUMENTATION={
+        'HANDLERS': ['tests.tests.test_instrumentation.failing_handler'],
+    })
+    def test_failing_handler(self):
+        with self.assertLogs('wagtail_webstories.instrumentation', level='ERROR'):
+            response = self.client.get('/wagtail-spotting/')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(WAGTAIL_WEBSTORIES_INSTRUMENTATION={})
+    def test_log_metrics(self):
+        with self.assertLogs('wagtail_webstories.instrumentation', level='INFO') as logs:
+            with measure('import_story', source_url='https://example.com/story.html'):
+                pass
+        self.assertIn('import_story: duration=', logs.output[0])
+        self.assertIn('source_url=https://example.com/story.html', logs.output[0])
@@ -0,0 +1,164 @@
+import shutil
+from unittest import mock
+
+from django.db import connection
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from wagtail.images.models import Image
+from wagtailmedia.models import Media
+
+from tests.utils import get_test_image_file, TEST_MEDIA_DIR
+from wagtail_webstories import cache as webstories_cache
+from wagtail_webstories.blocks import AMPCleanHTMLBlock
+from wagtail_webstories.cache import clean_html_cache_stats, clear_clean_html_cache
+from wagtail_webstories.markup import AMPText, expand_entities, expand_entities_many
+
+
+class TestExpandEntities(TestCase):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        self.images = [
+            Image.objects.create(
+                title="Wagtail %d" % i,
+                file=get_test_image_file(filename='wagtail-%d.png' % i, colour='grey'),
+            )
+            for i in range(5)
+        ]
+        self.video = Media.objects.create(
+            title="Wagtail in flight",
+            # not actually a video file, but nobody's checking so it's good enough for a test
+            file=get_test_image_file(filename='wagtail-in-flight.webm', colour='green'),
+            duration=0,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def get_page_html(self, images):
+        return "".join(
+            '<amp-img data-wagtail-image-id="%d" alt="%s"></amp-img>' % (image.id, image.title)
+            for image in images
+        ) + '<amp-video><source data-wagtail-media-id="%d" type="video/webm"></amp-video>' % self.video.id
+
+    def test_expand(self):
+        html = expand_entities(
+            '<amp-img data-wagtail-image-id="%d"></amp-img>'
+            '<amp-img data-wagtail-image-id="999999"></amp-img>'
+            '<source data-wagtail-media-id=\'%d\' />' % (self.images[0].id, self.video.id)
+        )
+        self.assertIn('<amp-img src="http://media.example.com/media/images/wagtail-0.original.png">', html)
+        # references to missing images are dropped
+        self.assertIn('<amp-img ></amp-img>', html)
+        self.assertIn('<source src="http://media.example.com/media/media/wagtail-in-flight.webm" />', html)
+
+    def test_query_count_does_not_grow_with_images(self):
+        # generate renditions up front, so that we are only counting lookups
+        expand_entities(self.get_page_html(self.images))
+
+        with CaptureQueriesContext(connection) as one_image:
+            expand_entities(self.get_page_html(self.images[:1]))
+
+        with CaptureQueriesContext(connection) as many_images:
+            html = expand_entities(self.get_page_html(self.images))
+
+        self.assertEqual(len(many_images), len(one_image))
+        self.assertNotIn('data-wagtail-image-id', html)
+
+    def test_query_count_does_not_grow_with_pages(self):
+        expand_entities(self.get_page_html(self.images))
+
+        with CaptureQueriesContext(connection) as one_page:
+            expand_entities_many([self.get_page_html(self.images[:1])])
+
+        with CaptureQueriesContext(connection) as many_pages:
+            pages = expand_entities_many([self.get_page_html([image]) for image in self.images])
+
+        self.assertEqual(len(many_pages), len(one_page))
+        self.assertEqual(len(pages), 5)
+        for i, page_html in enumerate(pages):
+            self.assertIn('wagtail-%d.original.png' % i, page_html)
+
+
+class TestAMPText(TestCase):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        self.image = Image.objects.create(
+            title="Mountain wagtail",
+            file=get_test_image_file(filename='mountain-wagtail.png', colour='grey'),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def test_referenced_ids(self):
+        text = AMPText(
+            '<amp-img data-wagtail-image-id="%d"></amp-img><source data-wagtail-media-id="12">' % self.image.id
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(text.image_ids, {self.image.id})
+            self.assertEqual(text.media_ids, {12})
+
+    def test_expansion_is_cached(self):
+        text = AMPText('<amp-img data-wagtail-image-id="%d"></amp-img>' % self.image.id)
+        html = str(text)
+        self.assertIn('mountain-wagtail.original.png', html)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(str(text), html)
+            self.assertEqual(text.__html__(), html)
+
+    def test_changing_source_invalidates_cache(self):
+        text = AMPText('<amp-img data-wagtail-image-id="%d"></amp-img>' % self.image.id)
+        str(text)
+
+        text.source = '<p>No images here</p>'
+        self.assertEqual(text.image_ids, set())
+        self.assertEqual(str(text), '<p>No images here</p>')
+
+    def test_none_source(self):
+        text = AMPText(None)
+        self.assertEqual(text.source, '')
+        self.assertFalse(text)
+
+
+class TestCleanHTMLCache(SimpleTestCase):
+    def setUp(self):
+        clear_clean_html_cache()
+        clean_html_cache_stats.clear()
+        cache.clear()
+        self.block = AMPCleanHTMLBlock()
+
+    def test_unchanged_html_is_not_recleaned(self):
+        html = AMPText('<amp-story-page id="cover"><p>Hello</p><script>alert("boo!")</script></amp-story-page>')
+
+        cleaned = self.block.clean(html)
+        self.assertNotIn('alert', cleaned.source)
+        self.assertEqual(clean_html_cache_stats['misses'], 1)
+
+        self.assertEqual(self.block.clean(AMPText(html.source)).source, cleaned.source)
+        self.assertEqual(clean_html_cache_stats['hits'], 1)
+        self.assertEqual(clean_html_cache_stats['misses'], 1)
+
+        self.block.clean(AMPText('<amp-story-page id="cover"><p>Goodbye</p></amp-story-page>'))
+        self.assertEqual(clean_html_cache_stats['misses'], 2)
+
+    def test_lru_size(self):
+        with mock.patch.object(webstories_cache, 'CLEAN_HTML_LRU_SIZE', 2):
+            for i in range(3):
+                self.block.clean(AMPText('<amp-story-page id="page-%d"></amp-story-page>' % i))
+            # the oldest entry has been evicted
+            self.block.clean(AMPText('<amp-story-page id="page-0"></amp-story-page>'))
+        self.assertEqual(clean_html_cache_stats['misses'], 4)
+
+    @override_settings(WAGTAIL_WEBSTORIES_CLEAN_HTML_CACHE={'ALIAS': 'default'})
+    def test_shared_cache(self):
+        html = AMPText('<amp-story-page id="cover"><p>Hello</p></amp-story-page>')
+        self.block.clean(html)
+
+        # simulate another process, with an empty in-memory cache
+        clear_clean_html_cache()
+        self.block.clean(html)
+        self.assertEqual(clean_html_cache_stats['shared_hits'], 1)
+        self.assertEqual(clean_html_cache_stats['misses'], 1)
@@ -0,0 +1,119 @@
+from unittest import mock
+
+from requests.exceptions import HTTPError, ReadTimeout
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from webstories import Story
+
+from tests.utils import StubServer
+from wagtail_webstories.metadata import StoryMetadata, read_story_metadata
+from wagtail_webstories.models import ExternalStory, ExternalStoryFetchFailure
+
+STORY_HEAD = """<!doctype html>
+<html ⚡>
+    <head>
+        <title>not the story title</title>
+        <style amp-custom>amp-story { font-family: "Comic Sans MS"; }</style>
+    </head>
+    <body>
+        <amp-story standalone title="Wagtail spotting &amp; more" publisher="Torchbox"
+            publisher-logo-src="/torchbox.png" poster-portrait-src="/wagtails.jpg">
+"""
+
+STORY_PAGE = """
+            <amp-story-page id="page-%d">
+                <amp-story-grid-layer template="vertical"><p>%s</p></amp-story-grid-layer>
+            </amp-story-page>
+"""
+
+STORY_FOOT = """
+        </amp-story>
+    </body>
+</html>"""
+
+
+class FakeResponse:
+    def __init__(self, chunks, encoding='utf-8'):
+        self.chunks = chunks
+        self.encoding = encoding
+        self.chunks_read = 0
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            self.chunks_read += 1
+            yield chunk
+
+
+class TestReadStoryMetadata(SimpleTestCase):
+    def test_stops_at_story_tag(self):
+        head = STORY_HEAD.encode('utf-8')
+        response = FakeResponse(
+            # split the tag across chunks
+            [head[:300], head[300:]]
+            + [(STORY_PAGE % (i, 'x' * 1000)).encode('utf-8') for i in range(100)]
+            + [STORY_FOOT.encode('utf-8')]
+        )
+
+        metadata, bytes_read = read_story_metadata(response, max_bytes=100000)
+        self.assertEqual(metadata, StoryMetadata(
+            title="Wagtail spotting & more",
+            publisher="Torchbox",
+            publisher_logo_src="/torchbox.png",
+            poster_portrait_src="/wagtails.jpg",
+            poster_square_src=None,
+            poster_landscape_src=None,
+        ))
+        self.assertEqual(response.chunks_read, 2)
+        self.assertEqual(bytes_read, len(head))
+
+    def test_multibyte_characters_across_chunks(self):
+        head = STORY_HEAD.replace("Wagtail spotting", "Bachstelzen über Zürich").encode('utf-8')
+        split = head.index('ü'.encode('utf-8')) + 1
+        metadata, bytes_read = read_story_metadata(FakeResponse([head[:split], head[split:]]), max_bytes=100000)
+        self.assertEqual(metadata.title, "Bachstelzen über Zürich & more")
+
+    def test_max_bytes(self):
+        response = FakeResponse([b'<html><head><style>' + b'x' * 1000 + b'</style>'] * 10)
+        with self.assertRaises(Story.InvalidStoryException):
+            read_story_metadata(response, max_bytes=5000)
+        self.assertEqual(response.chunks_read, 5)
+
+    def test_fall_back_to_full_parse(self):
+        response = FakeResponse([b'<html><body><p>Not a story</p></body></html>'])
+        with self.assertRaises(Story.InvalidStoryException):
+            read_story_metadata(response, max_bytes=5000)
+
+
+class TestExternalStoryMetadataFetch(TestCase):
+    def test_fetch_large_story(self):
+        # a story larger than MAX_BYTES can be fetched, as we stop reading after the <amp-story> tag
+        body = (
+            STORY_HEAD + ''.join(STORY_PAGE % (i, 'x' * 10000) for i in range(20)) + STORY_FOOT
+        ).encode('utf-8')
+        with override_settings(WAGTAIL_WEBSTORIES_METADATA_FETCH={'MAX_BYTES': 100000}):
+            with StubServer({'/story.html': (200, {'Content-Type': 'text/html; charset=utf-8'}, body)}) as server:
+                story = ExternalStory.get_for_url(server.url('/story.html'))
+
+        self.assertEqual(story.title, "Wagtail spotting & more")
+        self.assertEqual(story.publisher_logo_src, server.url('/torchbox.png'))
+        self.assertEqual(story.poster_portrait_src, server.url('/wagtails.jpg'))
+
+    @override_settings(WAGTAIL_WEBSTORIES_METADATA_FETCH={'READ_TIMEOUT': 0.1})
+    def test_read_timeout(self):
+        body = (STORY_HEAD + STORY_FOOT).encode('utf-8')
+        with StubServer({'/story.html': (200, {'Content-Type': 'text/html'}, body)}, delay=0.5) as server:
+            with self.assertRaises(ReadTimeout):
+                ExternalStory.get_for_url(server.url('/story.html'))
+        self.assertFalse(ExternalStory.objects.exists())
+
+    def test_error_page_is_not_parsed(self):
+        body = b'<html><body>' + b'x' * 200000 + b'</body></html>'
+        with StubServer({'/story.html': (500, {'Content-Type': 'text/html'}, body)}) as server:
+            with mock.patch('wagtail_webstories.models.read_story_metadata') as read_story_metadata:
+                with self.assertRaises(HTTPError):
+                    ExternalStory.get_for_url(server.url('/story.html'))
+        read_story_metadata.assert_not_called()
+        failure = ExternalStoryFetchFailure.objects.get()
+        self.assertEqual(failure.status_code, 500)
+        self.assertEqual(failure.error_class, 'HTTPError')
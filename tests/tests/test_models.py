@@ -1,17 +1,41 @@
 import responses
 import shutil
+import threading
+import unittest
 
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from requests.exceptions import HTTPError
+from responses import matchers
 
 from wagtail.models import Site
     
 from wagtail.images.models import Image
 from wagtailmedia.models import Media
 
-from tests.models import StoryPage
-from tests.utils import get_test_image_buffer, get_test_image_file, TEST_MEDIA_DIR
-from wagtail_webstories.models import ExternalStory
+from tests.models import StoredRenditionURLsStoryPage, StoryPage
+from tests.utils import get_test_image_buffer, get_test_image_file, StubServer, TEST_MEDIA_DIR
+from wagtail_webstories import models as webstories_models
+from wagtail_webstories.cache import fetch_lock, get_fetch_lock_config
+from wagtail_webstories.blocks import ExternalStoryBlock
+from wagtail_webstories.models import (
+    ExternalStory, ExternalStoryFetchFailure, FetchFailedRecently, LazyExternalStory, MediaFileHash
+)
+from wagtail_webstories.tasks import fetch_external_story
+
+try:
+    import lxml
+except ImportError:  # pragma: no cover
+    lxml = None
 
 
 class TestStoryPage(TestCase):
@@ -107,6 +131,25 @@ class TestStoryPage(TestCase):
         self.assertNotContains(response, 'data-wagtail-media-id')
         self.assertContains(response, 'src="http://media.example.com/media/media/wagtail-in-flight.webm"')
 
+    def test_render_pages(self):
+        story_page = StoryPage(
+            title="Wagtail spotting",
+            slug="wagtail-spotting",
+            publisher="Torchbox",
+            publisher_logo_src_original="https://example.com/torchbox.png",
+            poster_portrait_src_original="https://example.com/wagtails.jpg",
+        )
+        story_page.pages = self.page_data
+        self.home.add_child(instance=story_page)
+
+        pages_html = story_page.render_pages()
+        self.assertEqual(len(pages_html), 3)
+        self.assertIn('<h1>Wagtail spotting</h1>', pages_html[0])
+        self.assertIn(
+            'src="http://media.example.com/media/images/mountain-wagtail.original.png"', pages_html[1]
+        )
+        self.assertIn('src="http://media.example.com/media/media/wagtail-in-flight.webm"', pages_html[2])
+
     def test_create_with_local_images(self):
         logo = Image.objects.create(
             title="logo",
@@ -133,6 +176,96 @@ class TestStoryPage(TestCase):
         self.assertTrue(story_page.publisher_logo_src.startswith('http://media.example.com/media/images/'))
         self.assertTrue(story_page.poster_portrait_src.startswith('http://media.example.com/media/images/'))
 
+        # renditions are cached on the instance (the site root paths used for the page URL are
+        # looked up separately, so are looked up first)
+        story_page.full_url
+        with self.assertNumQueries(0):
+            story_page.linked_data
+
+    def test_store_rendition_urls(self):
+        logo = Image.objects.create(
+            title="logo",
+            file=get_test_image_file(colour='white'),
+        )
+        poster = Image.objects.create(
+            title="poster",
+            file=get_test_image_file(colour='white'),
+        )
+
+        story_page = StoredRenditionURLsStoryPage(
+            title="Wagtail spotting",
+            slug="wagtail-spotting",
+            publisher="Torchbox",
+            publisher_logo=logo,
+            poster_image=poster,
+        )
+        story_page.pages = self.page_data
+        self.home.add_child(instance=story_page)
+
+        story_page = StoredRenditionURLsStoryPage.objects.get(id=story_page.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(story_page.publisher_logo_src.startswith('http://media.example.com/media/images/'))
+            self.assertTrue(story_page.poster_portrait_src.startswith('http://media.example.com/media/images/'))
+            self.assertTrue(story_page.poster_square_src.startswith('http://media.example.com/media/images/'))
+            self.assertTrue(story_page.poster_landscape_src.startswith('http://media.example.com/media/images/'))
+
+        # saves that leave the images unchanged do not regenerate the renditions
+        with mock.patch.object(StoredRenditionURLsStoryPage, 'refresh_rendition_urls') as refresh_rendition_urls:
+            story_page.title = "Advanced wagtail spotting"
+            story_page.save(update_fields=['title'])
+            story_page.save()
+        refresh_rendition_urls.assert_not_called()
+
+        # stored URLs are ignored if the image is changed before saving
+        story_page.poster_image = None
+        self.assertEqual(story_page.poster_portrait_src, '')
+
+        # a missing image file does not prevent saving
+        broken_poster = Image.objects.create(title="broken", file=get_test_image_file(colour='red'))
+        broken_poster.file.storage.delete(broken_poster.file.name)
+        # make sure no rendition is served from Wagtail's rendition cache
+        cache.clear()
+        story_page.poster_image = broken_poster
+        with self.assertLogs('wagtail_webstories.models', level='WARNING'):
+            story_page.save(update_fields=['poster_image'])
+        self.assertEqual(StoredRenditionURLsStoryPage.objects.get(id=story_page.id).rendition_urls, {})
+
+    def test_stored_rendition_urls_discarded_on_image_change(self):
+        # make sure renditions are created in the database rather than served from Wagtail's cache
+        cache.clear()
+        logo = Image.objects.create(title="logo", file=get_test_image_file(colour='white'))
+        poster = Image.objects.create(title="poster", file=get_test_image_file(colour='white'))
+        story_page = StoredRenditionURLsStoryPage(
+            title="Wagtail spotting",
+            slug="wagtail-spotting",
+            publisher="Torchbox",
+            publisher_logo=logo,
+            poster_image=poster,
+        )
+        story_page.pages = self.page_data
+        self.home.add_child(instance=story_page)
+        old_poster_url = StoredRenditionURLsStoryPage.objects.get(id=story_page.id).poster_portrait_src
+
+        # replacing the image file deletes its renditions, so the stored URLs would 404
+        poster.file = get_test_image_file(filename='pied-wagtail.png', colour='black')
+        poster.save()
+        poster.renditions.all().delete()
+        story_page = StoredRenditionURLsStoryPage.objects.get(id=story_page.id)
+        self.assertEqual(story_page.rendition_urls, {})
+        self.assertIn('pied-wagtail', story_page.poster_portrait_src)
+        self.assertNotEqual(story_page.poster_portrait_src, old_poster_url)
+
+        # the URLs are recorded again on the next save
+        story_page.save()
+        self.assertIn('pied-wagtail', StoredRenditionURLsStoryPage.objects.get(id=story_page.id).rendition_urls['poster_portrait'])
+
+        # as they are when a rendition is deleted, such as on changing the focal point
+        logo.renditions.all().delete()
+        self.assertEqual(StoredRenditionURLsStoryPage.objects.get(id=story_page.id).rendition_urls, {})
+
+    def test_rendition_urls_not_stored_without_mixin(self):
+        self.assertFalse(any(field.name == 'rendition_urls' for field in StoryPage._meta.get_fields()))
+
     @responses.activate
     def test_import_images(self):
         story_page = StoryPage(
@@ -253,6 +386,192 @@ class TestStoryPage(TestCase):
         self.assertEqual(new_story_page.publisher_logo, logo)
         self.assertEqual(new_story_page.poster_image, poster)
 
+    def add_content_asset_responses(self):
+        responses.add(
+            responses.GET, 'https://example.com/pied-wagtail.jpg', content_type='image/jpeg',
+            body=get_test_image_buffer(colour='yellow', format='JPEG', size=(320, 240)).getvalue()
+        )
+        responses.add(responses.GET, 'https://example.com/broken.jpg', body=HTTPError('not found'))
+        responses.add(
+            responses.GET, 'https://example.com/wagtail-poster.png', content_type='image/png',
+            body=get_test_image_buffer(colour='yellow', size=(600, 800)).getvalue()
+        )
+        responses.add(
+            responses.GET, 'https://example.com/wagtail-in-flight.mp4', content_type='video/mp4',
+            body="pretend this is a video"
+        )
+        responses.add(responses.GET, 'https://example.com/broken.mp4', body=HTTPError('not found'))
+
+    @responses.activate
+    def test_import_assets(self):
+        story_page = StoryPage(
+            title="Wagtail spotting",
+            slug="wagtail-spotting",
+            publisher="Torchbox",
+            publisher_logo=self.mountain_wagtail,
+            poster_image=self.mountain_wagtail,
+            original_url="https://example.com/stories/wagtail-spotting.html",
+        )
+        story_page.pages = self.page_data
+        self.home.add_child(instance=story_page)
+        story_page.refresh_from_db()
+        cover_html = story_page.pages[0].value['html'].source
+        self.add_content_asset_responses()
+
+        with mock.patch.object(
+            webstories_models, 'parse_page_html', wraps=webstories_models.parse_page_html
+        ) as parse_page_html:
+            self.assertTrue(story_page.import_assets())
+        # each page is parsed exactly once
+        self.assertEqual(parse_page_html.call_count, 3)
+
+        # pages without assets to import are left untouched
+        self.assertIs(story_page.pages[0].value['html'].source, cover_html)
+
+        page_1_photo = Image.objects.get(title="A pied wagtail")
+        self.assertIn('data-wagtail-image-id="%d"' % page_1_photo.id, story_page.pages[1].value['html'].source)
+        page_2_video = Media.objects.get(file='media/wagtail-in-flight.mp4')
+        self.assertIn('data-wagtail-media-id="%d"' % page_2_video.id, story_page.pages[2].value['html'].source)
+
+        # a repeated import is a no-op
+        self.assertFalse(story_page.import_assets())
+        self.assertFalse(story_page.import_images())
+        self.assertFalse(story_page.import_videos())
+
+    @responses.activate
+    def test_import_images_resolves_existing_images_together(self):
+        story_page = StoryPage(
+            title="Wagtail spotting",
+            slug="wagtail-spotting",
+            publisher="Torchbox",
+            publisher_logo_src_original="https://example.com/torchbox.png",
+            poster_image=self.mountain_wagtail,
+            original_url="https://example.com/stories/wagtail-spotting.html",
+        )
+        story_page.pages = self.page_data
+        self.home.add_child(instance=story_page)
+        self.add_content_asset_responses()
+        logo_data = get_test_image_buffer(colour='purple', size=(64, 64)).getvalue()
+        responses.add(responses.GET, 'https://example.com/torchbox.png', content_type='image/png', body=logo_data)
+
+        # the logo already exists in the image library
+        existing_logo = Image.objects.create(
+            title="Torchbox", file=get_test_image_file(filename='torchbox.png', colour='purple', size=(64, 64))
+        )
+        existing_logo.get_file_hash()
+        image_count = Image.objects.count()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(story_page.import_images())
+        hash_lookups = [query for query in queries if '"file_hash" IN' in query['sql']]
+        self.assertEqual(len(hash_lookups), 1)
+
+        self.assertEqual(story_page.publisher_logo, existing_logo)
+        # only the pied wagtail is new
+        self.assertEqual(Image.objects.count(), image_count + 1)
+        pied_wagtail = Image.objects.get(title="A pied wagtail")
+        self.assertEqual(len(pied_wagtail.file_hash), 40)
+        self.assertEqual(pied_wagtail.file_size, pied_wagtail.file.size)
+
+    @responses.activate
+    def test_import_videos_deduplicates(self):
+        self.add_content_asset_responses()
+        responses.add(
+            responses.GET, 'https://example.com/stories/wagtail-in-flight-copy.mp4', content_type='video/mp4',
+            body="pretend this is a video"
+        )
+
+        story_page = StoryPage(
+            title="Wagtail spotting",
+            slug="wagtail-spotting",
+            publisher="Torchbox",
+            publisher_logo=self.mountain_wagtail,
+            poster_image=self.mountain_wagtail,
+            original_url="https://example.com/stories/wagtail-spotting.html",
+        )
+        story_page.pages = self.page_data
+        self.home.add_child(instance=story_page)
+        self.assertTrue(story_page.import_videos())
+        video = Media.objects.get(file='media/wagtail-in-flight.mp4')
+        media_count = Media.objects.count()
+
+        # a second story with the same video content at a different URL reuses the media item
+        other_story_page = StoryPage(
+            title="More wagtail spotting",
+            slug="more-wagtail-spotting",
+            publisher="Torchbox",
+            publisher_logo=self.mountain_wagtail,
+            poster_image=self.mountain_wagtail,
+            original_url="https://example.com/stories/more-wagtail-spotting.html",
+        )
+        other_story_page.pages = [
+            ('page', {
+                'id': 'page-1',
+                'html': """
+                    <amp-story-page id="page-1">
+                        <amp-story-grid-layer template="vertical">
+                            <amp-video src="wagtail-in-flight-copy.mp4" width="600" height="800"></amp-video>
+                        </amp-story-grid-layer>
+                    </amp-story-page>
+                """
+            }),
+        ]
+        self.home.add_child(instance=other_story_page)
+        self.assertTrue(other_story_page.import_videos())
+
+        self.assertEqual(Media.objects.count(), media_count)
+        self.assertIn(
+            'data-wagtail-media-id="%d"' % video.id, other_story_page.pages[0].value['html'].source
+        )
+
+        # editing the media item's details keeps the recorded hash
+        video = Media.objects.get(id=video.id)
+        video.title = "A wagtail in flight"
+        video.save()
+        self.assertTrue(MediaFileHash.objects.filter(media_id=video.id).exists())
+
+        # replacing the file discards it
+        video.file = get_test_image_file(filename='another-wagtail.webm', colour='red')
+        video.save()
+        self.assertFalse(MediaFileHash.objects.filter(media_id=video.id).exists())
+
+    @unittest.skipUnless(lxml, "lxml is not installed")
+    @override_settings(WAGTAIL_WEBSTORIES_IMPORT_HTML_PARSER='lxml')
+    @responses.activate
+    def test_import_assets_with_lxml(self):
+        story_page = StoryPage(
+            title="Wagtail spotting",
+            slug="wagtail-spotting",
+            publisher="Torchbox",
+            publisher_logo=self.mountain_wagtail,
+            poster_image=self.mountain_wagtail,
+            original_url="https://example.com/stories/wagtail-spotting.html",
+        )
+        story_page.pages = self.page_data
+        self.home.add_child(instance=story_page)
+        self.add_content_asset_responses()
+
+        self.assertTrue(story_page.import_assets())
+
+        page_1_html = story_page.pages[1].value['html'].source
+        page_1_photo = Image.objects.get(title="A pied wagtail")
+        self.assertIn('data-wagtail-image-id="%d"' % page_1_photo.id, page_1_html)
+        # the fragment is not wrapped in html / body elements
+        self.assertTrue(page_1_html.strip().startswith('<amp-story-page id="page-1">'))
+        self.assertNotIn('<body>', page_1_html)
+
+
+MINIMAL_STORY = """<!doctype html>
+<html ⚡>
+    <head><title>not the story title</title></head>
+    <body>
+        <amp-story standalone title="%s" publisher="Torchbox"
+            publisher-logo-src="/torchbox.png" poster-portrait-src="/wagtails.jpg">
+            <amp-story-page id="cover"></amp-story-page>
+        </amp-story>
+    </body>
+</html>"""
+
 
 class TestExternalStory(TestCase):
     @responses.activate
@@ -303,3 +622,273 @@ class TestExternalStory(TestCase):
         story2 = ExternalStory.get_for_url('https://example.com/good-story.html')
         self.assertEqual(len(responses.calls), 1)
         self.assertEqual(story, story2)
+
+    @responses.activate
+    def test_conditional_refresh(self):
+        responses.add(
+            responses.GET, 'https://example.com/good-story.html', content_type='text/html',
+            body=MINIMAL_STORY % "Wagtail spotting",
+            headers={'ETag': '"v1"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'},
+        )
+        story = ExternalStory.get_for_url('https://example.com/good-story.html')
+        self.assertEqual(story.etag, '"v1"')
+        self.assertEqual(story.last_modified, 'Wed, 21 Oct 2015 07:28:00 GMT')
+
+        ExternalStory.objects.filter(id=story.id).update(last_fetched_at=timezone.now() - timedelta(days=1))
+        story.refresh_from_db()
+        responses.replace(
+            responses.GET, 'https://example.com/good-story.html', status=304,
+            match=[matchers.header_matcher({
+                'If-None-Match': '"v1"',
+                'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT',
+            })],
+        )
+        story.refresh()
+        self.assertEqual(story.title, "Wagtail spotting")
+        self.assertGreater(story.last_fetched_at, timezone.now() - timedelta(minutes=1))
+
+    @override_settings(WAGTAIL_WEBSTORIES_EXTERNAL_STORY_TTL=3600)
+    @responses.activate
+    def test_stale_while_revalidate(self):
+        responses.add(
+            responses.GET, 'https://example.com/good-story.html', content_type='text/html',
+            body=MINIMAL_STORY % "Wagtail spotting",
+        )
+        story = ExternalStory.get_for_url('https://example.com/good-story.html')
+
+        # a recently-fetched story is not refreshed
+        self.assertTrue(LazyExternalStory('https://example.com/good-story.html').is_ready)
+        self.assertEqual(len(responses.calls), 1)
+
+        ExternalStory.objects.filter(id=story.id).update(last_fetched_at=timezone.now() - timedelta(hours=2))
+        responses.replace(
+            responses.GET, 'https://example.com/good-story.html', content_type='text/html',
+            body=MINIMAL_STORY % "Advanced wagtail spotting",
+        )
+
+        # the stale story is served, and a refresh is queued
+        lazy_story = LazyExternalStory('https://example.com/good-story.html')
+        self.assertEqual(lazy_story.title, "Wagtail spotting")
+        self.assertEqual(len(responses.calls), 2)
+        story.refresh_from_db()
+        self.assertEqual(story.title, "Advanced wagtail spotting")
+
+    @responses.activate
+    def test_refresh_command(self):
+        for name in ['old', 'new', 'broken']:
+            responses.add(
+                responses.GET, 'https://example.com/%s-story.html' % name, content_type='text/html',
+                body=MINIMAL_STORY % name.title(),
+            )
+            ExternalStory.get_for_url('https://example.com/%s-story.html' % name)
+
+        ExternalStory.objects.filter(url='https://example.com/old-story.html').update(
+            last_fetched_at=timezone.now() - timedelta(days=2)
+        )
+        ExternalStory.objects.filter(url='https://example.com/broken-story.html').update(
+            last_fetched_at=timezone.now() - timedelta(days=1)
+        )
+        responses.replace(
+            responses.GET, 'https://example.com/old-story.html', content_type='text/html',
+            body=MINIMAL_STORY % "Refreshed",
+        )
+        responses.replace(
+            responses.GET, 'https://example.com/broken-story.html', body=HTTPError("Something went wrong")
+        )
+
+        with self.assertLogs('wagtail_webstories.tasks', level='WARNING'):
+            call_command('refresh_external_stories', limit=2, workers=1, verbosity=0)
+        self.assertEqual(ExternalStory.objects.get(url='https://example.com/old-story.html').title, "Refreshed")
+        self.assertEqual(ExternalStory.objects.get(url='https://example.com/broken-story.html').title, "Broken")
+        # the most recently fetched story is not refreshed
+        self.assertEqual(len(responses.calls), 5)
+
+
+class TestExternalStorySingleFlight(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def get_concurrently(self, url, count=4):
+        results = [None] * count
+        errors = []
+
+        def get_for_url(i):
+            try:
+                results[i] = ExternalStory.get_for_url(url)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=get_for_url, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_concurrent_misses_fetch_once(self):
+        story_response = (200, {'Content-Type': 'text/html'}, (MINIMAL_STORY % "Wagtail spotting").encode('utf-8'))
+        with StubServer({'/story.html': story_response}, delay=0.5) as server:
+            results, errors = self.get_concurrently(server.url('/story.html'))
+
+        self.assertEqual(errors, [])
+        self.assertEqual(server.requested_paths, ['/story.html'])
+        self.assertEqual(ExternalStory.objects.count(), 1)
+        self.assertEqual({story.pk for story in results}, {ExternalStory.objects.get().pk})
+        self.assertEqual(results[0].title, "Wagtail spotting")
+
+    def test_failed_fetch_is_not_repeated_by_waiting_worker(self):
+        with StubServer({}, delay=0.2) as server:
+            results, errors = self.get_concurrently(server.url('/missing.html'), count=2)
+
+        # the waiting worker sees the recorded failure once the first worker's fetch has failed
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(
+            sorted(type(error).__name__ for error in errors), ['FetchFailedRecently', 'HTTPError']
+        )
+        self.assertEqual(server.requested_paths, ['/missing.html'])
+
+    @override_settings(WAGTAIL_WEBSTORIES_FETCH_LOCK={'WAIT': 0.2, 'POLL_INTERVAL': 0.05})
+    def test_wait_timeout(self):
+        story_response = (200, {'Content-Type': 'text/html'}, (MINIMAL_STORY % "Wagtail spotting").encode('utf-8'))
+        with StubServer({'/story.html': story_response}) as server:
+            url = server.url('/story.html')
+            # simulate a fetch by another process that never completes
+            with fetch_lock(ExternalStory.get_url_hash(url)):
+                with self.assertLogs('wagtail_webstories.models', level='WARNING'):
+                    story = ExternalStory.get_for_url(url)
+
+        self.assertEqual(story.title, "Wagtail spotting")
+        self.assertEqual(server.requested_paths, ['/story.html'])
+
+    def test_background_fetch_skips_locked_url(self):
+        with StubServer({}) as server:
+            url = server.url('/story.html')
+            with fetch_lock(ExternalStory.get_url_hash(url)):
+                self.assertTrue(fetch_external_story(url))
+
+        self.assertEqual(server.requested_paths, [])
+
+    def test_lock_timeout_outlives_fetch(self):
+        # the default lock timeout follows the fetch timeouts, so a slow fetch keeps its lock
+        self.assertGreater(get_fetch_lock_config()['TIMEOUT'], 10 + 30)
+        with override_settings(WAGTAIL_WEBSTORIES_METADATA_FETCH={'CONNECT_TIMEOUT': 20, 'READ_TIMEOUT': 120}):
+            self.assertGreater(get_fetch_lock_config()['TIMEOUT'], 20 + 120)
+        with override_settings(WAGTAIL_WEBSTORIES_FETCH_LOCK={'TIMEOUT': 300}):
+            self.assertEqual(get_fetch_lock_config()['TIMEOUT'], 300)
+
+
+class TestExternalStoryFetchFailure(TestCase):
+    url = 'https://example.com/broken-story.html'
+
+    def expire_failure(self):
+        ExternalStoryFetchFailure.objects.update(retry_after=timezone.now() - timedelta(seconds=1))
+
+    @responses.activate
+    def test_backoff(self):
+        responses.add(responses.GET, self.url, status=404, body="Not found")
+
+        with self.assertRaises(HTTPError):
+            ExternalStory.get_for_url(self.url)
+        failure = ExternalStoryFetchFailure.objects.get()
+        self.assertEqual(failure.url, self.url)
+        self.assertEqual(failure.status_code, 404)
+        self.assertEqual(failure.error_class, 'HTTPError')
+        self.assertEqual(failure.failure_count, 1)
+        self.assertAlmostEqual(
+            (failure.retry_after - failure.last_failed_at).total_seconds(), 60, delta=1
+        )
+
+        # further lookups fail without making a request
+        with self.assertRaises(FetchFailedRecently):
+            ExternalStory.get_for_url(self.url)
+        self.assertEqual(len(responses.calls), 1)
+
+        # once retry_after has passed, the fetch is retried, and the wait doubles on failure
+        self.expire_failure()
+        responses.replace(responses.GET, self.url, body=HTTPError("Connection refused"))
+        with self.assertRaises(HTTPError):
+            ExternalStory.get_for_url(self.url)
+        failure = ExternalStoryFetchFailure.objects.get()
+        self.assertEqual(failure.failure_count, 2)
+        self.assertIsNone(failure.status_code)
+        self.assertEqual(failure.error_class, 'HTTPError')
+        self.assertAlmostEqual(
+            (failure.retry_after - failure.last_failed_at).total_seconds(), 120, delta=1
+        )
+
+        # a successful fetch clears the failure
+        self.expire_failure()
+        responses.replace(
+            responses.GET, self.url, content_type='text/html', body=MINIMAL_STORY % "Fixed"
+        )
+        self.assertEqual(ExternalStory.get_for_url(self.url).title, "Fixed")
+        self.assertFalse(ExternalStoryFetchFailure.objects.exists())
+
+    @override_settings(WAGTAIL_WEBSTORIES_FETCH_BACKOFF={'BASE': 10, 'MAX': 30})
+    def test_max_backoff(self):
+        for i in range(4):
+            failure = ExternalStoryFetchFailure.record(self.url, HTTPError("Connection refused"))
+        self.assertEqual(failure.failure_count, 4)
+        self.assertAlmostEqual(
+            (failure.retry_after - failure.last_failed_at).total_seconds(), 30, delta=1
+        )
+
+    @responses.activate
+    def test_block_clean(self):
+        ExternalStoryFetchFailure.record(self.url, HTTPError("Connection refused"))
+        with self.assertRaisesRegex(ValidationError, "It will be retried in"):
+            ExternalStoryBlock().clean(self.url)
+        self.assertEqual(len(responses.calls), 0)
+
+    @responses.activate
+    def test_background_fetch(self):
+        ExternalStoryFetchFailure.record(self.url, HTTPError("Connection refused"))
+        self.assertFalse(fetch_external_story(self.url))
+        self.assertEqual(len(responses.calls), 0)
+
+    def test_admin_list(self):
+        User.objects.create_superuser(username='admin', email='admin@example.com', password='12345')
+        self.client.login(username='admin', password='12345')
+        failure = ExternalStoryFetchFailure.record(self.url, HTTPError("Connection refused"))
+
+        response = self.client.get('/admin/webstories/external-stories/failing/')
+        self.assertContains(response, self.url)
+        self.assertContains(response, "HTTPError")
+
+        with mock.patch('wagtail_webstories.views.queue_external_story_fetches') as queue_fetches:
+            response = self.client.post(
+                '/admin/webstories/external-stories/failing/', {'failure_id': failure.id}
+            )
+        self.assertRedirects(response, '/admin/webstories/external-stories/failing/')
+        queue_fetches.assert_called_once_with([self.url])
+        self.assertFalse(ExternalStoryFetchFailure.objects.exists())
+
+        response = self.client.post('/admin/webstories/external-stories/failing/', {'failure_id': 'nope'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_admin_permissions(self):
+        user = User.objects.create_user(username='moderator', email='moderator@example.com', password='12345')
+        user.user_permissions.add(Permission.objects.get(codename='access_admin'))
+        self.client.login(username='moderator', password='12345')
+        failure = ExternalStoryFetchFailure.record(self.url, HTTPError("Connection refused"))
+
+        response = self.client.get('/admin/webstories/external-stories/failing/')
+        self.assertRedirects(response, '/admin/')
+        # the report is not listed in the admin menu
+        self.assertNotContains(self.client.get('/admin/'), 'Failing external stories')
+
+        # viewing the report does not allow retrying
+        user.user_permissions.add(Permission.objects.get(codename='view_externalstoryfetchfailure'))
+        response = self.client.get('/admin/webstories/external-stories/failing/')
+        self.assertContains(response, self.url)
+        self.assertContains(self.client.get('/admin/'), 'Failing external stories')
+
+        with mock.patch('wagtail_webstories.views.queue_external_story_fetches') as queue_fetches:
+            response = self.client.post(
+                '/admin/webstories/external-stories/failing/', {'failure_id': failure.id}
+            )
+        self.assertRedirects(response, '/admin/')
+        queue_fetches.assert_not_called()
+        self.assertTrue(ExternalStoryFetchFailure.objects.exists())
@@ -0,0 +1,96 @@
+import shutil
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from wagtail.images.models import Image
+from wagtail.models import Site
+
+from tests.models import StoryPage
+from tests.utils import get_test_image_file, TEST_MEDIA_DIR
+from wagtail_webstories.cache import render_cache_stats
+
+
+@override_settings(WAGTAIL_WEBSTORIES_RENDER_CACHE={'ALIAS': 'default', 'TIMEOUT': 60})
+class TestRenderCache(TestCase):
+    def setUp(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+        cache.clear()
+        render_cache_stats.clear()
+        self.home = Site.objects.get().root_page
+
+        self.image = Image.objects.create(
+            title="Mountain wagtail",
+            file=get_test_image_file(filename='mountain-wagtail.png', colour='grey'),
+        )
+        self.story_page = StoryPage(
+            title="Wagtail spotting",
+            slug="wagtail-spotting",
+            publisher="Torchbox",
+            publisher_logo_src_original="https://example.com/torchbox.png",
+            poster_portrait_src_original="https://example.com/wagtails.jpg",
+        )
+        self.story_page.pages = [
+            ('page', {
+                'id': 'cover',
+                'html': """
+                    <amp-story-page id="cover">
+                        <amp-story-grid-layer template="vertical">
+                            <amp-img data-wagtail-image-id="%d" alt="A mountain wagtail">
+                            </amp-img>
+                        </amp-story-grid-layer>
+                    </amp-story-page>
+                """ % self.image.id
+            }),
+        ]
+        self.home.add_child(instance=self.story_page)
+
+        # generate renditions up front, as creating them invalidates the cache
+        self.client.get('/wagtail-spotting/')
+        render_cache_stats.clear()
+
+    def tearDown(self):
+        shutil.rmtree(TEST_MEDIA_DIR, ignore_errors=True)
+
+    def test_cache_hit(self):
+        response = self.client.get('/wagtail-spotting/')
+        self.assertContains(response, 'mountain-wagtail.original.png')
+        self.assertEqual(render_cache_stats['misses'], 1)
+
+        response = self.client.get('/wagtail-spotting/')
+        self.assertContains(response, 'mountain-wagtail.original.png')
+        self.assertEqual(render_cache_stats['hits'], 1)
+        self.assertEqual(render_cache_stats['misses'], 1)
+
+    def test_invalidate_on_image_change(self):
+        self.client.get('/wagtail-spotting/')
+        # replace the image file in the same way as the Wagtail admin does
+        self.image.file = get_test_image_file(filename='pied-wagtail.png', colour='white')
+        self.image.save()
+        self.image.renditions.all().delete()
+
+        response = self.client.get('/wagtail-spotting/')
+        self.assertContains(response, 'pied-wagtail')
+        self.assertNotContains(response, 'mountain-wagtail.original.png')
+        self.assertEqual(render_cache_stats['hits'], 0)
+
+    def test_invalidate_on_image_delete(self):
+        self.client.get('/wagtail-spotting/')
+        self.image.delete()
+
+        response = self.client.get('/wagtail-spotting/')
+        self.assertNotContains(response, 'mountain-wagtail.original.png')
+        self.assertEqual(render_cache_stats['hits'], 0)
+
+    def test_unsaved_changes_not_served_from_cache(self):
+        self.client.get('/wagtail-spotting/')
+        self.story_page.pages[0].value['html'].source = "<amp-story-page id=\"cover\">Changed</amp-story-page>"
+        pages_html = self.story_page.render_pages()
+        self.assertIn('Changed', pages_html[0])
+
+    @override_settings(WAGTAIL_WEBSTORIES_RENDER_CACHE=None)
+    def test_disabled(self):
+        self.client.get('/wagtail-spotting/')
+        self.client.get('/wagtail-spotting/')
+        self.assertEqual(render_cache_stats['hits'], 0)
+        self.assertEqual(render_cache_stats['misses'], 0)
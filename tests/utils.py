@@ -1,5 +1,8 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from io import BytesIO
 import os.path
+import threading
+import time
 
 from django.conf import settings
 from django.core.files.images import ImageFile
@@ -20,3 +23,48 @@ def get_test_image_buffer(format='PNG', colour='white', size=(640, 480)):
 def get_test_image_file(filename='test.png', **kwargs):
     f = get_test_image_buffer(**kwargs)
     return ImageFile(f, name=filename)
+
+
+class StubServer:
+    """
+    An HTTP server on a local port, run on a background thread while used as a context manager.
+    `responses` is a dict mapping paths to (status, headers, body) tuples, and each response is
+    delayed by `delay` seconds. The paths requested are recorded in `requested_paths`.
+    """
+    def __init__(self, responses, delay=0):
+        self.responses = responses
+        self.delay = delay
+        self.requested_paths = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requested_paths.append(self.path)
+                time.sleep(server.delay)
+                status, headers, body = server.responses.get(self.path, (404, {}, b''))
+                try:
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except ConnectionError:
+                    # the client stopped reading before the end of the response
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d%s' % (self.httpd.server_address[1], path)
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -1,9 +1,20 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import import_story
+from .views import (
+    bulk_import_stories, failing_external_stories, import_job, import_job_status, import_story
+)
 
 
 app_name = 'wagtail_webstories'
 urlpatterns = [
-    path('import/', import_story, name='import_story'),
+    path('external-stories/failing/', failing_external_stories, name='failing_external_stories'),
 ]
+
+if getattr(settings, 'WAGTAIL_WEBSTORIES_IMPORT_MODEL', None):
+    urlpatterns += [
+        path('import/', import_story, name='import_story'),
+        path('import/bulk/', bulk_import_stories, name='bulk_import_stories'),
+        path('import/jobs/<int:job_id>/', import_job, name='import_job'),
+        path('import/jobs/<int:job_id>/status/', import_job_status, name='import_job_status'),
+    ]
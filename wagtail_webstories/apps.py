@@ -6,3 +6,8 @@ class WagtailWebstoriesAppConfig(AppConfig):
     name = "wagtail_webstories"
     verbose_name = "Wagtail Webstories"
     default_auto_field = "django.db.models.AutoField"
+
+    def ready(self):
+        from . import checks  # noqa
+        from .signal_handlers import register_signal_handlers
+        register_signal_handlers()
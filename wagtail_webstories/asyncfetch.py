@@ -0,0 +1,350 @@
+"""
+An asyncio-based engine for fetching external stories and downloading import assets in bulk.
+Requests are made concurrently on a single event loop, with limits on the total number of
+requests in flight and on the number made to any one host.
+
+HTTP requests are made through a transport, specified by the TRANSPORT key of the
+WAGTAIL_WEBSTORIES_ASYNC_FETCH setting or passed to AsyncFetcher. A transport has a coroutine
+method `get(url, headers=None, timeout=None)` returning a response object with `status_code`,
+`headers` and `encoding` attributes, a `raise_for_status()` method, an `iter_content(chunk_size)`
+method returning an async iterator of bytes, and a coroutine method `close()`; and a coroutine
+method `aclose()` to release its resources. Transports raise requests.RequestException on errors.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from urllib.parse import urlparse
+
+import requests
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from webstories import Story
+
+from .cache import acquire_fetch_lock, get_fetch_lock_config, release_fetch_lock
+from .downloads import CHUNK_SIZE, AssetWriter, get_download_settings
+from .instrumentation import measure
+from .metadata import CHUNK_SIZE as METADATA_CHUNK_SIZE, StoryMetadataReader, get_metadata_fetch_settings
+from .tasks import log_fetch_error
+
+DEFAULT_ASYNC_FETCH_SETTINGS = {
+    'TRANSPORT': 'wagtail_webstories.asyncfetch.RequestsTransport',
+    # maximum number of requests in flight at once
+    'CONCURRENCY': 10,
+    # maximum number of requests in flight to a single host
+    'PER_HOST': 2,
+}
+
+
+def get_async_fetch_settings():
+    """
+    Return the settings for the async fetch engine, as defined by the
+    WAGTAIL_WEBSTORIES_ASYNC_FETCH setting merged over DEFAULT_ASYNC_FETCH_SETTINGS
+    """
+    return {
+        **DEFAULT_ASYNC_FETCH_SETTINGS,
+        **getattr(settings, 'WAGTAIL_WEBSTORIES_ASYNC_FETCH', {}),
+    }
+
+
+class _RequestsChunkIterator:
+    def __init__(self, response, chunk_size, executor):
+        self._iterator = response.iter_content(chunk_size=chunk_size)
+        self._executor = executor
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await asyncio.get_running_loop().run_in_executor(self._executor, next, self._iterator, None)
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+
+class RequestsTransportResponse:
+    def __init__(self, response, executor):
+        self._response = response
+        self._executor = executor
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.encoding = response.encoding
+
+    def raise_for_status(self):
+        self._response.raise_for_status()
+
+    def iter_content(self, chunk_size):
+        return _RequestsChunkIterator(self._response, chunk_size, self._executor)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._response.close)
+
+
+class RequestsTransport:
+    """
+    Transport that makes requests through a requests.Session, with the blocking parts of each
+    request run on a thread pool. This is the default, as it needs no additional dependencies.
+    """
+    def __init__(self, max_workers=None):
+        self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or get_async_fetch_settings()['CONCURRENCY'],
+            thread_name_prefix='wagtail_webstories',
+        )
+
+    async def get(self, url, headers=None, timeout=None):
+        response = await asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            partial(self.session.get, url, headers=headers, timeout=timeout, stream=True),
+        )
+        return RequestsTransportResponse(response, self.executor)
+
+    async def aclose(self):
+        self.session.close()
+        self.executor.shutdown(wait=False)
+
+
+class AsyncFetcher:
+    """
+    Fetches external stories and downloads import assets concurrently. The coroutine methods can
+    be awaited from async code; the equivalent sync methods (get_for_url, fetch_many, download and
+    download_many) run them to completion on an event loop, so that an AsyncFetcher can be used in
+    place of an AssetDownloader as a story page's asset_downloader.
+
+    The transport holds resources (for RequestsTransport, a thread pool and connection pool) that
+    are released by `close` / `aclose`, so an AsyncFetcher should be used as a context manager:
+    `with AsyncFetcher() as fetcher` from sync code, or `async with AsyncFetcher() as fetcher`
+    from async code.
+    """
+    def __init__(self, transport=None, concurrency=None, per_host=None):
+        config = get_async_fetch_settings()
+        self.transport = transport or import_string(config['TRANSPORT'])()
+        self.concurrency = concurrency or config['CONCURRENCY']
+        self.per_host = per_host or config['PER_HOST']
+        self._loop = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+    @asynccontextmanager
+    async def _request_slot(self, url):
+        # semaphores belong to an event loop, so start afresh each time we are run on a new one
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._host_semaphores = {}
+
+        host = urlparse(url).netloc
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.per_host)
+
+        # wait on the host limit first, so that we don't hold a slot we cannot use
+        async with self._host_semaphores[host]:
+            async with self._semaphore:
+                yield
+
+    async def afetch(self, url, headers=None):
+        """
+        Async equivalent of ExternalStory.fetch: fetch the story at the given URL, and create or
+        update the ExternalStory record for it. Returns None if the response is a 304 Not Modified.
+        """
+        from .models import ExternalStory
+
+        await sync_to_async(ExternalStory.check_fetch_allowed)(url)
+
+        config = get_metadata_fetch_settings()
+        response = None
+        try:
+            with measure('external_story_fetch', url=url) as measurement:
+                async with self._request_slot(url):
+                    response = await self.transport.get(
+                        url, headers=headers, timeout=(config['CONNECT_TIMEOUT'], config['READ_TIMEOUT'])
+                    )
+                    try:
+                        measurement.set('status', response.status_code)
+                        story = None
+                        if response.status_code != 304:
+                            # record error responses as HTTP errors, rather than parsing the error page
+                            response.raise_for_status()
+                            # only read as far as the <amp-story> tag, which holds all the metadata we need
+                            reader = StoryMetadataReader(response.encoding, config['MAX_BYTES'])
+                            async for chunk in response.iter_content(METADATA_CHUNK_SIZE):
+                                story = reader.feed(chunk)
+                                if story is not None:
+                                    break
+                            else:
+                                story = reader.close()
+                            measurement.set('bytes', reader.bytes_read)
+                    finally:
+                        await response.close()
+        except (requests.exceptions.RequestException, Story.InvalidStoryException) as e:
+            await sync_to_async(ExternalStory.handle_fetch_error)(url, e, response)
+            raise
+
+        return await sync_to_async(ExternalStory.handle_fetch_response)(
+            url, response.status_code, response.headers, story
+        )
+
+    async def arefresh(self, story):
+        """
+        Async equivalent of ExternalStory.refresh: re-fetch the story's metadata with a conditional
+        request, and return the updated ExternalStory
+        """
+        result = await self.afetch(story.url, headers=story.conditional_headers())
+        if result is None:
+            await sync_to_async(story.mark_unchanged)()
+            return story
+        return result
+
+    async def aget_for_url(self, url):
+        """
+        Async equivalent of ExternalStory.get_for_url: return the ExternalStory for the given URL,
+        fetching it if it has not been fetched before. As with get_for_url, only one worker fetches
+        a given story at a time, and others wait for its result.
+        """
+        from .models import ExternalStory
+
+        url_hash = ExternalStory.get_url_hash(url)
+        story = await sync_to_async(ExternalStory.objects.filter(url_hash=url_hash).first)()
+        if story is not None:
+            return story
+
+        config = get_fetch_lock_config()
+        deadline = asyncio.get_running_loop().time() + config['WAIT']
+        while True:
+            story, token = await sync_to_async(ExternalStory.claim_fetch)(url_hash)
+            if story is not None:
+                return story
+            if token is not None:
+                try:
+                    return await self.afetch(url)
+                finally:
+                    await sync_to_async(release_fetch_lock)(url_hash, token)
+
+            if asyncio.get_running_loop().time() >= deadline:
+                ExternalStory.log_wait_timeout(url)
+                return await self.afetch(url)
+            await asyncio.sleep(config['POLL_INTERVAL'])
+
+    async def _afetch_or_refresh(self, url):
+        # async equivalent of tasks.fetch_external_story, returning the result or exception
+        from .models import ExternalStory
+
+        url_hash = ExternalStory.get_url_hash(url)
+        token = await sync_to_async(acquire_fetch_lock)(url_hash)
+        if token is None:
+            # another thread or process is already fetching this story
+            return None
+
+        try:
+            story = await sync_to_async(ExternalStory.objects.filter(url_hash=url_hash).first)()
+            if story is None:
+                return await self.afetch(url)
+            else:
+                return await self.arefresh(story)
+        except (requests.exceptions.RequestException, Story.InvalidStoryException) as e:
+            log_fetch_error(url, e)
+            return e
+        finally:
+            await sync_to_async(release_fetch_lock)(url_hash, token)
+
+    async def afetch_many(self, urls):
+        """
+        Fetch the stories at the given URLs, or refresh them if they have been fetched before.
+        Returns a dict mapping each URL to the resulting ExternalStory, the exception raised while
+        fetching it, or None if it was skipped because another worker was already fetching it.
+        """
+        urls = list(dict.fromkeys(urls))
+        results = await asyncio.gather(*[self._afetch_or_refresh(url) for url in urls])
+        return dict(zip(urls, results))
+
+    async def adownload(self, url):
+        """
+        Async equivalent of AssetDownloader.download: download the given URL to a temporary file,
+        returning a DownloadedAsset
+        """
+        config = get_download_settings()
+        async with self._request_slot(url):
+            response = await self.transport.get(url, timeout=config['TIMEOUT'])
+            try:
+                response.raise_for_status()
+                writer = AssetWriter(url, config['MAX_SIZE'], response.headers.get('Content-Length'))
+                try:
+                    async for chunk in response.iter_content(CHUNK_SIZE):
+                        writer.write(chunk)
+                except BaseException:
+                    writer.discard()
+                    raise
+            finally:
+                await response.close()
+
+        return writer.finish()
+
+    async def _adownload_or_return_exception(self, url):
+        try:
+            return await self.adownload(url)
+        except requests.exceptions.RequestException as e:
+            return e
+
+    async def adownload_many(self, urls):
+        """
+        Async equivalent of AssetDownloader.download_many: download the given URLs concurrently,
+        returning a dict mapping each URL to either a DownloadedAsset or the
+        requests.RequestException raised while downloading it
+        """
+        urls = list(dict.fromkeys(urls))
+        results = await asyncio.gather(*[self._adownload_or_return_exception(url) for url in urls])
+        return dict(zip(urls, results))
+
+    def close(self):
+        async_to_sync(self.aclose)()
+
+    def get_for_url(self, url):
+        return async_to_sync(self.aget_for_url)(url)
+
+    def fetch_many(self, urls):
+        return async_to_sync(self.afetch_many)(urls)
+
+    def download(self, url):
+        return async_to_sync(self.adownload)(url)
+
+    def download_many(self, urls):
+        return async_to_sync(self.adownload_many)(urls)
+
+
+async def aget_for_url(url, **kwargs):
+    """
+    Return the ExternalStory for the given URL, fetching it if necessary, using an AsyncFetcher
+    created with the given keyword arguments
+    """
+    async with AsyncFetcher(**kwargs) as fetcher:
+        return await fetcher.aget_for_url(url)
+
+
+async def afetch_many(urls, **kwargs):
+    """
+    Fetch or refresh the stories at the given URLs concurrently, using an AsyncFetcher created with
+    the given keyword arguments. See AsyncFetcher.afetch_many for the return value.
+    """
+    async with AsyncFetcher(**kwargs) as fetcher:
+        return await fetcher.afetch_many(urls)
+
+
+def fetch_many(urls, **kwargs):
+    """Synchronous version of afetch_many, for calling from outside an event loop"""
+    return async_to_sync(afetch_many)(urls, **kwargs)
@@ -1,19 +1,25 @@
+import copy
+
 import requests
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.timesince import timeuntil
 from django.utils.translation import gettext as _
 
 from wagtail import blocks
 
 from webstories import Story, StoryPage
 
+from .cache import get_or_clean_html
 from .markup import AMPText
 
 
 class AMPCleanHTMLBlock(blocks.RawHTMLBlock):
     def clean(self, value):
         if isinstance(value, AMPText) and getattr(settings, 'WAGTAIL_WEBSTORIES_CLEAN_HTML', True):
-            return AMPText(StoryPage.clean_html_fragment(value.source))
+            return AMPText(get_or_clean_html(value.source, StoryPage.clean_html_fragment))
         else:
             return value
 
@@ -29,6 +35,12 @@ class AMPCleanHTMLBlock(blocks.RawHTMLBlock):
         else:
             return AMPText(value)
 
+    def normalize(self, value):
+        if isinstance(value, AMPText):
+            return value
+        else:
+            return AMPText(value)
+
     def get_prep_value(self, value):
         if isinstance(value, AMPText):
             return value.source
@@ -60,6 +72,28 @@ class StoryChooserBlock(blocks.PageChooserBlock):
 
         super().__init__(**kwargs)
 
+    def bulk_to_python(self, values):
+        from .models import prefetch_story_posters
+
+        # Retrieve the specific pages along with their poster images and renditions, so that
+        # a StreamField containing many stories does not need several queries per story
+        values = list(values)
+        objects = self.model_class.objects.filter(pk__in=values).specific().in_bulk()
+        prefetch_story_posters(objects.values())
+
+        seen_ids = set()
+        result = []
+        for id in values:
+            obj = objects.get(id)
+            if obj is not None and id in seen_ids:
+                # this object is already in the result list, so we need to make a copy
+                obj = copy.copy(obj)
+
+            result.append(obj)
+            seen_ids.add(id)
+
+        return result
+
     def get_context(self, value, parent_context=None):
         context = super().get_context(value, parent_context=parent_context)
         context['page'] = value.specific
@@ -76,7 +110,7 @@ class StoryEmbedBlock(StoryChooserBlock):
 
 class ExternalStoryBlock(blocks.URLBlock):
     def get_default(self):
-        from .models import ExternalStory
+        from .models import ExternalStory, LazyExternalStory
 
         # Allow specifying the default as either an ExternalStory or a URL string (or None).
         if not self.meta.default:
@@ -85,17 +119,28 @@ class ExternalStoryBlock(blocks.URLBlock):
             return self.meta.default
         else:
             # assume default has been passed as a string
-            return ExternalStory.get_for_url(self.meta.default)
+            return LazyExternalStory(self.meta.default)
 
     def to_python(self, value):
-        from .models import ExternalStory
+        from .models import LazyExternalStory
 
         # The JSON representation of an ExternalStoryBlock value is a URL string;
-        # this should be converted to an ExternalStory instance (or None).
+        # this should be converted to a LazyExternalStory (or None). This must not fetch
+        # the URL, as it runs whenever a page or revision containing the block is loaded.
         if not value:
             return None
         else:
-            return ExternalStory.get_for_url(value)
+            return LazyExternalStory(value)
+
+    def bulk_to_python(self, values):
+        from .models import LazyExternalStory
+
+        # Batch the values together, so that accessing any of them looks up all of the stories
+        # in a single query rather than one query per block
+        batch = []
+        lazy_stories = [LazyExternalStory(value, batch=batch) if value else None for value in values]
+        batch.extend(lazy_story for lazy_story in lazy_stories if lazy_story is not None)
+        return lazy_stories
 
     def get_prep_value(self, value):
         # serialisable value should be a URL string
@@ -120,12 +165,16 @@ class ExternalStoryBlock(blocks.URLBlock):
         return value or None
 
     def clean(self, value):
-        from .models import ExternalStory
+        from .models import ExternalStory, FetchFailedRecently
         value = super().clean(value)
 
         if value is not None:
             try:
                 value = ExternalStory.get_for_url(value)
+            except FetchFailedRecently as e:
+                raise ValidationError(
+                    _("Could not fetch URL. It will be retried in %s.") % timeuntil(e.failure.retry_after)
+                )
             except requests.exceptions.RequestException:
                 raise ValidationError(_("Could not fetch URL."))
             except Story.InvalidStoryException:
@@ -138,8 +187,18 @@ class ExternalStoryBlock(blocks.URLBlock):
         context['story'] = value
         return context
 
+    def render(self, value, context=None):
+        if getattr(value, 'is_ready', True):
+            return super().render(value, context=context)
+
+        # the story has not been fetched yet, so output a placeholder
+        new_context = dict(context or {})
+        new_context.update(self.get_context(value, parent_context=context))
+        return mark_safe(render_to_string(self.meta.placeholder_template, new_context))
+
     class Meta:
         template = 'wagtail_webstories/blocks/external_story_poster_link.html'
+        placeholder_template = 'wagtail_webstories/blocks/external_story_placeholder.html'
 
 
 class ExternalStoryEmbedBlock(ExternalStoryBlock):
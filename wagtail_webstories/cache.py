@@ -0,0 +1,344 @@
+import hashlib
+import threading
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from importlib import metadata
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .markup import find_image_ids, find_media_ids
+from .metadata import get_metadata_fetch_settings
+
+DEFAULT_RENDER_CACHE_TIMEOUT = 3600
+DEFAULT_CLEAN_HTML_CACHE_TIMEOUT = 86400
+
+DEFAULT_FETCH_LOCK_SETTINGS = {
+    # cache backend holding the locks; must be shared between processes (e.g. Redis or
+    # Memcached) for fetches to be coordinated across processes rather than just threads
+    'ALIAS': 'default',
+    # number of seconds after which a lock expires, in case the process holding it dies. This
+    # must exceed the longest a fetch can take, or a slow fetch will lose its lock part way
+    # through; if None, it is derived from the metadata fetch timeouts
+    'TIMEOUT': None,
+    # number of seconds to wait for another worker's fetch before fetching the story ourselves
+    'WAIT': 5,
+    # interval in seconds between checks for the other worker's fetch completing
+    'POLL_INTERVAL': 0.1,
+}
+
+# Number of seconds added to the metadata fetch timeouts to give the default fetch lock timeout,
+# allowing for parsing the story and saving it to the database
+FETCH_LOCK_TIMEOUT_MARGIN = 15
+
+# Number of cleaned HTML fragments to keep in memory in each process
+CLEAN_HTML_LRU_SIZE = 256
+
+# Bump this to invalidate cleaned HTML when the cleaning rules applied by this package change
+CLEAN_HTML_CACHE_VERSION = 1
+
+# Number of render cache hits and misses seen by this process
+render_cache_stats = Counter()
+
+# Number of cleaned HTML cache hits (in memory, and from the Django cache) and misses seen by
+# this process
+clean_html_cache_stats = Counter()
+
+_clean_html_lru = OrderedDict()
+_clean_html_lru_lock = threading.Lock()
+
+
+def get_render_cache_config():
+    """
+    Return the WAGTAIL_WEBSTORIES_RENDER_CACHE setting as a dict, or None if the render cache
+    is disabled
+    """
+    return getattr(settings, 'WAGTAIL_WEBSTORIES_RENDER_CACHE', None)
+
+
+def get_render_cache():
+    config = get_render_cache_config() or {}
+    return caches[config.get('ALIAS', 'default')]
+
+
+def get_conditional_get_config():
+    """
+    Return the WAGTAIL_WEBSTORIES_CONDITIONAL_GET setting as a dict, or None if conditional GET
+    handling of story pages is disabled
+    """
+    return getattr(settings, 'WAGTAIL_WEBSTORIES_CONDITIONAL_GET', None)
+
+
+def _asset_version_key(asset_type, asset_id):
+    return 'wagtail_webstories:%s-version:%d' % (asset_type, asset_id)
+
+
+def get_asset_versions_digest(image_ids, media_ids):
+    """
+    Return a digest of the current versions of the given images and media items. The version of
+    an asset is a random token that is replaced whenever the asset (or, for images, one of its
+    renditions) is saved or deleted.
+    """
+    keys = sorted(
+        [_asset_version_key('image', image_id) for image_id in image_ids]
+        + [_asset_version_key('media', media_id) for media_id in media_ids]
+    )
+    cache = get_render_cache()
+    versions = cache.get_many(keys)
+
+    # Assign a fresh version to any asset we have no record of (including ones that have been
+    # evicted from the cache), so that we never match a render made under an older version
+    missing_versions = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing_versions:
+        cache.set_many(missing_versions, None)
+        versions.update(missing_versions)
+
+    return hashlib.sha1(
+        '\n'.join('%s=%s' % (key, versions[key]) for key in keys).encode('utf-8')
+    ).hexdigest()
+
+
+def bump_asset_version(asset_type, asset_id):
+    """
+    Invalidate all cached story renders that refer to the given asset
+    """
+    if get_render_cache_config() is None and get_conditional_get_config() is None:
+        return
+
+    get_render_cache().set(_asset_version_key(asset_type, asset_id), uuid.uuid4().hex, None)
+
+
+def get_render_cache_key(page):
+    """
+    Return the cache key for the rendered pages of the given story. As well as the page ID and
+    revision, this incorporates a hash of the page content (so that previews of unsaved changes are
+    not served from the cache) and the versions of all referenced images and media.
+    """
+    image_ids = set()
+    media_ids = set()
+    content_hash = hashlib.sha1()
+    for story_page in page.pages:
+        html = story_page.value['html']
+        image_ids.update(html.image_ids)
+        media_ids.update(html.media_ids)
+        content_hash.update(html.source.encode('utf-8'))
+        content_hash.update(b'\0')
+
+    return 'wagtail_webstories:render:%s:%s:%s:%s:%s' % (
+        page.pk,
+        page.latest_revision_id,
+        page.last_published_at.isoformat() if page.last_published_at else '',
+        content_hash.hexdigest(),
+        get_asset_versions_digest(image_ids, media_ids),
+    )
+
+
+def _get_raw_page_html(page):
+    # read the HTML of each story page from the raw StreamField data, without deserializing it
+    return [
+        block['value'].get('html') or ''
+        for block in page.pages.raw_data
+        if block['type'] == 'page'
+    ]
+
+
+def get_story_asset_ids(page):
+    """
+    Return the sets of image IDs and media IDs referenced by the given story page, including its
+    publisher logo and poster image, found without deserializing the story content
+    """
+    image_ids = {image_id for image_id in (page.publisher_logo_id, page.poster_image_id) if image_id}
+    media_ids = set()
+    for html in _get_raw_page_html(page):
+        image_ids.update(find_image_ids(html))
+        media_ids.update(find_media_ids(html))
+    return image_ids, media_ids
+
+
+def get_story_etag(page):
+    """
+    Return a strong ETag for the served story page. This incorporates the page ID, live revision
+    and publish dates, the fields rendered in the story template (including the page's URL path,
+    which appears in the canonical link and linked data), the story HTML and the versions of all
+    referenced images and media. The fields are hashed directly, rather than relying on the
+    revision, as they can be changed by a plain save() or a page move. The HTML is read from the
+    raw StreamField data, so that the ETag can be computed without deserializing or rendering the
+    story.
+    """
+    image_ids, media_ids = get_story_asset_ids(page)
+    content_hash = hashlib.sha1()
+    for field_value in (
+        page.title, page.seo_title, page.search_description, page.url_path,
+        page.first_published_at.isoformat() if page.first_published_at else '',
+        page.publisher, page.original_url, page.custom_css, page.publisher_logo_src_original,
+        page.poster_portrait_src_original, page.poster_square_src_original,
+        page.poster_landscape_src_original,
+    ):
+        content_hash.update((field_value or '').encode('utf-8'))
+        content_hash.update(b'\0')
+
+    for html in _get_raw_page_html(page):
+        content_hash.update(html.encode('utf-8'))
+        content_hash.update(b'\0')
+
+    config = get_conditional_get_config() or {}
+    etag_source = '%s:%s:%s:%s:%s:%s' % (
+        page.pk,
+        page.live_revision_id,
+        page.last_published_at.isoformat() if page.last_published_at else '',
+        config.get('VERSION', ''),
+        content_hash.hexdigest(),
+        get_asset_versions_digest(image_ids, media_ids),
+    )
+    return '"%s"' % hashlib.sha1(etag_source.encode('utf-8')).hexdigest()
+
+
+def get_or_render_pages(page, render):
+    """
+    Return the list of rendered page HTML for the given story from the render cache if available,
+    or otherwise call `render` to generate it and store the result.
+    """
+    config = get_render_cache_config()
+    if config is None:
+        return render()
+
+    cache = get_render_cache()
+    cache_key = get_render_cache_key(page)
+    pages_html = cache.get(cache_key)
+    if pages_html is not None:
+        render_cache_stats['hits'] += 1
+        return pages_html
+
+    render_cache_stats['misses'] += 1
+    pages_html = render()
+    cache.set(cache_key, pages_html, config.get('TIMEOUT', DEFAULT_RENDER_CACHE_TIMEOUT))
+    return pages_html
+
+
+@lru_cache(maxsize=None)
+def get_html_cleaner_version():
+    """
+    Return a string identifying the version of the HTML cleaner, so that cached cleaned HTML is
+    discarded when the cleaning rules change
+    """
+    try:
+        webstories_version = metadata.version('webstories')
+    except metadata.PackageNotFoundError:
+        webstories_version = 'unknown'
+    return '%s-%s' % (webstories_version, CLEAN_HTML_CACHE_VERSION)
+
+
+def get_clean_html_cache_config():
+    """
+    Return the WAGTAIL_WEBSTORIES_CLEAN_HTML_CACHE setting as a dict, or None if cleaned HTML is
+    only to be cached in memory
+    """
+    return getattr(settings, 'WAGTAIL_WEBSTORIES_CLEAN_HTML_CACHE', None)
+
+
+def get_or_clean_html(html, clean):
+    """
+    Return the result of calling `clean` on the given HTML fragment, memoised on a hash of the HTML
+    and the cleaner version. Results are kept in an in-process LRU cache, and additionally in the
+    Django cache specified by WAGTAIL_WEBSTORIES_CLEAN_HTML_CACHE if configured.
+    """
+    cache_key = 'wagtail_webstories:clean-html:%s:%s' % (
+        get_html_cleaner_version(), hashlib.sha1(html.encode('utf-8')).hexdigest()
+    )
+
+    with _clean_html_lru_lock:
+        try:
+            _clean_html_lru.move_to_end(cache_key)
+            clean_html_cache_stats['hits'] += 1
+            return _clean_html_lru[cache_key]
+        except KeyError:
+            pass
+
+    config = get_clean_html_cache_config()
+    clean_html = None
+    if config is not None:
+        clean_html = caches[config.get('ALIAS', 'default')].get(cache_key)
+        if clean_html is not None:
+            clean_html_cache_stats['shared_hits'] += 1
+
+    if clean_html is None:
+        clean_html_cache_stats['misses'] += 1
+        clean_html = clean(html)
+        if config is not None:
+            caches[config.get('ALIAS', 'default')].set(
+                cache_key, clean_html, config.get('TIMEOUT', DEFAULT_CLEAN_HTML_CACHE_TIMEOUT)
+            )
+
+    with _clean_html_lru_lock:
+        _clean_html_lru[cache_key] = clean_html
+        while len(_clean_html_lru) > CLEAN_HTML_LRU_SIZE:
+            _clean_html_lru.popitem(last=False)
+
+    return clean_html
+
+
+def clear_clean_html_cache():
+    """Discard all cleaned HTML held in memory by this process"""
+    with _clean_html_lru_lock:
+        _clean_html_lru.clear()
+
+
+def get_fetch_lock_config():
+    """
+    Return the settings for external story fetch locks, as defined by the
+    WAGTAIL_WEBSTORIES_FETCH_LOCK setting merged over DEFAULT_FETCH_LOCK_SETTINGS. If no TIMEOUT
+    is given, it is the sum of the metadata fetch connect and read timeouts plus
+    FETCH_LOCK_TIMEOUT_MARGIN, so that a lock outlives the fetch holding it.
+    """
+    config = {
+        **DEFAULT_FETCH_LOCK_SETTINGS,
+        **getattr(settings, 'WAGTAIL_WEBSTORIES_FETCH_LOCK', {}),
+    }
+    if config['TIMEOUT'] is None:
+        fetch_config = get_metadata_fetch_settings()
+        config['TIMEOUT'] = (
+            fetch_config['CONNECT_TIMEOUT'] + fetch_config['READ_TIMEOUT'] + FETCH_LOCK_TIMEOUT_MARGIN
+        )
+    return config
+
+
+def _fetch_lock_key(url_hash):
+    return 'wagtail_webstories:fetch-lock:%s' % url_hash
+
+
+def acquire_fetch_lock(url_hash):
+    """
+    Attempt to take the lock for fetching the external story with the given URL hash, without
+    blocking. Returns a token to be passed to release_fetch_lock if the lock was acquired, or None
+    if another thread or process holds it.
+    """
+    config = get_fetch_lock_config()
+    token = uuid.uuid4().hex
+    # cache.add only sets the key if it does not already exist, atomically on backends that
+    # support it
+    if caches[config['ALIAS']].add(_fetch_lock_key(url_hash), token, config['TIMEOUT']):
+        return token
+
+
+def release_fetch_lock(url_hash, token):
+    cache = caches[get_fetch_lock_config()['ALIAS']]
+    # don't release the lock if it has expired and been taken by another worker
+    if cache.get(_fetch_lock_key(url_hash)) == token:
+        cache.delete(_fetch_lock_key(url_hash))
+
+
+@contextmanager
+def fetch_lock(url_hash):
+    """
+    Context manager that attempts to take the lock for fetching the external story with the given
+    URL hash, without blocking. Yields True if the lock was acquired, or False if another thread or
+    process holds it. The lock is released on exit.
+    """
+    token = acquire_fetch_lock(url_hash)
+    try:
+        yield token is not None
+    finally:
+        if token is not None:
+            release_fetch_lock(url_hash, token)
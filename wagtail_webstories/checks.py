@@ -0,0 +1,41 @@
+from django.core.checks import Tags, Warning, register
+
+
+def _field_is_indexed(model, field_name):
+    field = model._meta.get_field(field_name)
+    if field.db_index or field.unique:
+        return True
+
+    # look for an index or unique constraint with file_hash as its leading column
+    for index in model._meta.indexes:
+        if index.fields and index.fields[0].lstrip('-') == field_name:
+            return True
+    for fields in model._meta.unique_together:
+        if fields[0] == field_name:
+            return True
+    return False
+
+
+@register(Tags.models)
+def image_file_hash_index_check(app_configs, **kwargs):
+    """
+    Story imports find existing images by file_hash, so on a large image library this field
+    needs to be indexed
+    """
+    from wagtail.images import get_image_model
+
+    Image = get_image_model()
+    if _field_is_indexed(Image, 'file_hash'):
+        return []
+
+    return [
+        Warning(
+            "The file_hash field of %s is not indexed" % Image._meta.label,
+            hint=(
+                "Importing web stories looks up existing images by file_hash. Add db_index=True to "
+                "the field, or an index on it in Meta.indexes, to avoid full table scans."
+            ),
+            obj=Image,
+            id='wagtail_webstories.W001',
+        )
+    ]
@@ -0,0 +1,164 @@
+import hashlib
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .instrumentation import measure
+
+DEFAULT_DOWNLOAD_SETTINGS = {
+    # number of assets to download concurrently
+    'WORKERS': 4,
+    # maximum number of concurrent downloads from a single host
+    'PER_HOST': 2,
+    # connect / read timeout, in seconds
+    'TIMEOUT': 30,
+    # number of times to retry a failed download, with exponential backoff
+    'RETRIES': 2,
+    'BACKOFF_FACTOR': 0.5,
+    # maximum size of a single asset in bytes, or None for no limit
+    'MAX_SIZE': None,
+}
+
+# downloads larger than this are written to disk rather than held in memory
+SPOOLED_FILE_MAX_MEMORY = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+# The result of a successful download: a temporary file object containing the content (positioned
+# at the start), its SHA-1 hash, and its size in bytes
+DownloadedAsset = namedtuple('DownloadedAsset', ['file', 'sha1', 'size'])
+
+
+class AssetTooLarge(requests.exceptions.RequestException):
+    pass
+
+
+class AssetWriter:
+    """
+    Writes a downloaded asset to a temporary file as it arrives, hashing it along the way, and
+    raises AssetTooLarge once it exceeds max_size. Assets are rejected up front if the given
+    Content-Length is over the limit.
+    """
+    def __init__(self, url, max_size, content_length=None):
+        self.url = url
+        self.max_size = max_size
+        if max_size is not None and content_length and int(content_length) > max_size:
+            raise AssetTooLarge("%s exceeds the maximum asset size" % url)
+
+        self.file = SpooledTemporaryFile(max_size=SPOOLED_FILE_MAX_MEMORY)
+        self.sha1 = hashlib.sha1()
+        self.size = 0
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_size is not None and self.size > self.max_size:
+            raise AssetTooLarge("%s exceeds the maximum asset size" % self.url)
+        self.sha1.update(chunk)
+        self.file.write(chunk)
+
+    def discard(self):
+        self.file.close()
+
+    def finish(self):
+        self.file.seek(0)
+        return DownloadedAsset(file=self.file, sha1=self.sha1.hexdigest(), size=self.size)
+
+
+def get_download_settings():
+    """
+    Return the settings for asset downloads, as defined by the WAGTAIL_WEBSTORIES_ASSET_DOWNLOADS
+    setting merged over DEFAULT_DOWNLOAD_SETTINGS
+    """
+    return {
+        **DEFAULT_DOWNLOAD_SETTINGS,
+        **getattr(settings, 'WAGTAIL_WEBSTORIES_ASSET_DOWNLOADS', {}),
+    }
+
+
+class AssetDownloader:
+    """
+    Downloads images and videos for story imports over a pooled HTTP session. Multiple URLs can be
+    downloaded concurrently with download_many, with a limit on the number of simultaneous
+    requests to any one host.
+    """
+    def __init__(self, **kwargs):
+        config = get_download_settings()
+        config.update({key.upper(): value for key, value in kwargs.items()})
+        self.max_workers = config['WORKERS']
+        self.max_per_host = config['PER_HOST']
+        self.timeout = config['TIMEOUT']
+        self.max_size = config['MAX_SIZE']
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_maxsize=max(self.max_workers, 1),
+            max_retries=Retry(
+                total=config['RETRIES'],
+                backoff_factor=config['BACKOFF_FACTOR'],
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=['GET'],
+            ),
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._host_semaphores = {}
+        self._lock = threading.Lock()
+
+    def _get_host_semaphore(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            try:
+                return self._host_semaphores[host]
+            except KeyError:
+                semaphore = self._host_semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+                return semaphore
+
+    def download(self, url):
+        """
+        Download the given URL to a temporary file, returning a DownloadedAsset. Raises
+        requests.RequestException on failure, or AssetTooLarge if the content exceeds MAX_SIZE.
+        """
+        with measure('asset_download', url=url) as measurement:
+            asset = self._download(url)
+            measurement.set('bytes', asset.size)
+        return asset
+
+    def _download(self, url):
+        with self._get_host_semaphore(url):
+            with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                writer = AssetWriter(url, self.max_size, response.headers.get('Content-Length'))
+                try:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        writer.write(chunk)
+                except BaseException:
+                    writer.discard()
+                    raise
+
+        return writer.finish()
+
+    def _download_or_return_exception(self, url):
+        try:
+            return self.download(url)
+        except requests.exceptions.RequestException as e:
+            return e
+
+    def download_many(self, urls):
+        """
+        Download the given URLs concurrently, returning a dict mapping each URL to either a
+        DownloadedAsset or the requests.RequestException raised while downloading it
+        """
+        urls = list(dict.fromkeys(urls))
+        if self.max_workers <= 1 or len(urls) <= 1:
+            return {url: self._download_or_return_exception(url) for url in urls}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='wagtail_webstories') as executor:
+            return dict(zip(urls, executor.map(self._download_or_return_exception, urls)))
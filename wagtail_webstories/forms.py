@@ -1,3 +1,8 @@
+import requests
+
+from defusedxml import DefusedXmlException
+from defusedxml.ElementTree import ParseError
+
 from django import forms
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
@@ -5,6 +10,8 @@ from django.utils.translation import gettext_lazy as _
 from wagtail.admin.widgets import AdminPageChooser
 from wagtail.models import Page
 
+from .importing import parse_story_urls
+
 
 class ImportStoryForm(forms.Form):
     source_url = forms.URLField(required=True)
@@ -24,3 +31,33 @@ class ImportStoryForm(forms.Form):
         if not destination.permissions_for_user(self.user).can_add_subpage():
             raise ValidationError(_("You do not have permission to create a page at this location"))
         return destination
+
+
+class BulkImportStoryForm(ImportStoryForm):
+    source_url = None
+    urls = forms.CharField(
+        required=False, widget=forms.Textarea,
+        label=_("Story URLs"),
+        help_text=_("One URL per line")
+    )
+    urls_file = forms.FileField(
+        required=False,
+        label=_("URL list or sitemap"),
+        help_text=_("A text file with one URL per line, or a sitemap.xml file")
+    )
+
+    field_order = ['urls', 'urls_file', 'destination']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        try:
+            story_urls = parse_story_urls(cleaned_data.get('urls') or '')
+            if cleaned_data.get('urls_file'):
+                story_urls += parse_story_urls(cleaned_data['urls_file'].read().decode('utf-8'))
+        except (UnicodeDecodeError, ParseError, DefusedXmlException, requests.exceptions.RequestException):
+            raise ValidationError(_("Could not read the URL list or sitemap."))
+        cleaned_data['story_urls'] = list(dict.fromkeys(story_urls))
+
+        if not cleaned_data['story_urls']:
+            raise ValidationError(_("Please provide at least one story URL."))
+        return cleaned_data
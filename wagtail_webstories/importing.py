@@ -0,0 +1,305 @@
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+from defusedxml import ElementTree
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils.text import slugify
+from django.utils.translation import gettext as _
+from wagtail.coreutils import find_available_slug
+
+from webstories import Story, StoryPage
+
+from .downloads import AssetDownloader
+from .markup import AMPText
+from .metadata import get_metadata_fetch_settings
+
+logger = logging.getLogger(__name__)
+
+# Default for WAGTAIL_WEBSTORIES_PARALLEL_CLEAN_MIN_PAGES: stories with fewer pages than this are
+# cleaned serially even if WAGTAIL_WEBSTORIES_CLEAN_WORKERS is set, as the cost of sending the
+# pages to the process pool outweighs the gain from cleaning them in parallel. The crossover
+# depends on the hardware (see benchmarks/clean_html.py).
+DEFAULT_PARALLEL_CLEAN_MIN_PAGES = 8
+
+# Maximum number of stories that the bulk import form will import within the request when
+# WAGTAIL_WEBSTORIES_IMPORT_JOBS is not enabled; larger imports would outlast typical proxy timeouts
+DEFAULT_SYNCHRONOUS_BULK_IMPORT_LIMIT = 10
+
+# Maximum depth of sitemap indexes to follow from a sitemap passed to parse_story_urls
+MAX_SITEMAP_DEPTH = 3
+
+_clean_executor = None
+_clean_executor_workers = None
+_clean_executor_lock = threading.Lock()
+
+
+def get_import_model():
+    return apps.get_model(settings.WAGTAIL_WEBSTORIES_IMPORT_MODEL)
+
+
+def get_synchronous_bulk_import_limit():
+    return getattr(
+        settings, 'WAGTAIL_WEBSTORIES_SYNCHRONOUS_BULK_IMPORT_LIMIT', DEFAULT_SYNCHRONOUS_BULK_IMPORT_LIMIT
+    )
+
+
+def get_fetch_timeout():
+    """
+    Return the (connect, read) timeout for fetching stories and sitemaps to import, as defined by
+    the WAGTAIL_WEBSTORIES_METADATA_FETCH setting
+    """
+    config = get_metadata_fetch_settings()
+    return (config['CONNECT_TIMEOUT'], config['READ_TIMEOUT'])
+
+
+def fetch_story(source_url, session=None):
+    """
+    Fetch and parse the web story at the given URL, optionally using the given requests.Session.
+    Raises requests.RequestException if the URL cannot be fetched, or Story.InvalidStoryException
+    if it is not a valid web story.
+    """
+    response = (session or requests).get(source_url, timeout=get_fetch_timeout())
+    response.raise_for_status()
+    response.encoding = 'utf-8'
+    return Story(response.text)
+
+
+def _get_clean_executor(max_workers):
+    global _clean_executor, _clean_executor_workers
+
+    with _clean_executor_lock:
+        if _clean_executor is None or _clean_executor_workers != max_workers:
+            if _clean_executor is not None:
+                _clean_executor.shutdown(wait=False)
+            else:
+                atexit.register(_shutdown_clean_executor)
+            # Start the workers with 'spawn' rather than the platform default (fork on Linux), as
+            # forking a threaded web or worker process can deadlock on locks held by other threads
+            # (such as those of database connections and logging). The workers only need the
+            # webstories cleaner, not Django, so they are cheap to start.
+            _clean_executor = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')
+            )
+            _clean_executor_workers = max_workers
+        return _clean_executor
+
+
+def _shutdown_clean_executor():
+    global _clean_executor
+
+    with _clean_executor_lock:
+        if _clean_executor is not None:
+            _clean_executor.shutdown()
+            _clean_executor = None
+
+
+def clean_story_pages(story):
+    """
+    Return a list of the AMP-cleaned HTML for each page of the given Story object. If the
+    WAGTAIL_WEBSTORIES_CLEAN_WORKERS setting is greater than 1 and the story has at least
+    WAGTAIL_WEBSTORIES_PARALLEL_CLEAN_MIN_PAGES pages, the pages are cleaned in parallel on a
+    process pool of that size. The pool is only created the first time it is needed.
+    """
+    max_workers = getattr(settings, 'WAGTAIL_WEBSTORIES_CLEAN_WORKERS', None) or 1
+    min_pages = getattr(
+        settings, 'WAGTAIL_WEBSTORIES_PARALLEL_CLEAN_MIN_PAGES', DEFAULT_PARALLEL_CLEAN_MIN_PAGES
+    )
+    if max_workers > 1 and len(story.pages) >= min_pages:
+        executor = _get_clean_executor(max_workers)
+        # map returns results in the order of the input, so page order is preserved
+        return list(executor.map(
+            StoryPage.clean_html_fragment, [subpage.html for subpage in story.pages]
+        ))
+    else:
+        return [subpage.get_clean_html() for subpage in story.pages]
+
+
+def build_story_page(story, source_url):
+    """
+    Return a new (unsaved) instance of the WAGTAIL_WEBSTORIES_IMPORT_MODEL page model, populated
+    from the given Story object
+    """
+    page_model = get_import_model()
+
+    def absolute_url(src):
+        return urljoin(source_url, src) if src else ''
+
+    page = page_model(
+        title=story.title,
+        publisher=story.publisher or '',
+        publisher_logo_src_original=absolute_url(story.publisher_logo_src),
+        poster_portrait_src_original=absolute_url(story.poster_portrait_src),
+        poster_square_src_original=absolute_url(story.poster_square_src),
+        poster_landscape_src_original=absolute_url(story.poster_landscape_src),
+        custom_css=story.custom_css or '',
+        original_url=source_url,
+    )
+    if getattr(settings, 'WAGTAIL_WEBSTORIES_CLEAN_HTML', True):
+        page.pages = [
+            ('page', {'id': subpage.id, 'html': AMPText(clean_html)})
+            for subpage, clean_html in zip(story.pages, clean_story_pages(story))
+        ]
+    else:
+        page.pages = [
+            ('page', {'id': subpage.id, 'html': AMPText(subpage.html)})
+            for subpage in story.pages
+        ]
+    return page
+
+
+def parse_story_urls(content, source_url=None):
+    """
+    Return the list of story URLs in the given text, which may be either a sitemap (or sitemap
+    index, whose sitemaps will be fetched in turn) or a list of URLs, one per line. In a list of
+    URLs, blank lines and lines beginning with '#' are ignored. source_url is the URL the content
+    was fetched from, if any.
+
+    Sitemaps are parsed with defusedxml, as they come from outside. Each sitemap is only fetched
+    once, and ValidationError is raised if sitemap indexes are nested more than MAX_SITEMAP_DEPTH
+    deep.
+    """
+    seen_sitemap_urls = {source_url} if source_url else set()
+    return _parse_story_urls(content, seen_sitemap_urls, 0)
+
+
+def _parse_story_urls(content, seen_sitemap_urls, depth):
+    content = content.strip()
+    if not content.startswith('<'):
+        urls = [line.strip() for line in content.splitlines()]
+        return list(dict.fromkeys(url for url in urls if url and not url.startswith('#')))
+
+    root = ElementTree.fromstring(content)
+    locs = [
+        element.text.strip() for element in root.iter()
+        if element.tag.rsplit('}', 1)[-1] == 'loc' and element.text
+    ]
+    if root.tag.rsplit('}', 1)[-1] == 'sitemapindex':
+        if depth >= MAX_SITEMAP_DEPTH:
+            raise ValidationError(
+                _("Sitemap indexes are nested more than %d levels deep.") % MAX_SITEMAP_DEPTH
+            )
+        urls = []
+        for sitemap_url in locs:
+            if sitemap_url in seen_sitemap_urls:
+                continue
+            seen_sitemap_urls.add(sitemap_url)
+            response = requests.get(sitemap_url, timeout=get_fetch_timeout())
+            response.raise_for_status()
+            urls += _parse_story_urls(response.text, seen_sitemap_urls, depth + 1)
+        return list(dict.fromkeys(urls))
+    return list(dict.fromkeys(locs))
+
+
+class StoryBatchImporter:
+    """
+    Imports a list of stories as pages under a common destination page. Stories are fetched and
+    parsed concurrently, and pages are then created one at a time, sharing an AssetDownloader and
+    image cache so that assets common to several stories are only downloaded once.
+
+    If checkpoint_path is given, the result for each URL is written to that file as it completes,
+    and URLs that were successfully imported by a previous run with the same checkpoint file are
+    skipped.
+    """
+    def __init__(self, destination, max_workers=4, import_assets=True, checkpoint_path=None):
+        self.destination = destination
+        self.max_workers = max_workers
+        self.import_assets = import_assets
+        self.checkpoint_path = checkpoint_path
+        self.asset_downloader = AssetDownloader()
+        self.image_cache = {}
+
+        self.results = {}
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                self.results = json.load(f)
+
+    def _save_checkpoint(self):
+        if self.checkpoint_path:
+            # write to a temporary file first, so that an interrupted write doesn't lose the checkpoint
+            with open(self.checkpoint_path + '.tmp', 'w') as f:
+                json.dump(self.results, f, indent=2)
+            os.replace(self.checkpoint_path + '.tmp', self.checkpoint_path)
+
+    def _fetch(self, url):
+        start_time = time.monotonic()
+        try:
+            story = fetch_story(url, session=self.asset_downloader.session)
+            error = None
+        except requests.exceptions.RequestException:
+            story, error = None, _("Could not fetch URL.")
+        except Story.InvalidStoryException:
+            story, error = None, _("URL is not a valid web story.")
+        return (story, error, time.monotonic() - start_time)
+
+    def _create_page(self, url, story):
+        page = build_story_page(story, url)
+        page.slug = find_available_slug(self.destination, slugify(page.title) or 'story')
+        self.destination.add_child(instance=page)
+
+        if self.import_assets:
+            page.asset_downloader = self.asset_downloader
+            page.image_cache = self.image_cache
+            if page.import_assets():
+                page.save()
+        return page
+
+    def _import(self, url, story, error, fetch_time):
+        result = {
+            'url': url,
+            'status': 'failed',
+            'page_id': None,
+            'error': None if error is None else str(error),
+            'fetch_time': round(fetch_time, 3),
+            'import_time': 0,
+        }
+        if story is None:
+            return result
+
+        start_time = time.monotonic()
+        try:
+            page = self._create_page(url, story)
+        except Exception as e:
+            logger.exception("Import of story %s failed", url)
+            result['error'] = str(e)
+        else:
+            result['status'] = 'imported'
+            result['page_id'] = page.pk
+        result['import_time'] = round(time.monotonic() - start_time, 3)
+        return result
+
+    def import_stories(self, urls, callback=None):
+        """
+        Import the stories at the given URLs, returning a list of result dicts (with keys 'url',
+        'status', 'page_id', 'error', 'fetch_time' and 'import_time') in the same order. If
+        callback is given, it is called with each result as it completes.
+        """
+        urls = list(dict.fromkeys(urls))
+        pending_urls = [
+            url for url in urls
+            if self.results.get(url, {}).get('status') != 'imported'
+        ]
+
+        with ThreadPoolExecutor(max_workers=max(self.max_workers, 1), thread_name_prefix='wagtail_webstories') as executor:
+            # fetch in chunks, so that we don't hold thousands of parsed stories in memory at once
+            chunk_size = max(self.max_workers, 1) * 4
+            for i in range(0, len(pending_urls), chunk_size):
+                chunk = pending_urls[i:i + chunk_size]
+                for url, fetched in zip(chunk, executor.map(self._fetch, chunk)):
+                    result = self._import(url, *fetched)
+                    self.results[url] = result
+                    self._save_checkpoint()
+                    if callback:
+                        callback(result)
+
+        return [self.results[url] for url in urls]
@@ -0,0 +1,175 @@
+"""
+Opt-in instrumentation of story rendering, external story lookups, asset downloads and imports.
+
+When the WAGTAIL_WEBSTORIES_INSTRUMENTATION setting is defined, each measured operation is timed,
+the database queries it makes on the current thread are counted, and the results are passed to
+each of the configured handlers as handler(operation, metrics), where metrics is a dict including
+'duration' (in seconds) and 'queries' along with any operation-specific values. When the setting
+is not defined, measure() returns a no-op object and nothing is recorded.
+"""
+import logging
+import random
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connection
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INSTRUMENTATION_SETTINGS = {
+    # dotted paths of callables to receive the metrics for each measured operation
+    'HANDLERS': ['wagtail_webstories.instrumentation.log_metrics'],
+    # the fraction of operations to measure, between 0 and 1
+    'SAMPLE_RATE': 1.0,
+}
+
+
+def get_instrumentation_config():
+    """
+    Return the settings for instrumentation, as defined by the WAGTAIL_WEBSTORIES_INSTRUMENTATION
+    setting merged over DEFAULT_INSTRUMENTATION_SETTINGS, or None if instrumentation is disabled
+    """
+    config = getattr(settings, 'WAGTAIL_WEBSTORIES_INSTRUMENTATION', None)
+    if config is None:
+        return None
+    return {**DEFAULT_INSTRUMENTATION_SETTINGS, **config}
+
+
+@lru_cache(maxsize=None)
+def _get_handlers(handler_paths):
+    return [import_string(path) for path in handler_paths]
+
+
+def log_metrics(operation, metrics):
+    """Metrics handler that writes each measurement to the wagtail_webstories.instrumentation log"""
+    logger.info(
+        "%s: %s", operation,
+        ' '.join('%s=%s' % (key, value) for key, value in sorted(metrics.items()))
+    )
+
+
+class Measurement:
+    """
+    Records the duration and query count of an operation, along with any values passed to `set` or
+    `increment`. Use as a context manager, or call `start` and `finish` explicitly where the
+    operation does not fit within a single block (e.g. a response that is rendered after it is
+    returned). Calls to `finish` after the first are ignored.
+    """
+    def __init__(self, operation, handlers, metrics):
+        self.operation = operation
+        self.handlers = handlers
+        self.metrics = metrics
+        self.queries = 0
+        self.start_time = None
+        self.finished = False
+
+    def __bool__(self):
+        return True
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        connection.execute_wrappers.append(self._count_query)
+        return self
+
+    def finish_by_request_end(self):
+        """
+        Ensure that the measurement is finished when the current request finishes, if it has not
+        been already. Use this where the operation is meant to be finished by a later step that
+        may never happen, such as the rendering of a response that middleware replaces, so that
+        the query counter is not left on this thread's connection to count later requests.
+        """
+        request_finished.connect(self._finish_on_request_finished, weak=False)
+
+    def _finish_on_request_finished(self, **kwargs):
+        self.set('completed', False)
+        self.finish()
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        request_finished.disconnect(self._finish_on_request_finished)
+
+        duration = time.perf_counter() - self.start_time
+        try:
+            connection.execute_wrappers.remove(self._count_query)
+        except ValueError:
+            # finished on a different thread from the one it was started on
+            pass
+
+        self.metrics['duration'] = round(duration, 6)
+        self.metrics['queries'] = self.queries
+        for handler in self.handlers:
+            try:
+                handler(self.operation, self.metrics)
+            except Exception:
+                # a failing metrics handler should not break the operation being measured
+                logger.exception("Instrumentation handler %r failed", handler)
+
+    def set(self, key, value):
+        self.metrics[key] = value
+
+    def increment(self, key, amount=1):
+        self.metrics[key] = self.metrics.get(key, 0) + amount
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.metrics['error'] = exc_type.__name__
+        self.finish()
+
+
+class NullMeasurement:
+    """Stand-in for Measurement when instrumentation is disabled, or the operation is not sampled"""
+    def __bool__(self):
+        return False
+
+    def start(self):
+        return self
+
+    def finish_by_request_end(self):
+        pass
+
+    def finish(self):
+        pass
+
+    def set(self, key, value):
+        pass
+
+    def increment(self, key, amount=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+NULL_MEASUREMENT = NullMeasurement()
+
+
+def measure(operation, **metrics):
+    """
+    Return a Measurement for the named operation, with the given initial metrics; or, if
+    instrumentation is disabled or this operation falls outside the sample, a NullMeasurement
+    which records nothing. Measurements are false in a boolean context when not recording, so that
+    callers can skip gathering metrics that are costly to compute.
+    """
+    config = get_instrumentation_config()
+    if config is None:
+        return NULL_MEASUREMENT
+
+    if config['SAMPLE_RATE'] < 1 and random.random() >= config['SAMPLE_RATE']:
+        return NULL_MEASUREMENT
+
+    return Measurement(operation, _get_handlers(tuple(config['HANDLERS'])), metrics)
@@ -0,0 +1,100 @@
+import json
+import time
+
+import requests
+from defusedxml import DefusedXmlException
+from defusedxml.ElementTree import ParseError
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from wagtail.models import Page
+
+from wagtail_webstories.importing import StoryBatchImporter, get_fetch_timeout, parse_story_urls
+
+
+class Command(BaseCommand):
+    help = "Import web stories from a file of URLs or a sitemap as pages under a destination page"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'source',
+            help="Path to a file containing one story URL per line, or the path or URL of a sitemap"
+        )
+        parser.add_argument(
+            '--destination', type=int, required=True,
+            help="ID of the page to create the story pages under"
+        )
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help="Number of stories to fetch concurrently (default: 4)"
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help=(
+                "Path to a file for recording progress; re-running with the same checkpoint file "
+                "skips stories that have already been imported"
+            )
+        )
+        parser.add_argument(
+            '--report',
+            help="Path to write a JSON report of the outcome and timings for each URL"
+        )
+        parser.add_argument(
+            '--no-assets', action='store_true',
+            help="Leave images and videos at their original URLs, rather than importing them"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            destination = Page.objects.get(id=options['destination']).specific
+        except Page.DoesNotExist:
+            raise CommandError("Page %d does not exist" % options['destination'])
+
+        source = options['source']
+        source_url = source if source.startswith(('http://', 'https://')) else None
+        if source_url:
+            try:
+                response = requests.get(source, timeout=get_fetch_timeout())
+                response.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                raise CommandError("Could not fetch %s: %s" % (source, e))
+            content = response.text
+        else:
+            with open(source) as f:
+                content = f.read()
+        try:
+            urls = parse_story_urls(content, source_url=source_url)
+        except (ParseError, DefusedXmlException, requests.exceptions.RequestException) as e:
+            raise CommandError("Could not read the URL list or sitemap: %s" % e)
+        except ValidationError as e:
+            raise CommandError(" ".join(e.messages))
+
+        importer = StoryBatchImporter(
+            destination, max_workers=options['workers'], import_assets=not options['no_assets'],
+            checkpoint_path=options['checkpoint'],
+        )
+
+        def report_progress(result):
+            if options['verbosity'] >= 2:
+                self.stdout.write("%s: %s (fetch %.2fs, import %.2fs)%s" % (
+                    result['url'], result['status'], result['fetch_time'], result['import_time'],
+                    " - %s" % result['error'] if result['error'] else "",
+                ))
+
+        start_time = time.monotonic()
+        results = importer.import_stories(urls, callback=report_progress)
+        elapsed = time.monotonic() - start_time
+
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+        if options['verbosity'] >= 1:
+            imported = [result for result in results if result['status'] == 'imported']
+            failed = [result for result in results if result['status'] == 'failed']
+            for result in failed:
+                self.stdout.write("Failed to import %s: %s" % (result['url'], result['error']))
+            self.stdout.write(
+                "Imported %d stories (%d failed) in %.2fs" % (len(imported), len(failed), elapsed)
+            )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from wagtail_webstories.models import ExternalStory
+from wagtail_webstories.tasks import fetch_external_stories
+
+
+class Command(BaseCommand):
+    help = "Re-fetch the metadata of the external stories that were least recently fetched"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=100,
+            help="Maximum number of stories to refresh (default: 100)"
+        )
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help="Number of stories to fetch concurrently (default: 4)"
+        )
+        parser.add_argument(
+            '--per-host', type=int, default=2,
+            help="Maximum number of concurrent requests to a single host (default: 2)"
+        )
+
+    def handle(self, *args, **options):
+        urls = list(
+            ExternalStory.objects.order_by('last_fetched_at').values_list('url', flat=True)[:options['limit']]
+        )
+        results = fetch_external_stories(
+            urls, max_workers=options['workers'], max_per_host=options['per_host']
+        )
+        failures = results.count(False)
+
+        if options['verbosity'] >= 1:
+            self.stdout.write(
+                "Refreshed %d external stories (%d failed)" % (len(results) - failures, failures)
+            )
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from wagtail_webstories.downloads import AssetDownloader
+from wagtail_webstories.models import StoryImportJob
+
+
+class Command(BaseCommand):
+    help = "Process story imports queued from the admin, polling the job table for new jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit once there are no queued jobs, rather than waiting for more"
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help="Number of seconds to wait between polls when the queue is empty (default: 5)"
+        )
+
+    def handle(self, *args, **options):
+        # share one connection pool across all jobs
+        asset_downloader = AssetDownloader()
+
+        while True:
+            job = StoryImportJob.claim_next()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                continue
+
+            job.run(asset_downloader=asset_downloader)
+            if options['verbosity'] >= 1:
+                self.stdout.write("Import of %s %s" % (job.source_url, job.status))
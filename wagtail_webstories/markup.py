@@ -5,56 +5,152 @@ from django.utils.safestring import mark_safe
 from wagtail.images import get_image_model_string
 from wagtail.images.shortcuts import get_rendition_or_not_found
 
+from .instrumentation import measure
+
 # Retrieve the (possibly custom) image model. Can't use get_image_model as of Wagtail 2.11, as we
 # need require_ready=False: https://github.com/wagtail/wagtail/pull/6568
 Image = apps.get_model(get_image_model_string(), require_ready=False)
 
 
-def _replace_image_id(match):
-    try:
-        image = Image.objects.get(id=match.group(1))
-    except Image.DoesNotExist:
-        return ''
+def get_image_urls(image_ids):
+    """
+    Return a dict mapping image IDs to the URL of the image's original rendition, for the
+    given iterable of IDs. IDs that do not correspond to an existing image are omitted.
+    """
+    image_ids = set(image_ids)
+    if not image_ids:
+        return {}
 
-    rendition = get_rendition_or_not_found(image, 'original')
-    return 'src="%s"' % escape(rendition.url)
+    images = Image.objects.prefetch_renditions('original').in_bulk(image_ids)
+    return {
+        image_id: get_rendition_or_not_found(image, 'original').url
+        for image_id, image in images.items()
+    }
 
 
-def _replace_media_id(match):
+def get_media_urls(media_ids):
+    """
+    Return a dict mapping media IDs to the media file URL, for the given iterable of IDs.
+    IDs that do not correspond to an existing media item are omitted.
+    """
+    media_ids = set(media_ids)
+    if not media_ids:
+        return {}
+
     from wagtailmedia.models import get_media_model
     Media = get_media_model()
 
-    try:
-        media = Media.objects.get(id=match.group(1))
-    except Media.DoesNotExist:
-        return ''
-
-    return 'src="%s"' % escape(media.url)
+    return {
+        media_id: media.url
+        for media_id, media in Media.objects.in_bulk(media_ids).items()
+    }
 
 
 FIND_DATA_WAGTAIL_IMAGE_ID_ATTR = re.compile(r'''\bdata-wagtail-image-id=["'](\d+)["']''')
 FIND_DATA_WAGTAIL_MEDIA_ID_ATTR = re.compile(r'''\bdata-wagtail-media-id=["'](\d+)["']''')
 
+
+def find_image_ids(html):
+    """Return the set of image IDs referenced in a string of AMP markup"""
+    return {int(id) for id in FIND_DATA_WAGTAIL_IMAGE_ID_ATTR.findall(html)}
+
+
+def find_media_ids(html):
+    """Return the set of media IDs referenced in a string of AMP markup"""
+    return {int(id) for id in FIND_DATA_WAGTAIL_MEDIA_ID_ATTR.findall(html)}
+
+
+def _replace_with_url(urls):
+    def replace(match):
+        try:
+            return 'src="%s"' % escape(urls[int(match.group(1))])
+        except KeyError:
+            return ''
+
+    return replace
+
+
+def expand_entities_many(html_fragments):
+    """
+    Expand symbolic references in a list of strings of AMP markup, returning a list of the
+    expanded strings. All images and media items referenced across the whole list are retrieved
+    together, so that the number of queries does not grow with the number of references.
+    """
+    html_fragments = list(html_fragments)
+
+    with measure('expand_entities', fragments=len(html_fragments)) as measurement:
+        image_ids = set()
+        media_ids = set()
+        for html in html_fragments:
+            image_ids.update(find_image_ids(html))
+            media_ids.update(find_media_ids(html))
+
+        image_urls = get_image_urls(image_ids)
+        media_urls = get_media_urls(media_ids)
+        measurement.set('images', len(image_urls))
+        measurement.set('media', len(media_urls))
+
+        replace_image_id = _replace_with_url(image_urls)
+        replace_media_id = _replace_with_url(media_urls)
+
+        return [
+            FIND_DATA_WAGTAIL_MEDIA_ID_ATTR.sub(
+                replace_media_id, FIND_DATA_WAGTAIL_IMAGE_ID_ATTR.sub(replace_image_id, html)
+            )
+            for html in html_fragments
+        ]
+
+
 def expand_entities(html):
     """
     Expand symbolic references in a string of AMP markup - e.g. convert
     data-wagtail-image-id="123" to src="/path/to/image.html"
     """
-    html = FIND_DATA_WAGTAIL_IMAGE_ID_ATTR.sub(_replace_image_id, html)
-    html = FIND_DATA_WAGTAIL_MEDIA_ID_ATTR.sub(_replace_media_id, html)
-    return html
+    return expand_entities_many([html])[0]
 
 
 class AMPText:
-    """Equivalent of Wagtail's RichText - performs entity expansion when rendered"""
+    """
+    Equivalent of Wagtail's RichText - performs entity expansion when rendered. The expanded
+    HTML is cached on the instance, and discarded whenever `source` is reassigned.
+    """
+    __slots__ = ('_source', '_html', '_image_ids', '_media_ids')
+
     def __init__(self, source):
-        self.source = (source or '')
+        self.source = source
+
+    @property
+    def source(self):
+        return self._source
+
+    @source.setter
+    def source(self, value):
+        self._source = (value or '')
+        self._html = None
+        self._image_ids = None
+        self._media_ids = None
+
+    @property
+    def image_ids(self):
+        """The set of image IDs referenced in the source, found without performing expansion"""
+        if self._image_ids is None:
+            self._image_ids = frozenset(find_image_ids(self._source))
+        return self._image_ids
+
+    @property
+    def media_ids(self):
+        """The set of media IDs referenced in the source, found without performing expansion"""
+        if self._media_ids is None:
+            self._media_ids = frozenset(find_media_ids(self._source))
+        return self._media_ids
 
     def __html__(self):
-        return expand_entities(self.source)
+        if self._html is None:
+            self._html = expand_entities(self._source)
+        return self._html
 
     def __str__(self):
         return mark_safe(self.__html__())
 
     def __bool__(self):
-        return bool(self.source)
+        return bool(self._source)
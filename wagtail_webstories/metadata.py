@@ -0,0 +1,110 @@
+import codecs
+from collections import namedtuple
+from html.parser import HTMLParser
+
+from django.conf import settings
+
+from webstories import Story
+
+DEFAULT_METADATA_FETCH_SETTINGS = {
+    # maximum number of bytes to read from a story document. The <amp-story> tag follows the
+    # document head, which AMP limits to well under this size
+    'MAX_BYTES': 1024 * 1024,
+    # connect / read timeouts, in seconds
+    'CONNECT_TIMEOUT': 10,
+    'READ_TIMEOUT': 30,
+}
+
+CHUNK_SIZE = 16 * 1024
+
+# The metadata of a web story, as read from the attributes of its <amp-story> element. These
+# attributes have the same names as those of webstories.Story.
+StoryMetadata = namedtuple('StoryMetadata', [
+    'title', 'publisher', 'publisher_logo_src',
+    'poster_portrait_src', 'poster_square_src', 'poster_landscape_src',
+])
+
+
+def get_metadata_fetch_settings():
+    """
+    Return the settings for fetching external story metadata, as defined by the
+    WAGTAIL_WEBSTORIES_METADATA_FETCH setting merged over DEFAULT_METADATA_FETCH_SETTINGS
+    """
+    return {
+        **DEFAULT_METADATA_FETCH_SETTINGS,
+        **getattr(settings, 'WAGTAIL_WEBSTORIES_METADATA_FETCH', {}),
+    }
+
+
+class AMPStoryTagParser(HTMLParser):
+    """
+    Incremental HTML parser that records the attributes of the first <amp-story> start tag. This
+    uses the same parser as webstories.Story (via BeautifulSoup's html.parser), so attribute values
+    are read identically.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.story_attrs = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'amp-story' and self.story_attrs is None:
+            self.story_attrs = dict(attrs)
+
+
+class StoryMetadataReader:
+    """
+    Reads the metadata of a web story from its HTML as it arrives, in chunks of bytes passed to
+    `feed`. Once the <amp-story> start tag has been parsed, `feed` returns a StoryMetadata, and the
+    rest of the document need not be read. If the document ends without the tag being found,
+    `close` parses it in full with webstories.Story, which raises Story.InvalidStoryException if it
+    is not a valid story; `feed` also raises this if the tag is not found within max_bytes.
+    """
+    def __init__(self, encoding, max_bytes):
+        self.decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+        self.parser = AMPStoryTagParser()
+        self.max_bytes = max_bytes
+        self.chunks = []
+        self.bytes_read = 0
+
+    def feed(self, chunk):
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self.max_bytes:
+            raise Story.InvalidStoryException(
+                "No <amp-story> element found in the first %d bytes" % self.max_bytes
+            )
+
+        text = self.decoder.decode(chunk)
+        self.chunks.append(text)
+        self.parser.feed(text)
+        attrs = self.parser.story_attrs
+        if attrs is not None:
+            return StoryMetadata(
+                title=attrs.get('title'),
+                publisher=attrs.get('publisher'),
+                publisher_logo_src=attrs.get('publisher-logo-src'),
+                poster_portrait_src=attrs.get('poster-portrait-src'),
+                poster_square_src=attrs.get('poster-square-src'),
+                poster_landscape_src=attrs.get('poster-landscape-src'),
+            )
+
+    def close(self):
+        # we have the whole document and did not find the tag as it streamed in; fall back on a
+        # full parse, so that the outcome matches that of webstories.Story
+        self.chunks.append(self.decoder.decode(b'', final=True))
+        return Story(''.join(self.chunks))
+
+
+def read_story_metadata(response, max_bytes):
+    """
+    Read the metadata of the web story in a streamed requests response, returning a StoryMetadata
+    (or, if a full parse was needed, a webstories.Story) along with the number of bytes read.
+    Reading stops as soon as the <amp-story> start tag has been parsed, so the story pages are not
+    downloaded. See StoryMetadataReader for the handling of documents without the tag.
+    """
+    reader = StoryMetadataReader(response.encoding, max_bytes)
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        metadata = reader.feed(chunk)
+        if metadata is not None:
+            return metadata, reader.bytes_read
+
+    return reader.close(), reader.bytes_read
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_webstories', '0002_extend_url_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='externalstory',
+            name='etag',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='externalstory',
+            name='last_modified',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
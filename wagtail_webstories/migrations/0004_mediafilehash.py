@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_webstories', '0003_externalstory_etag_last_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFileHash',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('media_id', models.PositiveIntegerField(unique=True)),
+                ('file_hash', models.CharField(db_index=True, max_length=40)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wagtail_webstories', '0005_storyimportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExternalStoryFetchFailure',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.TextField()),
+                ('url_hash', models.CharField(editable=False, max_length=40, unique=True)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('error_class', models.CharField(max_length=255)),
+                ('error_message', models.TextField(blank=True)),
+                ('failure_count', models.PositiveIntegerField(default=1)),
+                ('first_failed_at', models.DateTimeField()),
+                ('last_failed_at', models.DateTimeField()),
+                ('retry_after', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'ordering': ['-last_failed_at'],
+            },
+        ),
+    ]
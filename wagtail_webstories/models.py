@@ -1,29 +1,61 @@
 import hashlib
 import json
+import logging
 import os.path
 import requests
+import time
 
+from collections import defaultdict
+from datetime import timedelta
+from functools import lru_cache
 from urllib.parse import urljoin, urlparse
 
 from bs4 import BeautifulSoup
 from django.apps import apps
+from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.core.files.base import ContentFile, File
+from django.core.files.base import File
 from django.core.files.images import ImageFile
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.signals import post_save, pre_save
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
 from wagtail.admin.panels import FieldPanel, MultiFieldPanel
 from wagtail.fields import StreamField
 from wagtail.images import get_image_model_string
-from wagtail.images.models import Filter
+from wagtail.images.models import Filter, SourceImageIOError
 from wagtail.models import Page, get_page_models
 
 from webstories import Story
 
 from .blocks import PageBlock
-from .markup import AMPText
+from .cache import (
+    acquire_fetch_lock, get_conditional_get_config, get_fetch_lock_config, get_or_render_pages,
+    get_story_asset_ids, get_story_etag, release_fetch_lock,
+)
+from .downloads import AssetDownloader
+from .instrumentation import measure
+from .markup import AMPText, expand_entities_many
+from .metadata import get_metadata_fetch_settings, read_story_metadata
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FETCH_BACKOFF_SETTINGS = {
+    # number of seconds to wait before retrying an external story that failed to fetch; this is
+    # doubled for each consecutive failure, up to MAX
+    'BASE': 60,
+    'MAX': 24 * 60 * 60,
+}
+
+# Number of seconds after which a running import job is assumed to have been abandoned by a worker
+# that died, and is marked as failed
+DEFAULT_IMPORT_JOB_TIMEOUT = 60 * 60
 
 
 # Retrieve the (possibly custom) image model. Can't use get_image_model as of Wagtail 2.11, as we
@@ -31,6 +63,29 @@ from .markup import AMPText
 Image = apps.get_model(get_image_model_string(), require_ready=False)
 
 
+def get_import_html_parser():
+    """
+    Return the name of the BeautifulSoup parser used when importing stories, as specified by the
+    WAGTAIL_WEBSTORIES_IMPORT_HTML_PARSER setting. This may be set to 'lxml' for faster parsing
+    if lxml is installed.
+    """
+    return getattr(settings, 'WAGTAIL_WEBSTORIES_IMPORT_HTML_PARSER', 'html.parser')
+
+
+def parse_page_html(html):
+    """Parse the HTML fragment for a single story page into a BeautifulSoup document"""
+    parser = get_import_html_parser()
+    page_dom = BeautifulSoup(html, parser)
+    if parser != 'html.parser':
+        # lxml and html5lib wrap fragments in a full html / head / body structure; remove it so
+        # that the document serialises back to a fragment
+        for tag_name in ('html', 'head', 'body'):
+            tag = page_dom.find(tag_name)
+            if tag is not None:
+                tag.unwrap()
+    return page_dom
+
+
 def _name_from_url(url):
     url_obj = urlparse(url)
     filename = url_obj.path.split('/')[-1]
@@ -91,52 +146,77 @@ class WebStoryPageMixin(models.Model):
             raise ValidationError(errors)
 
     def get_publisher_logo_rendition(self):
-        if self.publisher_logo:
-            return self.publisher_logo.get_rendition(self.PUBLISHER_LOGO_IMAGE_FILTER)
+        if not self.publisher_logo:
+            return None
 
-    @property
-    def publisher_logo_src(self):
-        rendition = self.get_publisher_logo_rendition()
-        if rendition:
-            return rendition.url
-        else:
-            return urljoin(self.original_url, self.publisher_logo_src_original)
+        # cache on the instance, as the logo is read several times when rendering a story
+        image_id, rendition = getattr(self, '_publisher_logo_rendition', (None, None))
+        if image_id != self.publisher_logo_id:
+            rendition = self.publisher_logo.get_rendition(self.PUBLISHER_LOGO_IMAGE_FILTER)
+            self._publisher_logo_rendition = (self.publisher_logo_id, rendition)
+        return rendition
+
+    def get_poster_renditions(self):
+        """
+        Return a dict of the portrait, square and landscape renditions of the poster image, keyed
+        by filter spec. These are retrieved together and cached on the instance.
+        """
+        if not self.poster_image:
+            return {}
+
+        image_id, renditions = getattr(self, '_poster_renditions', (None, None))
+        if image_id != self.poster_image_id:
+            renditions = self.poster_image.get_renditions(
+                self.PORTRAIT_IMAGE_FILTER, self.SQUARE_IMAGE_FILTER, self.LANDSCAPE_IMAGE_FILTER
+            )
+            self._poster_renditions = (self.poster_image_id, renditions)
+        return renditions
 
     def get_poster_portrait_rendition(self):
-        if self.poster_image:
-            return self.poster_image.get_rendition(self.PORTRAIT_IMAGE_FILTER)
+        return self.get_poster_renditions().get(self.PORTRAIT_IMAGE_FILTER)
 
-    @property
-    def poster_portrait_src(self):
-        rendition = self.get_poster_portrait_rendition()
+    def get_poster_square_rendition(self):
+        return self.get_poster_renditions().get(self.SQUARE_IMAGE_FILTER)
+
+    def get_poster_landscape_rendition(self):
+        return self.get_poster_renditions().get(self.LANDSCAPE_IMAGE_FILTER)
+
+    def _get_src(self, name, image_id, get_rendition, src_original):
+        # Look up the rendition, falling back on the URL from the original story. name and
+        # image_id identify the rendition to StoredRenditionURLsMixin.
+        rendition = get_rendition()
         if rendition:
             return rendition.url
         else:
-            return urljoin(self.original_url, self.poster_portrait_src_original)
+            return urljoin(self.original_url, src_original)
 
-    def get_poster_square_rendition(self):
-        if self.poster_image:
-            return self.poster_image.get_rendition(self.SQUARE_IMAGE_FILTER)
+    @property
+    def publisher_logo_src(self):
+        return self._get_src(
+            'publisher_logo', self.publisher_logo_id,
+            self.get_publisher_logo_rendition, self.publisher_logo_src_original
+        )
 
     @property
-    def poster_square_src(self):
-        rendition = self.get_poster_square_rendition()
-        if rendition:
-            return rendition.url
-        else:
-            return urljoin(self.original_url, self.poster_square_src_original)
+    def poster_portrait_src(self):
+        return self._get_src(
+            'poster_portrait', self.poster_image_id,
+            self.get_poster_portrait_rendition, self.poster_portrait_src_original
+        )
 
-    def get_poster_landscape_rendition(self):
-        if self.poster_image:
-            return self.poster_image.get_rendition(self.LANDSCAPE_IMAGE_FILTER)
+    @property
+    def poster_square_src(self):
+        return self._get_src(
+            'poster_square', self.poster_image_id,
+            self.get_poster_square_rendition, self.poster_square_src_original
+        )
 
     @property
     def poster_landscape_src(self):
-        rendition = self.get_poster_landscape_rendition()
-        if rendition:
-            return rendition.url
-        else:
-            return urljoin(self.original_url, self.poster_landscape_src_original)
+        return self._get_src(
+            'poster_landscape', self.poster_image_id,
+            self.get_poster_landscape_rendition, self.poster_landscape_src_original
+        )
 
     @property
     def linked_data(self):
@@ -167,22 +247,283 @@ class WebStoryPageMixin(models.Model):
             }
         }
 
+    def get_etag(self):
+        """
+        Return the ETag for the served story. Subclasses whose templates render additional data
+        should extend this to incorporate it.
+        """
+        return get_story_etag(self)
+
+    def get_last_modified(self):
+        """
+        Return the Last-Modified time for the served story, or None if it has none. Changes to
+        images and media do not update the publish date, so stories that reference any are
+        validated by ETag alone.
+        """
+        image_ids, media_ids = get_story_asset_ids(self)
+        if image_ids or media_ids:
+            return None
+        return self.last_published_at
+
+    def set_conditional_headers(self, response, last_modified=None):
+        response['ETag'] = self.get_etag()
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+
+    def serve(self, request, *args, **kwargs):
+        measurement = measure('serve', page_id=self.pk).start()
+        conditional = (
+            get_conditional_get_config() is not None
+            and request.method in ('GET', 'HEAD')
+            and not getattr(request, 'is_preview', False)
+        )
+        try:
+            response = None
+            if conditional:
+                # answer with a 304 if the client's copy is current, before the story content
+                # is deserialized or rendered
+                last_modified = self.get_last_modified()
+                response = get_conditional_response(
+                    request, etag=self.get_etag(),
+                    last_modified=last_modified and int(last_modified.timestamp()),
+                )
+                if response is not None:
+                    self.set_conditional_headers(response, last_modified)
+                    measurement.set('not_modified', True)
+
+            if response is None:
+                response = super().serve(request, *args, **kwargs)
+                if conditional and 200 <= response.status_code < 300:
+                    # rendering may create image renditions, which changes the asset versions
+                    # the ETag is based on, so compute it once rendering is complete
+                    if getattr(response, 'is_rendered', True):
+                        self.set_conditional_headers(response, last_modified)
+                    else:
+                        response.add_post_render_callback(
+                            lambda response: self.set_conditional_headers(response, last_modified)
+                        )
+        except BaseException as e:
+            measurement.set('error', type(e).__name__)
+            measurement.finish()
+            raise
+
+        if measurement and not getattr(response, 'is_rendered', True):
+            # template responses are rendered after serve returns; include the rendering time. If
+            # the response is never rendered, finish at the end of the request instead.
+            response.add_post_render_callback(lambda response: measurement.finish())
+            measurement.finish_by_request_end()
+        else:
+            measurement.finish()
+        return response
+
     def get_context(self, request):
-        context = super().get_context(request)
-        context['ld_json'] = json.dumps(self.linked_data)
+        with measure('get_context', page_id=self.pk):
+            context = super().get_context(request)
+            context['ld_json'] = json.dumps(self.linked_data)
         return context
 
-    def import_images(self):
-        # if flag indicates we have imported images on this instance already,
-        # don't repeat; this allows us to call import_images / save within a
-        # post_save signal without the second save retriggering a full import_images
-        if getattr(self, '_has_imported_images', False):
+    def render_pages(self):
+        """
+        Return a list of the HTML for each page of the story, with image and media references
+        expanded. All references across the story are resolved together, rather than once per page.
+        If WAGTAIL_WEBSTORIES_RENDER_CACHE is configured, the result is cached across requests.
+        """
+        measurement = measure('render_pages', page_id=self.pk, cache_hit=True)
+
+        def render():
+            measurement.set('cache_hit', False)
+            return expand_entities_many(page.value['html'].source for page in self.pages)
+
+        with measurement:
+            pages_html = get_or_render_pages(self, render)
+        return [mark_safe(html) for html in pages_html]
+
+    def import_assets(self, images=True, videos=True):
+        """
+        Import the images and/or videos referenced by this story into the local image and media
+        libraries, rewriting the story HTML to refer to them. Each page is parsed once, and only
+        pages that reference imported assets are re-serialised. Returns True if the page has
+        been changed and needs saving.
+        """
+        # if flags indicate we have imported images / videos on this instance already,
+        # don't repeat; this allows us to call import_assets / save within a
+        # post_save signal without the second save retriggering a full import
+        images = images and not getattr(self, '_has_imported_images', False)
+        videos = videos and not getattr(self, '_has_imported_videos', False)
+        if not (images or videos):
             return False  # report no changes
 
-        meta_has_changed = self._import_metadata_images()
-        content_has_changed = self._import_content_images()
-        self._has_imported_images = True
-        return meta_has_changed or content_has_changed
+        with measure('import_assets', page_id=self.pk, images=images, videos=videos):
+            return self._import_assets(images, videos)
+
+    def _import_assets(self, images, videos):
+        page_doms = [
+            parse_page_html(page.value['html'].source) if isinstance(page.block, PageBlock) else None
+            for page in self.pages
+        ]
+
+        # find the elements to import in a single pass over each page
+        tag_names = (['amp-img'] if images else []) + (['amp-video'] if videos else [])
+        page_tags = [
+            page_dom.find_all(tag_names) if page_dom is not None else []
+            for page_dom in page_doms
+        ]
+
+        urls = []
+        image_titles = {}
+        if images:
+            urls += self._get_metadata_image_urls()
+            image_titles.update(self._get_metadata_image_titles())
+        for tags in page_tags:
+            for tag in tags:
+                urls += self._get_asset_urls(tag)
+                if tag.name == 'amp-img' and tag.get('src'):
+                    image_url = urljoin(self.original_url, tag['src'])
+                    image_titles.setdefault(image_url, self._get_image_title(tag, image_url))
+
+        # download all assets up front, so that they can be fetched concurrently. Images that
+        # have already been imported from the same URL do not need downloading again
+        self._download_assets(url for url in urls if url not in self.image_cache)
+
+        try:
+            if images:
+                # resolve all images against the library together, rather than one at a time
+                self._prepare_images(image_titles)
+
+            has_changed = images and self._import_metadata_images()
+
+            new_pages = []
+            content_has_changed = False
+            for page, page_dom, tags in zip(self.pages, page_doms, page_tags):
+                page_has_changed = False
+                for tag in tags:
+                    if tag.name == 'amp-img':
+                        page_has_changed = self._import_image_tag(tag) or page_has_changed
+                    else:
+                        page_has_changed = self._import_video_tag(tag) or page_has_changed
+
+                if page_has_changed:
+                    page.value['html'] = AMPText(str(page_dom))
+                    content_has_changed = True
+                new_pages.append((page.block_type, page.value))
+        finally:
+            self._discard_downloaded_assets()
+            self._images_by_hash = {}
+
+        if content_has_changed:
+            self.pages = new_pages
+
+        if images:
+            self._has_imported_images = True
+        if videos:
+            self._has_imported_videos = True
+        return has_changed or content_has_changed
+
+    def import_images(self):
+        return self.import_assets(videos=False)
+
+    def import_videos(self):
+        return self.import_assets(images=False)
+
+    @property
+    def asset_downloader(self):
+        """
+        The AssetDownloader used to fetch images and videos when importing. This may be assigned
+        to share a single downloader (and its connection pool) across several imports.
+        """
+        if getattr(self, '_asset_downloader', None) is None:
+            self._asset_downloader = AssetDownloader()
+        return self._asset_downloader
+
+    @asset_downloader.setter
+    def asset_downloader(self, downloader):
+        self._asset_downloader = downloader
+
+    @property
+    def image_cache(self):
+        """
+        A dict mapping image URLs to the images imported from them. This may be assigned to share
+        a single cache across several imports, so that images used by many stories (such as a
+        publisher logo) are only downloaded once.
+        """
+        if getattr(self, '_image_cache', None) is None:
+            self._image_cache = {}
+        return self._image_cache
+
+    @image_cache.setter
+    def image_cache(self, image_cache):
+        self._image_cache = image_cache
+
+    def _download_assets(self, urls):
+        downloaded_assets = getattr(self, '_downloaded_assets', {})
+        with measure('download_assets') as measurement:
+            results = self.asset_downloader.download_many(
+                url for url in urls if url not in downloaded_assets
+            )
+            if measurement:
+                measurement.set('assets', len(results))
+                measurement.set('failed', len([
+                    result for result in results.values() if isinstance(result, Exception)
+                ]))
+                measurement.set('bytes', sum(
+                    result.size for result in results.values() if not isinstance(result, Exception)
+                ))
+        downloaded_assets.update(results)
+        self._downloaded_assets = downloaded_assets
+
+    def _download_asset(self, url):
+        # use the result of _download_assets if available
+        try:
+            result = self._downloaded_assets[url]
+        except (AttributeError, KeyError):
+            result = self.asset_downloader.download(url)
+            self._downloaded_assets = getattr(self, '_downloaded_assets', {})
+            self._downloaded_assets[url] = result
+
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _discard_downloaded_assets(self):
+        for result in getattr(self, '_downloaded_assets', {}).values():
+            if not isinstance(result, Exception):
+                result.file.close()
+        self._downloaded_assets = {}
+
+    def _get_metadata_image_urls(self):
+        urls = []
+        if self.publisher_logo_src_original and not self.publisher_logo:
+            urls.append(urljoin(self.original_url, self.publisher_logo_src_original))
+
+        if self.poster_portrait_src_original and not self.poster_image:
+            for src in [
+                self.poster_portrait_src_original,
+                self.poster_square_src_original,
+                self.poster_landscape_src_original,
+            ]:
+                if src:
+                    urls.append(urljoin(self.original_url, src))
+
+        return urls
+
+    def _get_metadata_image_titles(self):
+        """Return a dict of URL => title for the metadata images that will be imported as images"""
+        titles = {}
+        if self.publisher_logo_src_original and not self.publisher_logo:
+            titles[urljoin(self.original_url, self.publisher_logo_src_original)] = "%s logo" % self.publisher
+        if self.poster_portrait_src_original and not self.poster_image:
+            titles.setdefault(urljoin(self.original_url, self.poster_portrait_src_original), self.title)
+        return titles
+
+    def _get_asset_urls(self, tag):
+        """Return the URLs of the assets to import for an <amp-img> or <amp-video> element"""
+        if tag.name == 'amp-img':
+            srcs = [tag.get('src')]
+        else:
+            srcs = [tag.get('poster'), tag.get('src')] + [
+                source_tag.get('src') for source_tag in tag.find_all('source', recursive=False)
+            ]
+        return [urljoin(self.original_url, src) for src in srcs if src]
 
     def _import_metadata_images(self):
         has_changed = False
@@ -198,13 +539,16 @@ class WebStoryPageMixin(models.Model):
                 pass
 
         if self.poster_portrait_src_original and not self.poster_image:
+            portrait_url = urljoin(self.original_url, self.poster_portrait_src_original)
             try:
-                portrait_image_file = self._image_file_from_url(
-                    urljoin(self.original_url, self.poster_portrait_src_original)
-                )
-                self.poster_image, created = self._image_from_image_file(
-                    portrait_image_file, title=self.title
-                )
+                if portrait_url in self.image_cache:
+                    self.poster_image, created = self.image_cache[portrait_url], False
+                else:
+                    portrait_image_file = self._image_file_from_url(portrait_url)
+                    self.poster_image, created = self._image_from_image_file(
+                        portrait_image_file, title=self.title
+                    )
+                    self.image_cache[portrait_url] = self.poster_image
                 has_changed = True
             except requests.exceptions.RequestException:
                 created = False
@@ -249,48 +593,36 @@ class WebStoryPageMixin(models.Model):
 
         return has_changed
 
-    def _import_content_images(self):
-        new_pages = []
-        has_changed = False
-
-        for page in self.pages:
-            if not isinstance(page.block, PageBlock):
-                # leave unrecognised block types unchanged in the output
-                new_pages.append((page.block_type, page.value))
-                continue
-
-            page_html = page.value['html'].source
-            page_dom = dom = BeautifulSoup(page_html, 'html.parser')
-            # look for <amp-img> elements with src attributes
-            for img_tag in page_dom.select('amp-img[src]'):
-                image_url = urljoin(self.original_url, img_tag['src'])
-                title = (
-                    img_tag.get('alt')
-                    or _name_from_url(image_url)
-                    or ("image from story: %s" % self.title)
-                )
-                try:
-                    image, created = self._image_from_url(image_url, title=title)
-                    img_tag['data-wagtail-image-id'] = image.id
-                    del img_tag['src']
-                    has_changed = True
-                except requests.exceptions.RequestException:
-                    pass
+    def _import_image_tag(self, img_tag):
+        image_url = img_tag.get('src')
+        if not image_url:
+            return False
 
-            page.value['html'] = AMPText(str(page_dom))
-            new_pages.append((page.block_type, page.value))
+        image_url = urljoin(self.original_url, image_url)
+        try:
+            image, created = self._image_from_url(image_url, title=self._get_image_title(img_tag, image_url))
+        except requests.exceptions.RequestException:
+            return False
 
-        if has_changed:
-            self.pages = new_pages
+        img_tag['data-wagtail-image-id'] = image.id
+        del img_tag['src']
+        return True
 
-        return has_changed
+    def _get_image_title(self, img_tag, image_url):
+        return (
+            img_tag.get('alt')
+            or _name_from_url(image_url)
+            or ("image from story: %s" % self.title)
+        )
 
     def _image_file_from_url(self, url):
         url_obj = urlparse(url)
         filename = url_obj.path.split('/')[-1] or 'image'
-        response = requests.get(url)
-        response.raise_for_status()
-        return ImageFile(ContentFile(response.content), name=filename)
+        asset = self._download_asset(url)
+        image_file = ImageFile(asset.file, name=filename)
+        # record the hash computed during the download, so that we don't need to read the file again
+        image_file.sha1 = asset.sha1
+        return image_file
 
     def _create_image(self, file, title=None):
         """
@@ -300,105 +632,170 @@ class WebStoryPageMixin(models.Model):
         """
         return Image(file=file, title=title)
 
+    def _get_file_hash(self, file):
+        # use the hash computed during the download if available
+        file_hash = getattr(file, 'sha1', None)
+        if file_hash is None:
+            sha1 = hashlib.sha1()
+            for chunk in file.chunks():
+                sha1.update(chunk)
+            file_hash = sha1.hexdigest()
+        return file_hash
+
+    def _prepare_images(self, image_titles):
+        """
+        Given a dict of URL => title for images to be imported, find the existing images with the
+        same file content in a single query, and create the remaining ones together. Subsequent
+        calls to _image_from_image_file for these files will return the prepared images.
+        """
+        image_files = {}
+        for url, title in image_titles.items():
+            if url in self.image_cache:
+                continue
+            try:
+                image_file = self._image_file_from_url(url)
+            except requests.exceptions.RequestException:
+                continue
+            image_files.setdefault(self._get_file_hash(image_file), (image_file, title))
+
+        self._images_by_hash = {}
+        # iterate in descending ID order so that the earliest matching image wins
+        for image in Image.objects.filter(file_hash__in=image_files.keys()).order_by('-pk'):
+            self._images_by_hash[image.file_hash] = (image, False)
+
+        new_images = self._create_images([
+            image_file_and_title for file_hash, image_file_and_title in image_files.items()
+            if file_hash not in self._images_by_hash
+        ])
+        for image in new_images:
+            self._images_by_hash[image.file_hash] = (image, True)
+
+    def _can_bulk_create_images(self, using):
+        # bulk_create skips save(), so images can only be created in bulk if the image model does
+        # not override it, and we need the database to return the IDs of the new rows
+        return (
+            Image.save is models.Model.save
+            and connections[using].features.can_return_rows_from_bulk_insert
+        )
+
+    def _create_images(self, image_files):
+        """
+        Create and save images for a list of (ImageFile, title) pairs, in a single transaction.
+        Where possible the images are inserted with a single bulk_create, with the pre_save and
+        post_save signals sent for each image to keep search and reference indexes up to date.
+        """
+        images = []
+        for file, title in image_files:
+            image = self._create_image(file, title=title)
+            image.file_size = file.size
+            image.file_hash = self._get_file_hash(file)
+            images.append(image)
+
+        if not images:
+            return images
+
+        using = router.db_for_write(Image)
+        with transaction.atomic(using=using):
+            if self._can_bulk_create_images(using):
+                for image in images:
+                    pre_save.send(sender=Image, instance=image, raw=False, using=using, update_fields=None)
+                Image.objects.using(using).bulk_create(images)
+                for image in images:
+                    post_save.send(
+                        sender=Image, instance=image, created=True, raw=False, using=using, update_fields=None
+                    )
+            else:
+                for image in images:
+                    image.save(using=using)
+
+        return images
+
     def _image_from_image_file(self, file, title=None):
-        with file.open() as f:
-            file_hash = hashlib.sha1(f.read()).hexdigest()
+        file_hash = self._get_file_hash(file)
+
+        # use the images found or created by _prepare_images if available
+        images_by_hash = getattr(self, '_images_by_hash', {})
+        if file_hash in images_by_hash:
+            image, created = images_by_hash[file_hash]
+            # only report the image as created the first time it is used
+            images_by_hash[file_hash] = (image, False)
+            return (image, created)
 
         # check if we already have an image with the same file content
         image = Image.objects.filter(file_hash=file_hash).first()
         if image:
             return (image, False)
         else:
-            image = self._create_image(file, title=title)
-            image.save()
-            image.get_file_hash()  # ensure file_hash is populated
+            image, = self._create_images([(file, title)])
             return (image, True)
 
     def _image_from_url(self, url, title=None):
-        image_file = self._image_file_from_url(url)
-        return self._image_from_image_file(image_file, title=title)
-
-    def import_videos(self):
-        # if flag indicates we have imported videos on this instance already,
-        # don't repeat; this allows us to call import_videos / save within a
-        # post_save signal without the second save retriggering a full import_videos
-        if getattr(self, '_has_imported_videos', False):
-            return False  # report no changes
+        if url in self.image_cache:
+            return (self.image_cache[url], False)
 
-        content_has_changed = False
-        new_pages = []
+        image_file = self._image_file_from_url(url)
+        image, created = self._image_from_image_file(image_file, title=title)
+        self.image_cache[url] = image
+        return (image, created)
 
-        for page in self.pages:
-            if not isinstance(page.block, PageBlock):
-                # leave unrecognised block types unchanged in the output
-                new_pages.append((page.block_type, page.value))
-                continue
+    def _import_video_tag(self, video_tag):
+        has_changed = False
 
-            page_html = page.value['html'].source
-            page_dom = dom = BeautifulSoup(page_html, 'html.parser')
-            # look for <amp-video> elements
-            for video_tag in page_dom.select('amp-video'):
-                poster_url = video_tag.get('poster')
-                if poster_url:
-                    try:
-                        poster_image_file = self._image_file_from_url(
-                            urljoin(self.original_url, poster_url)
-                        )
-                    except requests.exceptions.RequestException:
-                        poster_image_file = None
-                else:
-                    poster_image_file = None
+        poster_url = video_tag.get('poster')
+        if poster_url:
+            try:
+                poster_image_file = self._image_file_from_url(
+                    urljoin(self.original_url, poster_url)
+                )
+            except requests.exceptions.RequestException:
+                poster_image_file = None
+        else:
+            poster_image_file = None
 
-                width = video_tag.get('width')
-                height = video_tag.get('height')
-                fallback_title = "video from story: %s" % self.title
+        width = video_tag.get('width')
+        height = video_tag.get('height')
+        fallback_title = "video from story: %s" % self.title
 
-                video_url = video_tag.get('src')
-                if video_url:
-                    title = _name_from_url(video_url) or fallback_title
-                    try:
-                        video, created = self._video_from_url(
-                            urljoin(self.original_url, video_url),
-                            title=title, width=width, height=height,
-                            thumbnail=poster_image_file
-                        )
-                        video_tag['data-wagtail-media-id'] = video.id
-                        del video_tag['src']
-                        content_has_changed = True
-                    except requests.exceptions.RequestException:
-                        pass
-
-                for source_tag in video_tag.find_all('source', recursive=False):
-                    video_url = source_tag.get('src')
-                    if video_url:
-                        title = _name_from_url(video_url) or fallback_title
-                        try:
-                            video, created = self._video_from_url(
-                                urljoin(self.original_url, video_url),
-                                title=title, width=width, height=height,
-                                thumbnail=poster_image_file
-                            )
-                            source_tag['data-wagtail-media-id'] = video.id
-                            del source_tag['src']
-                            content_has_changed = True
-                        except requests.exceptions.RequestException:
-                            pass
-
-            page.value['html'] = AMPText(str(page_dom))
-            new_pages.append((page.block_type, page.value))
+        video_url = video_tag.get('src')
+        if video_url:
+            title = _name_from_url(video_url) or fallback_title
+            try:
+                video, created = self._video_from_url(
+                    urljoin(self.original_url, video_url),
+                    title=title, width=width, height=height,
+                    thumbnail=poster_image_file
+                )
+                video_tag['data-wagtail-media-id'] = video.id
+                del video_tag['src']
+                has_changed = True
+            except requests.exceptions.RequestException:
+                pass
 
-        if content_has_changed:
-            self.pages = new_pages
+        for source_tag in video_tag.find_all('source', recursive=False):
+            video_url = source_tag.get('src')
+            if video_url:
+                title = _name_from_url(video_url) or fallback_title
+                try:
+                    video, created = self._video_from_url(
+                        urljoin(self.original_url, video_url),
+                        title=title, width=width, height=height,
+                        thumbnail=poster_image_file
+                    )
+                    source_tag['data-wagtail-media-id'] = video.id
+                    del source_tag['src']
+                    has_changed = True
+                except requests.exceptions.RequestException:
+                    pass
 
-        self._has_imported_videos = True
-        return content_has_changed
+        return has_changed
 
     def _video_file_from_url(self, url):
         url_obj = urlparse(url)
         filename = url_obj.path.split('/')[-1] or 'video'
-        response = requests.get(url)
-        response.raise_for_status()
-        return File(ContentFile(response.content), name=filename)
+        asset = self._download_asset(url)
+        video_file = File(asset.file, name=filename)
+        video_file.sha1 = asset.sha1
+        return video_file
 
     def _create_video(self, file, **kwargs):
         from wagtailmedia.models import get_media_model
@@ -412,8 +809,16 @@ class WebStoryPageMixin(models.Model):
 
     def _video_from_url(self, url, **kwargs):
         video_file = self._video_file_from_url(url)
+        file_hash = self._get_file_hash(video_file)
+
+        # check if we already have a video with the same file content
+        video = MediaFileHash.get_media_for_hash(file_hash)
+        if video:
+            return (video, False)
+
         video = self._create_video(video_file, type='video', **kwargs)
         video.save()
+        MediaFileHash.objects.create(media_id=video.pk, file_hash=file_hash)
         return (video, True)
 
     class Meta:
@@ -428,6 +833,89 @@ class BaseWebStoryPage(WebStoryPageMixin, Page):
         abstract = True
 
 
+# Fields of WebStoryPageMixin whose change requires the stored rendition URLs to be refreshed
+RENDITION_URL_SOURCE_FIELDS = {'publisher_logo', 'publisher_logo_id', 'poster_image', 'poster_image_id'}
+
+
+class StoredRenditionURLsMixin(models.Model):
+    """
+    Mixin for story page models, to be placed before WebStoryPageMixin / BaseWebStoryPage in the
+    base classes, that records the URLs of the publisher logo and poster renditions on save so that
+    story listings can be output without looking up any renditions
+    """
+    rendition_urls = models.JSONField(blank=True, default=dict, editable=False)
+
+    def refresh_rendition_urls(self):
+        """
+        Record the URLs of the publisher logo and poster renditions in the rendition_urls field,
+        so that they can be output without looking up the renditions
+        """
+        rendition_urls = {}
+
+        logo_rendition = self.get_publisher_logo_rendition()
+        if logo_rendition:
+            rendition_urls['publisher_logo_image_id'] = self.publisher_logo_id
+            rendition_urls['publisher_logo'] = logo_rendition.url
+
+        for name, rendition in [
+            ('poster_portrait', self.get_poster_portrait_rendition()),
+            ('poster_square', self.get_poster_square_rendition()),
+            ('poster_landscape', self.get_poster_landscape_rendition()),
+        ]:
+            if rendition:
+                rendition_urls['%s_image_id' % name] = self.poster_image_id
+                rendition_urls[name] = rendition.url
+
+        self.rendition_urls = rendition_urls
+
+    def _get_src(self, name, image_id, get_rendition, src_original):
+        # Use the URL recorded by refresh_rendition_urls if there is one for the current image
+        if image_id and self.rendition_urls.get('%s_image_id' % name) == image_id:
+            return self.rendition_urls[name]
+        return super()._get_src(name, image_id, get_rendition, src_original)
+
+    def _rendition_urls_are_current(self):
+        # True if rendition_urls was recorded for the current publisher logo and poster image
+        return (
+            self.rendition_urls.get('publisher_logo_image_id') == self.publisher_logo_id
+            and all(
+                self.rendition_urls.get('%s_image_id' % name) == self.poster_image_id
+                for name in ('poster_portrait', 'poster_square', 'poster_landscape')
+            )
+        )
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if (
+            (update_fields is None or RENDITION_URL_SOURCE_FIELDS.intersection(update_fields))
+            and not self._rendition_urls_are_current()
+        ):
+            try:
+                self.refresh_rendition_urls()
+            except SourceImageIOError:
+                # leave the URLs to be looked up when rendering, which handles missing files
+                logger.warning("Could not generate renditions for story page %s", self.pk, exc_info=True)
+                self.rendition_urls = {}
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'rendition_urls'}
+        return super().save(*args, **kwargs)
+
+    @classmethod
+    def clear_rendition_urls_for_image(cls, image_id):
+        """
+        Discard the stored rendition URLs of all stories of this model using the given image as
+        their publisher logo or poster, so that they are looked up again until the story is next
+        saved. Called when the image or one of its renditions is changed or deleted, as its
+        rendition URLs may no longer be valid.
+        """
+        cls.objects.filter(
+            models.Q(publisher_logo_id=image_id) | models.Q(poster_image_id=image_id)
+        ).update(rendition_urls={})
+
+    class Meta:
+        abstract = True
+
+
 def get_story_page_models():
     """
     Return a list of all non-abstract page models that inherit from WebStoryPageMixin
@@ -438,6 +926,289 @@ def get_story_page_models():
     ]
 
 
+def clear_stored_rendition_urls(image_id):
+    """
+    Discard the stored rendition URLs of all story pages using the given image as their publisher
+    logo or poster (see StoredRenditionURLsMixin)
+    """
+    for model in get_story_page_models():
+        if issubclass(model, StoredRenditionURLsMixin):
+            model.clear_rendition_urls_for_image(image_id)
+
+
+def prefetch_story_posters(pages):
+    """
+    Retrieve the poster images and publisher logos for a queryset or list of story pages, along
+    with the renditions needed to output them, using a fixed number of queries regardless of the
+    number of pages. Returns the pages as a list.
+    """
+    pages = list(pages)
+    Rendition = Image.get_rendition_model()
+
+    # the filter specs may be overridden per model, so prefetch each model's pages separately
+    pages_by_class = defaultdict(list)
+    for page in pages:
+        if isinstance(page, WebStoryPageMixin):
+            pages_by_class[type(page)].append(page)
+
+    for page_class, class_pages in pages_by_class.items():
+        poster_filter_specs = [
+            page_class.PORTRAIT_IMAGE_FILTER,
+            page_class.SQUARE_IMAGE_FILTER,
+            page_class.LANDSCAPE_IMAGE_FILTER,
+        ]
+        prefetch_related_objects(
+            class_pages,
+            Prefetch(
+                'poster_image__renditions',
+                queryset=Rendition.objects.filter(filter_spec__in=poster_filter_specs),
+            ),
+            Prefetch(
+                'publisher_logo__renditions',
+                queryset=Rendition.objects.filter(filter_spec=page_class.PUBLISHER_LOGO_IMAGE_FILTER),
+            ),
+        )
+
+    return pages
+
+
+class StoryImportJob(models.Model):
+    """
+    A request to import the story at source_url as a new page under destination, to be carried out
+    by the run_story_import_jobs management command rather than within the admin request
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, _("Queued")),
+        (STATUS_RUNNING, _("Running")),
+        (STATUS_COMPLETED, _("Completed")),
+        (STATUS_FAILED, _("Failed")),
+    ]
+
+    source_url = models.URLField(max_length=2047)
+    destination = models.ForeignKey(Page, on_delete=models.CASCADE, related_name='+')
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    # percentage completion, and a description of the current step
+    progress = models.PositiveSmallIntegerField(default=0)
+    progress_message = models.TextField(blank=True)
+    errors = models.JSONField(default=list, blank=True)
+    page = models.ForeignKey(Page, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    @classmethod
+    def fail_stale(cls):
+        """
+        Mark as failed any jobs that have been running for longer than
+        WAGTAIL_WEBSTORIES_IMPORT_JOB_TIMEOUT seconds (default one hour), as the worker running
+        them has presumably died. These are not re-queued, as the story page may already have been
+        created. Returns the number of jobs marked as failed.
+        """
+        timeout = getattr(settings, 'WAGTAIL_WEBSTORIES_IMPORT_JOB_TIMEOUT', DEFAULT_IMPORT_JOB_TIMEOUT)
+        if timeout is None:
+            return 0
+
+        now = timezone.now()
+        stale_jobs = cls.objects.filter(
+            status=cls.STATUS_RUNNING, started_at__lt=now - timedelta(seconds=timeout)
+        )
+        count = stale_jobs.update(
+            status=cls.STATUS_FAILED, finished_at=now,
+            errors=[str(_("Import did not complete within the time limit."))],
+        )
+        if count:
+            logger.warning("Marked %d stale story import job(s) as failed", count)
+        return count
+
+    @classmethod
+    def claim_next(cls):
+        """
+        Mark the oldest queued job as running and return it, or return None if there are no
+        queued jobs. A job is only claimed by one worker, even with several running at once.
+        Stale running jobs are marked as failed first (see fail_stale).
+        """
+        cls.fail_stale()
+        for job in cls.objects.filter(status=cls.STATUS_QUEUED).order_by('created_at', 'pk')[:10]:
+            started_at = timezone.now()
+            claimed = cls.objects.filter(pk=job.pk, status=cls.STATUS_QUEUED).update(
+                status=cls.STATUS_RUNNING, started_at=started_at
+            )
+            if claimed:
+                job.status = cls.STATUS_RUNNING
+                job.started_at = started_at
+                return job
+
+    def set_progress(self, progress, message):
+        self.progress = progress
+        self.progress_message = message
+        self.save(update_fields=['progress', 'progress_message'])
+
+    def fail(self, error):
+        self.status = self.STATUS_FAILED
+        self.errors = self.errors + [str(error)]
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'errors', 'finished_at'])
+
+    def run(self, asset_downloader=None, image_cache=None):
+        """
+        Fetch the story, create the page and import its images and videos. An AssetDownloader and
+        image cache (see WebStoryPageMixin.image_cache) may be passed to share them between jobs.
+        """
+        with measure('import_job', job_id=self.pk, source_url=self.source_url):
+            self._run(asset_downloader, image_cache)
+
+    def _run(self, asset_downloader, image_cache):
+        from .importing import build_story_page, fetch_story
+
+        self.set_progress(10, _("Fetching story"))
+        try:
+            story = fetch_story(self.source_url)
+        except requests.exceptions.RequestException:
+            return self.fail(_("Could not fetch URL."))
+        except Story.InvalidStoryException:
+            return self.fail(_("URL is not a valid web story."))
+
+        try:
+            self.set_progress(30, _("Creating page"))
+            page = build_story_page(story, self.source_url)
+            self.destination.add_child(instance=page)
+            self.page = page
+            self.save(update_fields=['page'])
+
+            self.set_progress(50, _("Importing images and videos"))
+            page.asset_downloader = asset_downloader
+            page.image_cache = image_cache
+            if page.import_assets():
+                page.save()
+        except Exception as e:
+            logger.exception("Import of story %s failed", self.source_url)
+            return self.fail(str(e))
+
+        self.status = self.STATUS_COMPLETED
+        self.progress = 100
+        self.progress_message = _("Story '%s' imported.") % page.title
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'progress', 'progress_message', 'finished_at'])
+
+    def get_status_data(self):
+        """Return the current state of the job as JSON-serialisable data"""
+        return {
+            'id': self.pk,
+            'source_url': self.source_url,
+            'status': self.status,
+            'progress': self.progress,
+            'progress_message': self.progress_message,
+            'errors': self.errors,
+            'page_id': self.page_id,
+        }
+
+
+class MediaFileHash(models.Model):
+    """
+    Records the SHA-1 hash of the file content for media items imported from stories, so that
+    repeated imports of the same video can reuse the existing item. wagtailmedia is an optional
+    dependency, so this refers to the media item by ID rather than a foreign key.
+    """
+    media_id = models.PositiveIntegerField(unique=True)
+    file_hash = models.CharField(max_length=40, db_index=True)
+
+    @classmethod
+    def get_media_for_hash(cls, file_hash):
+        """Return the earliest imported media item with the given file hash, or None"""
+        from wagtailmedia.models import get_media_model
+        Media = get_media_model()
+        media_ids = cls.objects.filter(file_hash=file_hash).values('media_id')
+        return Media.objects.filter(pk__in=media_ids).order_by('pk').first()
+
+
+class ExternalStoryFetchFailure(models.Model):
+    """
+    Records a failed attempt to fetch an external story, so that further attempts can be skipped
+    until `retry_after`. The wait doubles with each consecutive failure, as configured by the
+    WAGTAIL_WEBSTORIES_FETCH_BACKOFF setting. The record is deleted when a fetch succeeds.
+    """
+    url = models.TextField()
+    # a SHA-1 hash of the URL
+    url_hash = models.CharField(max_length=40, editable=False, unique=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    error_class = models.CharField(max_length=255)
+    error_message = models.TextField(blank=True)
+    failure_count = models.PositiveIntegerField(default=1)
+    first_failed_at = models.DateTimeField()
+    last_failed_at = models.DateTimeField()
+    retry_after = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ['-last_failed_at']
+
+    @staticmethod
+    def get_backoff_config():
+        """
+        Return the settings for fetch backoff, as defined by the WAGTAIL_WEBSTORIES_FETCH_BACKOFF
+        setting merged over DEFAULT_FETCH_BACKOFF_SETTINGS
+        """
+        return {
+            **DEFAULT_FETCH_BACKOFF_SETTINGS,
+            **getattr(settings, 'WAGTAIL_WEBSTORIES_FETCH_BACKOFF', {}),
+        }
+
+    @classmethod
+    def record(cls, url, error, status_code=None):
+        """Record a failed fetch of the given URL, and return the ExternalStoryFetchFailure"""
+        now = timezone.now()
+        failure, created = cls.objects.get_or_create(
+            url_hash=ExternalStory.get_url_hash(url),
+            defaults={'url': url, 'first_failed_at': now, 'last_failed_at': now, 'retry_after': now},
+        )
+        if not created:
+            failure.failure_count += 1
+
+        config = cls.get_backoff_config()
+        backoff = min(config['BASE'] * 2 ** (failure.failure_count - 1), config['MAX'])
+        failure.status_code = status_code
+        failure.error_class = type(error).__name__
+        failure.error_message = str(error)
+        failure.last_failed_at = now
+        failure.retry_after = now + timedelta(seconds=backoff)
+        failure.save()
+        return failure
+
+    @classmethod
+    def get_active(cls, url_hash):
+        """
+        Return the ExternalStoryFetchFailure for the given URL hash if fetches of that URL are
+        currently being skipped, or None otherwise
+        """
+        return cls.objects.filter(url_hash=url_hash, retry_after__gt=timezone.now()).first()
+
+    @property
+    def is_active(self):
+        return self.retry_after > timezone.now()
+
+    def __str__(self):
+        return self.url
+
+
+class FetchFailedRecently(requests.exceptions.RequestException):
+    """
+    Raised in place of fetching an external story that failed to fetch recently, until the
+    failure's retry_after time
+    """
+    def __init__(self, failure):
+        self.failure = failure
+        super().__init__("Fetching %s failed recently; not retrying until %s" % (failure.url, failure.retry_after))
+
+
 class ExternalStory(models.Model):
     url = models.TextField()
     # a SHA-1 hash of the URL
@@ -449,25 +1220,278 @@ class ExternalStory(models.Model):
     poster_square_src = models.TextField('Poster square image URL', blank=True, editable=False)
     poster_landscape_src = models.TextField('Poster landscape image URL', blank=True, editable=False)
     last_fetched_at = models.DateTimeField()
+    # validators from the most recent response, for use in conditional requests
+    etag = models.TextField(blank=True, editable=False)
+    last_modified = models.TextField(blank=True, editable=False)
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def get_url_hash(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
 
     @classmethod
     def get_for_url(cls, url):
-        url_hash = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        with measure('external_story_lookup', url=url, cache_hit=True) as measurement:
+            url_hash = cls.get_url_hash(url)
+            try:
+                return cls.objects.get(url_hash=url_hash)
+            except cls.DoesNotExist:
+                measurement.set('cache_hit', False)
+                return cls.fetch_single_flight(url)
+
+    @classmethod
+    def fetch_single_flight(cls, url):
+        """
+        Fetch the story at the given URL, as for `fetch`, unless another thread or process is
+        already fetching it - in which case, wait up to WAGTAIL_WEBSTORIES_FETCH_LOCK['WAIT']
+        seconds for that fetch to complete and return the resulting ExternalStory. If the other
+        fetch fails or does not complete in time, the story is fetched here instead.
+        """
+        config = get_fetch_lock_config()
+        url_hash = cls.get_url_hash(url)
+        deadline = time.monotonic() + config['WAIT']
+
+        while True:
+            story, token = cls.claim_fetch(url_hash)
+            if story is not None:
+                return story
+            if token is not None:
+                try:
+                    return cls.fetch(url)
+                finally:
+                    release_fetch_lock(url_hash, token)
+
+            if time.monotonic() >= deadline:
+                cls.log_wait_timeout(url)
+                return cls.fetch(url)
+            time.sleep(config['POLL_INTERVAL'])
+
+    @classmethod
+    def claim_fetch(cls, url_hash):
+        """
+        One step of a single-flight fetch: try to take the fetch lock for the URL hash, and return
+        a (story, token) pair. If the story has already been fetched, `story` is the ExternalStory
+        and `token` is None. Otherwise, `token` is the lock token if we now hold the lock (in which
+        case the caller must fetch the story and then release the lock), or None if another worker
+        holds it.
+        """
+        token = acquire_fetch_lock(url_hash)
+        # another worker may have completed its fetch since our last check
+        story = cls.objects.filter(url_hash=url_hash).first()
+        if story is not None and token is not None:
+            release_fetch_lock(url_hash, token)
+            token = None
+        return story, token
+
+    @staticmethod
+    def log_wait_timeout(url):
+        logger.warning("Timed out waiting for another fetch of external story %s", url)
+
+    @classmethod
+    def fetch(cls, url, headers=None):
+        """
+        Fetch the story at the given URL, and create or update the ExternalStory record for it.
+        Returns None if the response is a 304 Not Modified. Failures are recorded as an
+        ExternalStoryFetchFailure, and while one is active, FetchFailedRecently is raised
+        without making a request.
+        """
+        cls.check_fetch_allowed(url)
+
+        config = get_metadata_fetch_settings()
+        response = None
         try:
-            return cls.objects.get(url_hash=url_hash)
-        except cls.DoesNotExist:
-            html = requests.get(url).text
-            story = Story(html)
-            result, created = cls.objects.update_or_create(
-                url_hash=url_hash, defaults={
-                    'url': url,
-                    'title': story.title,
-                    'publisher': story.publisher,
-                    'publisher_logo_src': urljoin(url, story.publisher_logo_src) if story.publisher_logo_src else '',
-                    'poster_portrait_src': urljoin(url, story.poster_portrait_src) if story.poster_portrait_src else '',
-                    'poster_square_src': urljoin(url, story.poster_square_src) if story.poster_square_src else '',
-                    'poster_landscape_src': urljoin(url, story.poster_landscape_src) if story.poster_landscape_src else '',
-                    'last_fetched_at': timezone.now(),
-                }
+            with measure('external_story_fetch', url=url) as measurement:
+                response = requests.get(
+                    url, headers=headers, stream=True,
+                    timeout=(config['CONNECT_TIMEOUT'], config['READ_TIMEOUT']),
+                )
+                with response:
+                    measurement.set('status', response.status_code)
+                    story = None
+                    if response.status_code != 304:
+                        # record error responses as HTTP errors, rather than parsing the error page
+                        response.raise_for_status()
+                        # only read as far as the <amp-story> tag, which holds all the metadata we need
+                        story, bytes_read = read_story_metadata(response, config['MAX_BYTES'])
+                        measurement.set('bytes', bytes_read)
+        except (requests.exceptions.RequestException, Story.InvalidStoryException) as e:
+            cls.handle_fetch_error(url, e, response)
+            raise
+
+        return cls.handle_fetch_response(url, response.status_code, response.headers, story)
+
+    @classmethod
+    def check_fetch_allowed(cls, url):
+        """
+        Raise FetchFailedRecently if fetches of the given URL are being skipped following a
+        recent failure
+        """
+        failure = ExternalStoryFetchFailure.get_active(cls.get_url_hash(url))
+        if failure is not None:
+            raise FetchFailedRecently(failure)
+
+    @staticmethod
+    def handle_fetch_error(url, error, response=None):
+        """
+        Record an error raised while fetching the given URL. `response` is the response received,
+        if any; otherwise the status code is taken from the error's response, if it has one.
+        """
+        if response is None:
+            response = getattr(error, 'response', None)
+        ExternalStoryFetchFailure.record(
+            url, error, status_code=response.status_code if response is not None else None
+        )
+
+    @classmethod
+    def handle_fetch_response(cls, url, status_code, headers, story):
+        """
+        Handle a successful fetch of the given URL, where `story` is the webstories.Story or
+        StoryMetadata read from the response. Returns the updated ExternalStory, or None for a
+        304 Not Modified response.
+        """
+        if status_code == 304:
+            ExternalStoryFetchFailure.objects.filter(url_hash=cls.get_url_hash(url)).delete()
+            return None
+
+        return cls.store_metadata(
+            url, story, etag=headers.get('ETag', ''), last_modified=headers.get('Last-Modified', ''),
+        )
+
+    @classmethod
+    def store_metadata(cls, url, story, etag='', last_modified=''):
+        """
+        Create or update the ExternalStory record for the given URL from a successfully fetched
+        webstories.Story or StoryMetadata, clearing any recorded fetch failure
+        """
+        url_hash = cls.get_url_hash(url)
+        ExternalStoryFetchFailure.objects.filter(url_hash=url_hash).delete()
+        result, created = cls.objects.update_or_create(
+            url_hash=url_hash, defaults={
+                'url': url,
+                'title': story.title,
+                'publisher': story.publisher,
+                'publisher_logo_src': urljoin(url, story.publisher_logo_src) if story.publisher_logo_src else '',
+                'poster_portrait_src': urljoin(url, story.poster_portrait_src) if story.poster_portrait_src else '',
+                'poster_square_src': urljoin(url, story.poster_square_src) if story.poster_square_src else '',
+                'poster_landscape_src': urljoin(url, story.poster_landscape_src) if story.poster_landscape_src else '',
+                'last_fetched_at': timezone.now(),
+                'etag': etag,
+                'last_modified': last_modified,
+            }
+        )
+        return result
+
+    def refresh(self):
+        """
+        Re-fetch the story's metadata. The request is made conditional on the ETag and Last-Modified
+        headers of the previous response, so that an unchanged story is not downloaded again.
+        """
+        result = self.fetch(self.url, headers=self.conditional_headers())
+        if result is None:
+            self.mark_unchanged()
+        else:
+            self.refresh_from_db()
+
+    def conditional_headers(self):
+        """
+        Return the headers for a request conditional on the validators of the previous response
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def mark_unchanged(self):
+        """Record that a refresh of the story found it unchanged"""
+        self.last_fetched_at = timezone.now()
+        self.save(update_fields=['last_fetched_at'])
+
+    @property
+    def is_stale(self):
+        """
+        True if the story was last fetched longer ago than WAGTAIL_WEBSTORIES_EXTERNAL_STORY_TTL
+        (in seconds). If the setting is not defined, stories are never considered stale.
+        """
+        ttl = getattr(settings, 'WAGTAIL_WEBSTORIES_EXTERNAL_STORY_TTL', None)
+        if ttl is None:
+            return False
+        return self.last_fetched_at < timezone.now() - timedelta(seconds=ttl)
+
+
+class LazyExternalStory:
+    """
+    Stand-in for an ExternalStory, as returned by ExternalStoryBlock.to_python. The story is looked
+    up from the database on first access (along with the rest of its batch, if created through
+    bulk_to_python) without making any HTTP requests; if it has not been fetched yet, a fetch is
+    queued to run in the background and is_ready is False.
+    """
+    def __init__(self, url, batch=None):
+        self.url = url
+        self._story = None
+        self._is_resolved = False
+        # the list of LazyExternalStory instances to be looked up together with this one
+        self._batch = [self] if batch is None else batch
+
+    @classmethod
+    def resolve_many(cls, lazy_stories):
+        """
+        Look up the stories for a list of LazyExternalStory instances in a single query, and queue
+        the fetching of any that have not been fetched yet or are due to be refreshed
+        """
+        from .tasks import queue_external_story_fetches
+
+        unresolved = [
+            lazy_story for lazy_story in lazy_stories
+            if lazy_story is not None and not lazy_story._is_resolved
+        ]
+        if not unresolved:
+            return
+
+        with measure('external_story_lookup_many', stories=len(unresolved)) as measurement:
+            stories_by_hash = ExternalStory.objects.in_bulk(
+                {ExternalStory.get_url_hash(lazy_story.url) for lazy_story in unresolved},
+                field_name='url_hash'
             )
-            return result
+            urls_to_fetch = []
+            for lazy_story in unresolved:
+                lazy_story._story = stories_by_hash.get(ExternalStory.get_url_hash(lazy_story.url))
+                lazy_story._is_resolved = True
+                # Stale stories continue to be served as they are, while being refreshed in the background
+                if lazy_story._story is None or lazy_story._story.is_stale:
+                    urls_to_fetch.append(lazy_story.url)
+
+            measurement.set('cache_hits', len(unresolved) - len(urls_to_fetch))
+            measurement.set('cache_misses', len(urls_to_fetch))
+            queue_external_story_fetches(urls_to_fetch)
+
+    @property
+    def story(self):
+        """The ExternalStory instance for this URL, or None if it has not been fetched yet"""
+        if not self._is_resolved:
+            self.resolve_many(self._batch)
+        return self._story
+
+    @property
+    def is_ready(self):
+        return self.story is not None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        story = self.story
+        if story is not None:
+            return getattr(story, name)
+        elif name in (
+            'title', 'publisher', 'publisher_logo_src',
+            'poster_portrait_src', 'poster_square_src', 'poster_landscape_src',
+        ):
+            # metadata fields are blank until the story has been fetched
+            return ''
+        else:
+            raise AttributeError(name)
+
+    def __repr__(self):
+        return '<LazyExternalStory: %s>' % self.url
@@ -0,0 +1,73 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_init, post_save
+from wagtail.images import get_image_model
+
+from .cache import bump_asset_version
+
+
+def invalidate_image(sender, instance, **kwargs):
+    bump_asset_version('image', instance.pk)
+
+
+def invalidate_rendition(sender, instance, **kwargs):
+    bump_asset_version('image', instance.image_id)
+
+
+def discard_image_rendition_urls(sender, instance, created, **kwargs):
+    # a replaced file or a changed focal point leaves the image's stored rendition URLs pointing
+    # at renditions that have been deleted. A new image is not used by any story yet.
+    if not created:
+        from .models import clear_stored_rendition_urls
+        clear_stored_rendition_urls(instance.pk)
+
+
+def discard_rendition_urls(sender, instance, **kwargs):
+    from .models import clear_stored_rendition_urls
+    clear_stored_rendition_urls(instance.image_id)
+
+
+def invalidate_media(sender, instance, **kwargs):
+    bump_asset_version('media', instance.pk)
+
+
+def record_media_file_name(sender, instance, **kwargs):
+    # remember the file the media item was loaded with, so that a change of file can be detected
+    instance._webstories_original_file_name = instance.file.name
+
+
+def discard_media_file_hash(sender, instance, **kwargs):
+    # the recorded hash no longer applies once the media item is deleted
+    from .models import MediaFileHash
+    MediaFileHash.objects.filter(media_id=instance.pk).delete()
+
+
+def discard_media_file_hash_on_file_change(sender, instance, created, **kwargs):
+    # the recorded hash no longer applies once the media item's file is replaced. Edits that leave
+    # the file alone (such as to the title or collection) keep it, as does the initial save of a
+    # newly imported item, whose hash is recorded after it is saved.
+    original_file_name = getattr(instance, '_webstories_original_file_name', None)
+    instance._webstories_original_file_name = instance.file.name
+    if not created and instance.file.name != original_file_name:
+        discard_media_file_hash(sender, instance)
+
+
+def register_signal_handlers():
+    Image = get_image_model()
+    Rendition = Image.get_rendition_model()
+
+    post_save.connect(invalidate_image, sender=Image)
+    post_delete.connect(invalidate_image, sender=Image)
+    post_save.connect(invalidate_rendition, sender=Rendition)
+    post_delete.connect(invalidate_rendition, sender=Rendition)
+    post_save.connect(discard_image_rendition_urls, sender=Image)
+    post_delete.connect(discard_rendition_urls, sender=Rendition)
+
+    if apps.is_installed('wagtailmedia'):
+        from wagtailmedia.models import get_media_model
+        Media = get_media_model()
+
+        post_save.connect(invalidate_media, sender=Media)
+        post_delete.connect(invalidate_media, sender=Media)
+        post_init.connect(record_media_file_name, sender=Media)
+        post_save.connect(discard_media_file_hash_on_file_change, sender=Media)
+        post_delete.connect(discard_media_file_hash, sender=Media)
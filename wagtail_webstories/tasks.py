@@ -0,0 +1,138 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+from webstories import Story
+
+from .cache import fetch_lock
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_FETCH_WORKERS = 2
+
+_executor = None
+_queued_urls = set()
+_lock = threading.Lock()
+
+
+def fetch_external_story(url):
+    """
+    Fetch the story at the given URL and store its metadata as an ExternalStory, or refresh the
+    existing ExternalStory if there is one. Errors are logged rather than raised, as this is
+    intended to run outside of the request that asked for it.
+    """
+    from .models import ExternalStory
+
+    url_hash = ExternalStory.get_url_hash(url)
+    with fetch_lock(url_hash) as acquired:
+        if not acquired:
+            # another thread or process is already fetching this story
+            return True
+
+        try:
+            story = ExternalStory.objects.filter(url_hash=url_hash).first()
+            if story is None:
+                ExternalStory.fetch(url)
+            else:
+                story.refresh()
+        except (requests.exceptions.RequestException, Story.InvalidStoryException) as e:
+            log_fetch_error(url, e)
+            return False
+        else:
+            return True
+
+
+def log_fetch_error(url, error):
+    """Log an error raised by a background fetch of the story at the given URL"""
+    from .models import FetchFailedRecently
+
+    if isinstance(error, FetchFailedRecently):
+        logger.debug("Skipping fetch of external story %s, which failed recently", url)
+    else:
+        logger.warning("Could not fetch external story %s", url, exc_info=error)
+
+
+def fetch_external_stories(urls, max_workers=1, max_per_host=2):
+    """
+    Fetch or refresh the stories at the given URLs. If max_workers is greater than 1, the fetches
+    run concurrently on a thread pool, with at most max_per_host requests to any one host at a time.
+    Returns a list of booleans indicating whether each fetch succeeded.
+    """
+    urls = list(urls)
+    if max_workers <= 1:
+        return [fetch_external_story(url) for url in urls]
+
+    host_semaphores = {
+        urlparse(url).netloc: threading.BoundedSemaphore(max_per_host)
+        for url in urls
+    }
+
+    def fetch_with_host_limit(url):
+        try:
+            with host_semaphores[urlparse(url).netloc]:
+                return fetch_external_story(url)
+        finally:
+            # close the database connections belonging to this worker thread
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='wagtail_webstories') as executor:
+        return list(executor.map(fetch_with_host_limit, urls))
+
+
+def fetch_immediately(urls):
+    """
+    External story fetcher that fetches the stories within the current thread. Useful for testing,
+    or for running under a task queue that already runs outside of the request cycle.
+    """
+    fetch_external_stories(urls)
+
+
+def _fetch_and_release(url):
+    try:
+        fetch_external_story(url)
+    finally:
+        with _lock:
+            _queued_urls.discard(url)
+        # close the database connections belonging to this worker thread
+        connections.close_all()
+
+
+def fetch_in_thread(urls):
+    """
+    External story fetcher that fetches the stories concurrently on a background thread pool within
+    the current process. URLs that are already queued will not be queued again.
+    """
+    global _executor
+
+    with _lock:
+        new_urls = [url for url in dict.fromkeys(urls) if url not in _queued_urls]
+        _queued_urls.update(new_urls)
+
+        if new_urls and _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=BACKGROUND_FETCH_WORKERS, thread_name_prefix='wagtail_webstories'
+            )
+
+    for url in new_urls:
+        _executor.submit(_fetch_and_release, url)
+
+
+def queue_external_story_fetches(urls):
+    """
+    Arrange for the stories at the given URLs to be fetched outside of the current request, using
+    the callable specified by the WAGTAIL_WEBSTORIES_EXTERNAL_STORY_FETCHER setting
+    """
+    urls = list(urls)
+    if not urls:
+        return
+
+    fetcher = import_string(getattr(
+        settings, 'WAGTAIL_WEBSTORIES_EXTERNAL_STORY_FETCHER', 'wagtail_webstories.tasks.fetch_in_thread'
+    ))
+    fetcher(urls)
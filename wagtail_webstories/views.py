@@ -1,83 +1,56 @@
 import requests
 
-from urllib.parse import urljoin
-
-from django.apps import apps
 from django.conf import settings
+from django.http import Http404, JsonResponse
 from django.template.response import TemplateResponse
-from django.shortcuts import redirect
+from django.shortcuts import get_object_or_404, redirect
 from django.utils.translation import gettext as _
 from wagtail.admin import messages
+from wagtail.admin.auth import permission_denied, permission_required
 
 from webstories import Story
 
-from .forms import ImportStoryForm
-from .markup import AMPText
+from .forms import BulkImportStoryForm, ImportStoryForm
+from .importing import (
+    StoryBatchImporter, build_story_page, fetch_story, get_synchronous_bulk_import_limit
+)
+from .instrumentation import measure
+from .models import ExternalStoryFetchFailure, StoryImportJob
+from .tasks import queue_external_story_fetches
+
 
 def import_story(request):
     if request.method == 'POST':
         form = ImportStoryForm(request.POST, user=request.user)
         if form.is_valid():
             source_url = form.cleaned_data['source_url']
-            try:
-                req = requests.get(source_url)
-                req.encoding = 'utf-8'
-                html = req.text
-                story = Story(html)
-                story_is_valid = True
-            except requests.exceptions.RequestException:
-                form.add_error('source_url', _("Could not fetch URL."))
-                story_is_valid = False
-            except Story.InvalidStoryException:
-                form.add_error('source_url', _("URL is not a valid web story."))
-                story_is_valid = False
+            parent_page = form.cleaned_data['destination']
 
-            if story_is_valid:
-                page_model = apps.get_model(settings.WAGTAIL_WEBSTORIES_IMPORT_MODEL)
-
-                if story.publisher_logo_src:
-                    publisher_logo_src = urljoin(source_url, story.publisher_logo_src)
-                else:
-                    publisher_logo_src = ''
-
-                if story.poster_portrait_src:
-                    poster_portrait_src = urljoin(source_url, story.poster_portrait_src)
-                else:
-                    poster_portrait_src = ''
-
-                if story.poster_square_src:
-                    poster_square_src = urljoin(source_url, story.poster_square_src)
-                else:
-                    poster_square_src = ''
-
-                if story.poster_landscape_src:
-                    poster_landscape_src = urljoin(source_url, story.poster_landscape_src)
-                else:
-                    poster_landscape_src = ''
-
-                page = page_model(
-                    title=story.title,
-                    publisher=story.publisher or '',
-                    publisher_logo_src_original=publisher_logo_src,
-                    poster_portrait_src_original=poster_portrait_src,
-                    poster_square_src_original=poster_square_src,
-                    poster_landscape_src_original=poster_landscape_src,
-                    custom_css=story.custom_css or '',
-                    original_url=source_url,
+            if getattr(settings, 'WAGTAIL_WEBSTORIES_IMPORT_JOBS', False):
+                # leave the import to be performed by the run_story_import_jobs worker
+                job = StoryImportJob.objects.create(
+                    source_url=source_url, destination=parent_page, user=request.user
                 )
-                if getattr(settings, 'WAGTAIL_WEBSTORIES_CLEAN_HTML', True):
-                    page.pages = [
-                        ('page', {'id': subpage.id, 'html': AMPText(subpage.get_clean_html())})
-                        for subpage in story.pages
-                    ]
-                else:
-                    page.pages = [
-                        ('page', {'id': subpage.id, 'html': AMPText(subpage.html)})
-                        for subpage in story.pages
-                    ]
-
-                parent_page = form.cleaned_data['destination']
-                parent_page.add_child(instance=page)
+                return redirect('wagtail_webstories:import_job', job.id)
+
+            with measure('import_story', source_url=source_url) as measurement:
+                try:
+                    story = fetch_story(source_url)
+                    story_is_valid = True
+                except requests.exceptions.RequestException:
+                    form.add_error('source_url', _("Could not fetch URL."))
+                    story_is_valid = False
+                except Story.InvalidStoryException:
+                    form.add_error('source_url', _("URL is not a valid web story."))
+                    story_is_valid = False
+
+                measurement.set('valid', story_is_valid)
+                if story_is_valid:
+                    page = build_story_page(story, source_url)
+                    parent_page.add_child(instance=page)
+                    measurement.set('page_id', page.pk)
+
+            if story_is_valid:
                 messages.success(request, _("Story '%s' imported.") % page.title)
                 return redirect('wagtailadmin_explore', parent_page.id)
     else:
@@ -86,3 +59,88 @@ def import_story(request):
     return TemplateResponse(request, 'wagtail_webstories/admin/import.html', {
         'form': form,
     })
+
+
+def bulk_import_stories(request):
+    results = None
+
+    if request.method == 'POST':
+        form = BulkImportStoryForm(request.POST, request.FILES, user=request.user)
+        if form.is_valid():
+            urls = form.cleaned_data['story_urls']
+            parent_page = form.cleaned_data['destination']
+
+            if getattr(settings, 'WAGTAIL_WEBSTORIES_IMPORT_JOBS', False):
+                StoryImportJob.objects.bulk_create([
+                    StoryImportJob(source_url=url, destination=parent_page, user=request.user)
+                    for url in urls
+                ])
+                messages.success(request, _("%d stories queued for import.") % len(urls))
+                return redirect('wagtailadmin_explore', parent_page.id)
+
+            limit = get_synchronous_bulk_import_limit()
+            if len(urls) > limit:
+                form.add_error(None, _(
+                    "Only %(limit)d stories can be imported at once (%(count)d given). Larger imports "
+                    "require background import jobs to be enabled."
+                ) % {'limit': limit, 'count': len(urls)})
+            else:
+                # downloading every image and video would outlast the request, so these are left
+                # at their original URLs
+                results = StoryBatchImporter(parent_page, import_assets=False).import_stories(urls)
+                failures = len([result for result in results if result['status'] == 'failed'])
+                messages.success(request, _("Imported %(imported)d stories (%(failed)d failed).") % {
+                    'imported': len(results) - failures, 'failed': failures,
+                })
+                messages.info(request, _(
+                    "Images and videos in the imported stories have been left at their original URLs. "
+                    "To import them, call import_assets() on the story pages, or enable background "
+                    "import jobs (WAGTAIL_WEBSTORIES_IMPORT_JOBS)."
+                ))
+                form = BulkImportStoryForm(user=request.user, initial={'destination': parent_page})
+    else:
+        form = BulkImportStoryForm(user=request.user)
+
+    return TemplateResponse(request, 'wagtail_webstories/admin/bulk_import.html', {
+        'form': form,
+        'results': results,
+    })
+
+
+def _get_job(request, job_id):
+    jobs = StoryImportJob.objects.all()
+    if not request.user.is_superuser:
+        jobs = jobs.filter(user=request.user)
+    return get_object_or_404(jobs, id=job_id)
+
+
+def import_job(request, job_id):
+    job = _get_job(request, job_id)
+    return TemplateResponse(request, 'wagtail_webstories/admin/import_job.html', {
+        'job': job,
+    })
+
+
+def import_job_status(request, job_id):
+    job = _get_job(request, job_id)
+    return JsonResponse(job.get_status_data())
+
+
+@permission_required('wagtail_webstories.view_externalstoryfetchfailure')
+def failing_external_stories(request):
+    if request.method == 'POST':
+        # retry the selected story now, rather than waiting for its retry_after time
+        if not request.user.has_perm('wagtail_webstories.delete_externalstoryfetchfailure'):
+            return permission_denied(request)
+        failure_id = request.POST.get('failure_id', '')
+        if not failure_id.isdigit():
+            raise Http404
+        failure = get_object_or_404(ExternalStoryFetchFailure, id=failure_id)
+        failure.delete()
+        queue_external_story_fetches([failure.url])
+        messages.success(request, _("Fetch of '%s' queued.") % failure.url)
+        return redirect('wagtail_webstories:failing_external_stories')
+
+    return TemplateResponse(request, 'wagtail_webstories/admin/failing_external_stories.html', {
+        'failures': ExternalStoryFetchFailure.objects.all(),
+    })
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.contrib.auth.models import Permission
 from django.urls import include, path, reverse
 
 from wagtail import hooks, VERSION as WAGTAIL_VERSION
@@ -6,20 +7,47 @@ from wagtail.admin.menu import MenuItem
 
 from . import admin_urls
 
-if getattr(settings, 'WAGTAIL_WEBSTORIES_IMPORT_MODEL', None):
 
-    @hooks.register('register_admin_urls')
-    def register_admin_urls():
-        return [
-            path('webstories/', include(admin_urls, namespace='wagtail_webstories')),
-        ]
+def _icon_kwargs(icon):
+    if WAGTAIL_VERSION >= (5, 2):
+        return {"classname": "icon icon-%s" % icon}
+    else:
+        return {"classnames": "icon icon-%s" % icon}
+
+
+@hooks.register('register_admin_urls')
+def register_admin_urls():
+    return [
+        path('webstories/', include(admin_urls, namespace='wagtail_webstories')),
+    ]
+
+
+class FailingExternalStoriesMenuItem(MenuItem):
+    def is_shown(self, request):
+        return request.user.has_perm('wagtail_webstories.view_externalstoryfetchfailure')
+
 
+@hooks.register('register_reports_menu_item')
+def register_failing_external_stories_item():
+    return FailingExternalStoriesMenuItem(
+        'Failing external stories', reverse('wagtail_webstories:failing_external_stories'),
+        order=10000, **_icon_kwargs('warning')
+    )
+
+
+@hooks.register('register_permissions')
+def register_failing_external_stories_permissions():
+    # allow the failing external stories report to be granted to groups in the Wagtail admin
+    return Permission.objects.filter(
+        content_type__app_label='wagtail_webstories',
+        codename__in=['view_externalstoryfetchfailure', 'delete_externalstoryfetchfailure'],
+    )
+
+
+if getattr(settings, 'WAGTAIL_WEBSTORIES_IMPORT_MODEL', None):
 
     @hooks.register('register_admin_menu_item')
     def register_webstories_item():
-        if WAGTAIL_VERSION >= (5, 2):
-            kwargs = {"classname": "icon icon-openquote"}
-        else:
-            kwargs = {"classnames": "icon icon-openquote"}
-
-        return MenuItem('Web stories', reverse('wagtail_webstories:import_story'), order=10000, **kwargs)
+        return MenuItem(
+            'Web stories', reverse('wagtail_webstories:import_story'), order=10000, **_icon_kwargs('openquote')
+        )